@@ -17,7 +17,7 @@ def createApp(configClass=None):
     db.init_app(app)
     migrate.init_app(app, db)
 
-    from app.models import chat, message
+    from app.models import chat, message, transcription, chatState
 
     with app.app_context():
         db.create_all()
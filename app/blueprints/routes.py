@@ -1,11 +1,26 @@
-import os
-from flask import render_template, request, jsonify, current_app
-import mimetypes
+import json
+from flask import render_template, request, jsonify, current_app, Response, stream_with_context
 from app.blueprints import bp
-from app.services.openaiServices import transcribeAudioUsingOpenAI, generateResponse
+from app.services.audioServices import read_audio_upload, audio_format, MIN_AUDIO_BYTES, NoSpeechDetected
+from app.services.audioPool import AudioPoolBusy, AudioJobTimeout
+from app.services.aiScheduler import AISchedulerBusy, ai_priority
+from app.services.circuitBreaker import CircuitOpen, upstream_available
+from app.services.deadlines import voice_deadline
+from app.services.uploadSessions import upload_sessions, UploadSessionNotFound, UploadSessionLimit
+from app.services.openaiServices import generateResponse, generateResponseStream
+from app.services.voicePipeline import prepare_voice_request, run_voice_pipeline
+from app.services.metrics import metrics
 from app.models.chat import Chat
 
 
+# Answer to recordings without speech; no transcription is requested for them
+NO_SPEECH_RESPONSE = {
+    "transcription": "",
+    "response": "I couldn't hear anything. Please try speaking again.",
+    "error": "No speech detected in the recording."
+}
+
+
 @bp.route('/')
 def index():
     """Render the main page of the application."""
@@ -26,72 +41,97 @@ def options_transcribe():
     return '', 204
 
 
-@bp.route('/transcribe', methods=['POST'])
-def transcribe():
-    """Endpoint to transcribe audio from the microphone."""
-    if 'audio' not in request.files:
-        return jsonify({"error": "No audio file provided"}), 400
-
-    # Get chat_id from form data if it exists
-    chatId = request.form.get('chatId')
-    if chatId:
+def _parse_chat_id(value):
+    """Chat ID from form data, or None if it is missing or not a number."""
+    if value:
         try:
-            chatId = int(chatId)
+            return int(value)
         except ValueError:
-            chatId = None
+            return None
+    return None
+
 
-    audioFile = request.files['audio']
+# Answers of voice requests that are turned away at once, telling the client when to retry
+BUSY_MESSAGE = "Системата е натоварена, опитайте отново след малко."
+UNAVAILABLE_MESSAGE = "Гласовите команди временно не са достъпни, опитайте отново след малко."
+
+
+def _busy_response(error, message=BUSY_MESSAGE):
+    """
+    503 for a request the audio workers or the AI scheduler have no room for (or whose audio job
+    timed out), or that cannot reach OpenAI (open circuit), telling the client when to retry.
+    """
+    response = jsonify({
+        "transcription": "",
+        "response": message,
+        "error": str(error)
+    })
+    response.status_code = 503
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
 
-    # Get file info
-    filename = audioFile.filename
-    contentType = audioFile.content_type
 
-    # Log file details for debugging
-    current_app.logger.info(f"Received audio file: {filename}, Content-Type: {contentType}")
+def _sse(event, data):
+    """Format one Server-Sent Event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
 
-    # Check if the file is in a supported format
-    ext = mimetypes.guess_extension(contentType) or '.webm'
-    if ext.startswith('.'):
-        ext = ext[1:]
 
-    # Save the audio file temporarily
-    tempFilename = os.path.join(current_app.config['UPLOAD_FOLDER'], f"temp_audio.{ext}")
-    audioFile.save(tempFilename)
+def _sse_response(events):
+    """Stream events to the browser as they are produced, without proxy buffering."""
+    response = Response(stream_with_context(events), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
-    # Log file size
-    fileSize = os.path.getsize(tempFilename)
-    current_app.logger.info(f"Saved audio file: {tempFilename}, Size: {fileSize} bytes")
+
+def _response_events(userMessage, chatId, history=None, deadline=None):
+    """SSE events of a streamed response; errors after the stream started become an 'error' event."""
+    try:
+        for event, data in generateResponseStream(userMessage, chatId, history=history, deadline=deadline):
+            yield _sse(event, data)
+    except Exception as e:
+        current_app.logger.error(f"Error streaming chat response: {str(e)}")
+        yield _sse('error', {"error": str(e)})
+
+
+@bp.route('/transcribe', methods=['POST'])
+def transcribe():
+    """Endpoint to transcribe audio from the microphone."""
+    if 'audio' not in request.files:
+        return jsonify({"error": "No audio file provided"}), 400
+
+    # Get chat_id from form data if it exists
+    chatId = _parse_chat_id(request.form.get('chatId'))
+
+    # The recording stays in memory for the whole request
+    audioData, audioFormat, fileInfo = read_audio_upload(request.files['audio'])
+    current_app.logger.info(f"Received audio file: {fileInfo}")
 
     try:
         # Check if the file is empty or too small
-        if fileSize < 100:  # Arbitrary minimum size, adjust as needed
+        if fileInfo['size_bytes'] < MIN_AUDIO_BYTES:
             return jsonify({
                 "transcription": "",
-                "response": "I couldn't hear anything. Please try speaking again.",
+                "response": NO_SPEECH_RESPONSE['response'],
                 "error": "Audio file is too small or empty."
             })
 
-        transcription = transcribeAudioUsingOpenAI(tempFilename)
-
-        # Only generate a response if there's text to respond to
-        responseText = ""
-        newChatId = None
-
-        if transcription and transcription.strip():
-            # Generate response
-            responseText, newChatId = generateResponse(transcription, chatId)
-        else:
-            responseText = "Не разбирам това което казваш. Моля повтори съобщението."
+        # Transcribe and answer within the voice latency budget; the chat lookup runs next to the transcription
+        try:
+            result = run_voice_pipeline(audioData, audioFormat, chatId, voice_deadline())
+        except NoSpeechDetected:
+            return jsonify(NO_SPEECH_RESPONSE)
+        except (AudioPoolBusy, AudioJobTimeout, AISchedulerBusy) as e:
+            return _busy_response(e)
+        except CircuitOpen as e:
+            return _busy_response(e, UNAVAILABLE_MESSAGE)
 
         return jsonify({
-            "transcription": transcription,
-            "response": responseText,
-            "chatId": newChatId,
-            "file_info": {
-                "filename": filename,
-                "content_type": contentType,
-                "size_bytes": fileSize
-            }
+            "transcription": result['transcription'],
+            "response": result['response'],
+            "chatId": result['chatId'],
+            "file_info": fileInfo,
+            "timings": result['timings']
         })
     except Exception as e:
         current_app.logger.error(f"Error processing audio file: {str(e)}")
@@ -100,10 +140,158 @@ def transcribe():
             "response": "Sorry, there was an error processing your audio. Please try again.",
             "error": str(e)
         }), 500
-    finally:
-        # Clean up the temp file if it exists
-        if os.path.exists(tempFilename):
-            os.remove(tempFilename)
+
+
+@bp.route('/transcribe/stream', methods=['OPTIONS'])
+def options_transcribe_stream():
+    return '', 204
+
+
+@bp.route('/transcribe/stream', methods=['POST'])
+def transcribe_stream():
+    """
+    Transcribe audio like /transcribe, then stream the response as Server-Sent Events.
+
+    Events: 'transcription', then 'chat', 'token'... and 'done' (or 'error').
+    """
+    if 'audio' not in request.files:
+        return jsonify({"error": "No audio file provided"}), 400
+
+    chatId = _parse_chat_id(request.form.get('chatId'))
+    audioData, audioFormat, fileInfo = read_audio_upload(request.files['audio'])
+    current_app.logger.info(f"Received audio file: {fileInfo}")
+
+    return _transcription_stream(audioData, audioFormat, fileInfo, chatId)
+
+
+def _transcription_stream(audioData, audioFormat, fileInfo, chatId):
+    """Transcribe a recording held in memory and stream the response (see transcribe_stream)."""
+    # The latency budget starts when the whole recording is here
+    deadline = voice_deadline()
+    # Too small files are treated as silence, with the same answer as a recording without speech
+    if fileInfo['size_bytes'] < MIN_AUDIO_BYTES:
+        return jsonify(NO_SPEECH_RESPONSE)
+
+    try:
+        prepared = prepare_voice_request(audioData, audioFormat, chatId, deadline)
+    except NoSpeechDetected:
+        return jsonify(NO_SPEECH_RESPONSE)
+    except (AudioPoolBusy, AudioJobTimeout, AISchedulerBusy) as e:
+        return _busy_response(e)
+    except CircuitOpen as e:
+        return _busy_response(e, UNAVAILABLE_MESSAGE)
+    except Exception as e:
+        current_app.logger.error(f"Error processing audio file: {str(e)}")
+        return jsonify({
+            "transcription": "",
+            "response": "Sorry, there was an error processing your audio. Please try again.",
+            "error": str(e)
+        }), 500
+
+    transcription = prepared['transcription']
+
+    def events():
+        yield _sse('transcription', {"transcription": transcription or "", "file_info": fileInfo,
+                                     "timings": prepared['timings']})
+
+        if transcription and transcription.strip():
+            # Answers to voice commands go ahead of typed chat
+            with ai_priority('voice'):
+                yield from _response_events(transcription, prepared['chatId'], prepared['history'], deadline)
+            if deadline is not None:
+                current_app.logger.info(f"Voice stream budget: {deadline.summary()}")
+        else:
+            yield _sse('done', {"response": "Не разбирам това което казваш. Моля повтори съобщението.",
+                                "chatId": None})
+
+    return _sse_response(events())
+
+
+@bp.route('/transcribe/session', methods=['OPTIONS'])
+def options_transcribe_session():
+    return '', 204
+
+
+@bp.route('/transcribe/session', methods=['POST'])
+def start_upload_session():
+    """
+    Open an upload session for a recording that is starting.
+
+    The browser then posts the recorder's chunks to /transcribe/session/<id>/chunk while the
+    user speaks and calls /transcribe/session/<id>/finish when the recording stops, so only
+    the last chunk is uploaded after the user is done.
+    """
+    data = request.get_json(silent=True) or {}
+    contentType = data.get('contentType')
+
+    try:
+        session = upload_sessions.create(audio_format(contentType), _parse_chat_id(data.get('chatId')), contentType)
+    except UploadSessionLimit as e:
+        return jsonify({"error": str(e)}), 503
+
+    return jsonify({"sessionId": session.id}), 201
+
+
+@bp.route('/transcribe/session/<sessionId>/chunk', methods=['OPTIONS'])
+def options_upload_chunk(sessionId):
+    return '', 204
+
+
+@bp.route('/transcribe/session/<sessionId>/chunk', methods=['POST'])
+def upload_chunk(sessionId):
+    """Append one chunk (raw request body) at position `index` (query parameter) of a session's recording."""
+    index = request.args.get('index', type=int)
+    if index is None or index < 0:
+        return jsonify({"error": "Missing or invalid chunk index"}), 400
+
+    try:
+        received = upload_sessions.append(sessionId, index, request.get_data())
+    except UploadSessionNotFound as e:
+        return jsonify({"error": str(e)}), 404
+    except UploadSessionLimit as e:
+        return jsonify({"error": str(e)}), 413
+
+    return jsonify({"received": received})
+
+
+@bp.route('/transcribe/session/<sessionId>/finish', methods=['OPTIONS'])
+def options_finish_upload(sessionId):
+    return '', 204
+
+
+@bp.route('/transcribe/session/<sessionId>/finish', methods=['POST'])
+def finish_upload(sessionId):
+    """
+    Close a session and transcribe its recording, streaming the response like /transcribe/stream.
+
+    A non-empty body is taken as the final chunk, at position `index` (query parameter).
+    """
+    finalChunk = request.get_data()
+    try:
+        if finalChunk:
+            index = request.args.get('index', type=int)
+            if index is None or index < 0:
+                return jsonify({"error": "Missing or invalid chunk index"}), 400
+            upload_sessions.append(sessionId, index, finalChunk)
+
+        session = upload_sessions.finish(sessionId)
+        audioData = session.audio_data()
+    except UploadSessionNotFound as e:
+        return jsonify({"error": str(e)}), 404
+    except UploadSessionLimit as e:
+        return jsonify({"error": str(e)}), 413
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    fileInfo = {
+        "filename": None,
+        "content_type": session.contentType,
+        "size_bytes": len(audioData),
+        "chunks": len(session.chunks)
+    }
+    current_app.logger.info(f"Received audio in upload session {sessionId}: {fileInfo}")
+
+    return _transcription_stream(audioData, session.audioFormat, fileInfo, session.chatId)
 
 
 @bp.route('/chat', methods=['OPTIONS'])
@@ -129,11 +317,34 @@ def chat():
             "response": responseText,
             "chatId": newChatId
         })
+    except AISchedulerBusy as e:
+        return _busy_response(e)
     except Exception as e:
         current_app.logger.error(f"Error generating chat response: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
 
+@bp.route('/chat/stream', methods=['OPTIONS'])
+def options_chat_stream():
+    return '', 204
+
+
+@bp.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    """
+    Chat like /chat, streaming the response as Server-Sent Events.
+
+    Events: 'chat' (chat ID), 'token' (text pieces as the model produces them),
+    'done' (the full response, stored in the chat) or 'error'.
+    """
+    data = request.get_json()
+
+    if not data or 'message' not in data:
+        return jsonify({"error": "No message provided"}), 400
+
+    return _sse_response(_response_events(data['message'], data.get('chatId')))
+
+
 @bp.route('/chats', methods=['GET'])
 def get_chats():
     """Get a list of all chats."""
@@ -155,3 +366,11 @@ def get_chat(chatId):
     """Get details of a specific chat."""
     chat = Chat.query.get_or_404(chatId)
     return jsonify(chat.to_dict())
+
+
+@bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Get the in-process counters, gauges and latency histograms."""
+    # Brings the circuit_state gauge up to date with a circuit whose open period has passed
+    upstream_available()
+    return jsonify(metrics.snapshot())
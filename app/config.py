@@ -1,5 +1,6 @@
 import os
 from dotenv import load_dotenv
+from flask import current_app, has_app_context
 
 load_dotenv()
 # Retrieve environment variables
@@ -23,6 +24,117 @@ class Config:
     UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'uploads')
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16 MB max upload size
 
+    # Planning queries in a pool of worker processes (0 workers = run in the request thread)
+    PLANNING_POOL_WORKERS = int(os.environ.get('PLANNING_POOL_WORKERS', 0))
+    PLANNING_POOL_MAX_PENDING = int(os.environ.get('PLANNING_POOL_MAX_PENDING', 8))
+    PLANNING_QUERY_TIMEOUT = float(os.environ.get('PLANNING_QUERY_TIMEOUT', 15))
+
+    # Estimated tokens of Excel data (summaries + retrieved rows) sent with an LLM query
+    LLM_CONTEXT_TOKEN_BUDGET = int(os.environ.get('LLM_CONTEXT_TOKEN_BUDGET', 3000))
+
+    # Let the fallback LLM call planning tools (precomputed aggregates) instead of answering without data
+    LLM_TOOLS_ENABLED = os.environ.get('LLM_TOOLS_ENABLED', 'false').lower() == 'true'
+
+    # Shared OpenAI client: connection pool (sized to the server's worker threads), timeouts in seconds, retries
+    OPENAI_BASE_URL = os.environ.get('OPENAI_BASE_URL')
+    OPENAI_MAX_CONNECTIONS = int(os.environ.get('OPENAI_MAX_CONNECTIONS', 20))
+    OPENAI_CONNECT_TIMEOUT = float(os.environ.get('OPENAI_CONNECT_TIMEOUT', 5))
+    OPENAI_CHAT_TIMEOUT = float(os.environ.get('OPENAI_CHAT_TIMEOUT', 30))
+    OPENAI_NAME_CONVERSION_TIMEOUT = float(os.environ.get('OPENAI_NAME_CONVERSION_TIMEOUT', 10))
+    OPENAI_TRANSCRIPTION_TIMEOUT = float(os.environ.get('OPENAI_TRANSCRIPTION_TIMEOUT', 60))
+    OPENAI_MAX_RETRIES = int(os.environ.get('OPENAI_MAX_RETRIES', 2))
+
+    # Threads running the voice pipeline stages that overlap with transcription (about 3 per request)
+    VOICE_PIPELINE_WORKERS = int(os.environ.get('VOICE_PIPELINE_WORKERS', 12))
+
+    # Cut leading/trailing silence before transcription (and skip the API call for silent recordings)
+    AUDIO_TRIM_SILENCE = os.environ.get('AUDIO_TRIM_SILENCE', 'true').lower() == 'true'
+    AUDIO_SILENCE_THRESHOLD_DBFS = float(os.environ.get('AUDIO_SILENCE_THRESHOLD_DBFS', -45))
+    AUDIO_TRIM_MIN_SAVINGS_MS = int(os.environ.get('AUDIO_TRIM_MIN_SAVINGS_MS', 1000))
+
+    # Long recordings are split at pauses into chunks of about AUDIO_CHUNK_MS (0 = never) and transcribed
+    # in parallel; trimmed recordings and chunks are encoded as 'mp3' or sent as uncompressed 'wav'
+    AUDIO_CHUNK_MS = int(os.environ.get('AUDIO_CHUNK_MS', 30000))
+    AUDIO_CHUNK_OVERLAP_MS = int(os.environ.get('AUDIO_CHUNK_OVERLAP_MS', 1000))
+    AUDIO_CHUNK_PARALLELISM = int(os.environ.get('AUDIO_CHUNK_PARALLELISM', 4))
+    AUDIO_UPLOAD_FORMAT = os.environ.get('AUDIO_UPLOAD_FORMAT', 'mp3')
+
+    # Uploads in a container the API accepts that are smaller than this are sent without decoding, so
+    # they are neither trimmed nor checked for speech (0 = decode every upload); the default is about
+    # 30 s at the recorder's 128 kbit/s, below the length at which AUDIO_CHUNK_MS splits a recording
+    AUDIO_DECODE_MIN_BYTES = int(os.environ.get('AUDIO_DECODE_MIN_BYTES', 480 * 1024))
+
+    # Audio decoding/encoding runs on this many worker threads (0 = in the request thread); when
+    # AUDIO_POOL_MAX_PENDING jobs are already waiting, voice requests get 503 with Retry-After
+    AUDIO_POOL_WORKERS = int(os.environ.get('AUDIO_POOL_WORKERS', 4))
+    AUDIO_POOL_MAX_PENDING = int(os.environ.get('AUDIO_POOL_MAX_PENDING', 16))
+    AUDIO_JOB_TIMEOUT = float(os.environ.get('AUDIO_JOB_TIMEOUT', 30))
+
+    # Recordings uploaded in chunks while the user speaks: seconds an idle session is kept, open sessions
+    # allowed and bytes all open sessions may hold in memory together
+    UPLOAD_SESSION_TTL = float(os.environ.get('UPLOAD_SESSION_TTL', 120))
+    UPLOAD_SESSION_MAX = int(os.environ.get('UPLOAD_SESSION_MAX', 16))
+    UPLOAD_SESSION_MAX_BYTES = int(os.environ.get('UPLOAD_SESSION_MAX_BYTES', 64 * 1024 * 1024))
+
+    # Transcripts by content hash of the recording: entries kept in memory, seconds they stay valid and
+    # whether they are also stored in the database (so they survive restarts and are shared by processes)
+    TRANSCRIPTION_CACHE_SIZE = int(os.environ.get('TRANSCRIPTION_CACHE_SIZE', 256))
+    TRANSCRIPTION_CACHE_TTL = int(os.environ.get('TRANSCRIPTION_CACHE_TTL', 86400))
+    TRANSCRIPTION_CACHE_PERSISTENT = os.environ.get('TRANSCRIPTION_CACHE_PERSISTENT', 'false').lower() == 'true'
+
+    # LLM fallback answers to conversation-opening questions: entries (0 = off), seconds they are reused and the
+    # character n-gram similarity above which a differently worded question gets the same answer (0 = exact only)
+    RESPONSE_CACHE_SIZE = int(os.environ.get('RESPONSE_CACHE_SIZE', 256))
+    RESPONSE_CACHE_TTL = int(os.environ.get('RESPONSE_CACHE_TTL', 600))
+    RESPONSE_CACHE_SIMILARITY = float(os.environ.get('RESPONSE_CACHE_SIMILARITY', 0.9))
+
+    # Admission control of OpenAI calls: calls in flight (0 = unlimited), the request quota (per minute, 0 = none)
+    # with its burst, calls allowed to wait, and how long voice / chat / background calls may wait before rejection
+    AI_MAX_CONCURRENT = int(os.environ.get('AI_MAX_CONCURRENT', 16))
+    OPENAI_REQUESTS_PER_MINUTE = float(os.environ.get('OPENAI_REQUESTS_PER_MINUTE', 500))
+    OPENAI_REQUEST_BURST = int(os.environ.get('OPENAI_REQUEST_BURST', 20))
+    AI_MAX_QUEUE = int(os.environ.get('AI_MAX_QUEUE', 64))
+    AI_QUEUE_TIMEOUT_VOICE = float(os.environ.get('AI_QUEUE_TIMEOUT_VOICE', 2))
+    AI_QUEUE_TIMEOUT_CHAT = float(os.environ.get('AI_QUEUE_TIMEOUT_CHAT', 5))
+    AI_QUEUE_TIMEOUT_BACKGROUND = float(os.environ.get('AI_QUEUE_TIMEOUT_BACKGROUND', 30))
+
+    # Latency budget of a voice request in seconds (0 = none). With less than VOICE_NAME_CONVERSION_MIN_BUDGET left after
+    # Whisper the name conversion is skipped; with less than VOICE_LLM_MIN_BUDGET left the planning processor answers
+    # instead of the LLM, whose answer is otherwise capped at VOICE_LLM_TOKENS_PER_SECOND tokens per remaining second
+    VOICE_DEADLINE = float(os.environ.get('VOICE_DEADLINE', 8))
+    VOICE_NAME_CONVERSION_MIN_BUDGET = float(os.environ.get('VOICE_NAME_CONVERSION_MIN_BUDGET', 4))
+    VOICE_LLM_MIN_BUDGET = float(os.environ.get('VOICE_LLM_MIN_BUDGET', 1.5))
+    VOICE_LLM_TOKENS_PER_SECOND = int(os.environ.get('VOICE_LLM_TOKENS_PER_SECOND', 60))
+
+    # Start the LLM next to the planning processor and take the first acceptable answer, for 'borderline' questions
+    # (a single planning keyword, or routed to both), 'always' (every planning question) or 'off'; every discarded
+    # LLM answer is paid for, so it is off unless enabled
+    SPECULATIVE_MODE = os.environ.get('SPECULATIVE_MODE', 'off')
+    SPECULATIVE_WORKERS = int(os.environ.get('SPECULATIVE_WORKERS', 8))
+
+    # Circuit breaker of OpenAI calls: opens when CIRCUIT_FAILURE_RATE of the last CIRCUIT_WINDOW calls (at least
+    # CIRCUIT_MIN_CALLS) failed or took longer than CIRCUIT_SLOW_CALL_SECONDS, rejects calls for CIRCUIT_OPEN_SECONDS,
+    # then closes after CIRCUIT_HALF_OPEN_PROBES successful trial calls (CIRCUIT_WINDOW 0 = no breaker)
+    CIRCUIT_WINDOW = int(os.environ.get('CIRCUIT_WINDOW', 20))
+    CIRCUIT_MIN_CALLS = int(os.environ.get('CIRCUIT_MIN_CALLS', 5))
+    CIRCUIT_FAILURE_RATE = float(os.environ.get('CIRCUIT_FAILURE_RATE', 0.5))
+    CIRCUIT_SLOW_CALL_SECONDS = float(os.environ.get('CIRCUIT_SLOW_CALL_SECONDS', 15))
+    CIRCUIT_OPEN_SECONDS = float(os.environ.get('CIRCUIT_OPEN_SECONDS', 30))
+    CIRCUIT_HALF_OPEN_PROBES = int(os.environ.get('CIRCUIT_HALF_OPEN_PROBES', 1))
+
+    # Query router trained by `manage.py train_router` (the keyword rule routes without one): questions the
+    # processor answers with a probability above ROUTER_PLANNING_ABOVE go to it, below ROUTER_LLM_BELOW to the
+    # LLM, the ones in between to both at once
+    ROUTER_MODEL_PATH = os.environ.get('ROUTER_MODEL_PATH', os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'queryRouter.npz'))
+    ROUTER_PLANNING_ABOVE = float(os.environ.get('ROUTER_PLANNING_ABOVE', 0.65))
+    ROUTER_LLM_BELOW = float(os.environ.get('ROUTER_LLM_BELOW', 0.35))
+
+    # Questions listing several clients or months are split into sub-queries (at most QUERY_PLANNER_MAX_SUBQUERIES)
+    # answered at once on QUERY_PLANNER_WORKERS threads
+    QUERY_PLANNER_WORKERS = int(os.environ.get('QUERY_PLANNER_WORKERS', 4))
+    QUERY_PLANNER_MAX_SUBQUERIES = int(os.environ.get('QUERY_PLANNER_MAX_SUBQUERIES', 8))
+
 class DevelopmentConfig(Config):
     DEBUG = True
 
@@ -33,3 +145,10 @@ class TestingConfig(Config):
 class ProductionConfig(Config):
     DEBUG = False
     TESTING = False
+
+
+def get_setting(name, default=None):
+    """Read a setting from the active app config, or from Config outside an app context."""
+    if has_app_context():
+        return current_app.config.get(name, default)
+    return getattr(Config, name, default)
@@ -14,6 +14,7 @@ class Chat(db.Model):
 
     # Relationships
     messages = db.relationship('Message', backref='chat', lazy=True, cascade='all, delete-orphan')
+    state = db.relationship('ChatState', backref='chat', uselist=False, lazy=True, cascade='all, delete-orphan')
 
     def __repr__(self):
         return f'<Chat {self.id}: {self.title}>'
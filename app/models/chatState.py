@@ -0,0 +1,15 @@
+from app.extensions import db
+from datetime import datetime
+
+
+class ChatState(db.Model):
+    __tablename__ = 'chat_states'
+
+    # The last planning question the processor answered in the chat, for follow-ups
+    chatId = db.Column(db.Integer, db.ForeignKey('chats.id'), primary_key=True)
+    intent = db.Column(db.String(30), nullable=False)
+    params = db.Column(db.JSON, nullable=False, default=dict)
+    updatedAt = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+
+    def __repr__(self):
+        return f'<ChatState {self.chatId}: {self.intent}>'
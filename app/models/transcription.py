@@ -0,0 +1,15 @@
+from app.extensions import db
+from datetime import datetime
+
+
+class TranscriptionCacheEntry(db.Model):
+    __tablename__ = 'transcription_cache'
+
+    # sha256 of the recording and of the settings that shape its transcript
+    cacheKey = db.Column(db.String(64), primary_key=True)
+    text = db.Column(db.Text, nullable=False)
+    createdAt = db.Column(db.DateTime, default=datetime.now)
+    expiresAt = db.Column(db.DateTime, nullable=False, index=True)
+
+    def __repr__(self):
+        return f'<TranscriptionCacheEntry {self.cacheKey[:12]}>'
@@ -0,0 +1,208 @@
+import heapq
+import itertools
+import time
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from app.config import get_setting
+from app.services.metrics import metrics
+
+# Priority classes, most urgent first: shop-floor voice commands, typed chat, batch/background work
+PRIORITIES = ('voice', 'chat', 'background')
+
+# Class of calls made outside an ai_priority block, by operation
+OPERATION_PRIORITIES = {
+    'transcription': 'voice',
+    'name_conversion': 'voice',
+}
+
+# Seconds a call of each class may wait for admission before it is rejected
+QUEUE_TIMEOUT_SETTINGS = {
+    'voice': 'AI_QUEUE_TIMEOUT_VOICE',
+    'chat': 'AI_QUEUE_TIMEOUT_CHAT',
+    'background': 'AI_QUEUE_TIMEOUT_BACKGROUND',
+}
+
+_current_priority = ContextVar('ai_priority', default=None)
+
+
+class AISchedulerBusy(Exception):
+    """Raised when an upstream AI call is not admitted before its queue deadline."""
+
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+@contextmanager
+def ai_priority(priority):
+    """Run the AI calls made in this block (in this thread) with the given priority class."""
+    token = _current_priority.set(priority)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+def call_priority(operation):
+    """Priority class of a call: the enclosing ai_priority block, else the operation's default."""
+    return _current_priority.get() or OPERATION_PRIORITIES.get(operation, 'chat')
+
+
+class AIScheduler:
+    def __init__(self, max_concurrent=16, requests_per_minute=0, burst=10, max_queue=64):
+        """
+        Admission control for upstream AI calls.
+
+        A call is admitted when one of `max_concurrent` slots is free and the token bucket holds a
+        request token. Waiting calls are admitted strictly by priority class, then arrival; a call
+        still waiting at its class's queue deadline is rejected at once instead of piling up.
+
+        Args:
+            max_concurrent (int): Calls in flight at once across the process
+            requests_per_minute (float): Sustained request rate of the provider quota, 0 for no limit
+            burst (int): Requests the bucket allows in a burst above the sustained rate
+            max_queue (int): Calls allowed to wait; further calls are rejected immediately
+        """
+        self.max_concurrent = max_concurrent
+        self.rate = requests_per_minute / 60.0
+        self.burst = max(1, burst)
+        self.max_queue = max_queue
+
+        self._condition = threading.Condition()
+        self._in_flight = 0
+        self._tokens = float(self.burst)
+        self._refilled = time.monotonic()
+        # (priority rank, arrival) of the waiting calls; the smallest is admitted first
+        self._waiting = []
+        self._arrivals = itertools.count()
+
+    def _refill(self, now):
+        if self.rate > 0:
+            self._tokens = min(self.burst, self._tokens + (now - self._refilled) * self.rate)
+        self._refilled = now
+
+    def _update_gauges(self):
+        metrics.set_gauge('ai_in_flight', self._in_flight)
+        metrics.set_gauge('ai_queue_depth', len(self._waiting))
+
+    def acquire(self, priority, timeout):
+        """
+        Wait for admission of one call.
+
+        Args:
+            priority (str): One of PRIORITIES
+            timeout (float): Seconds the call may wait
+
+        Raises:
+            AISchedulerBusy: if the queue is full or the call is not admitted within `timeout`
+        """
+        started = time.monotonic()
+        deadline = started + timeout
+        entry = (PRIORITIES.index(priority), next(self._arrivals))
+
+        with self._condition:
+            if len(self._waiting) >= self.max_queue:
+                metrics.inc('ai_rejected', labels={'priority': priority, 'reason': 'queue_full'})
+                raise AISchedulerBusy(f"AI call queue is full ({len(self._waiting)} waiting)",
+                                      retry_after=max(1, round(timeout)))
+
+            heapq.heappush(self._waiting, entry)
+            self._update_gauges()
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    first = self._waiting[0] == entry
+                    has_token = self.rate <= 0 or self._tokens >= 1
+                    if first and self._in_flight < self.max_concurrent and has_token:
+                        break
+
+                    if now >= deadline:
+                        metrics.inc('ai_rejected', labels={'priority': priority, 'reason': 'deadline'})
+                        raise AISchedulerBusy(
+                            f"AI call ({priority}) not admitted within {timeout:.1f} s "
+                            f"({self._in_flight} in flight, {len(self._waiting)} waiting)",
+                            retry_after=max(1, round(timeout)))
+
+                    # Woken by a release; the head also wakes itself when the next token is due
+                    wait = deadline - now
+                    if first and not has_token:
+                        wait = min(wait, (1 - self._tokens) / self.rate)
+                    self._condition.wait(wait)
+
+                heapq.heappop(self._waiting)
+                self._in_flight += 1
+                if self.rate > 0:
+                    self._tokens -= 1
+            except BaseException:
+                self._waiting.remove(entry)
+                heapq.heapify(self._waiting)
+                raise
+            finally:
+                self._update_gauges()
+                # The next waiter may now be at the head
+                self._condition.notify_all()
+
+        metrics.observe('ai_queue_wait_ms', (time.monotonic() - started) * 1000, labels={'priority': priority})
+
+    def release(self):
+        """Free the slot of a finished call."""
+        with self._condition:
+            self._in_flight -= 1
+            self._update_gauges()
+            self._condition.notify_all()
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_ai_scheduler():
+    """Return the shared scheduler, creating it on first use, or None when admission control is disabled."""
+    global _scheduler
+
+    max_concurrent = get_setting('AI_MAX_CONCURRENT', 0)
+    if not max_concurrent or max_concurrent <= 0:
+        return None
+
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = AIScheduler(
+                    max_concurrent=max_concurrent,
+                    requests_per_minute=get_setting('OPENAI_REQUESTS_PER_MINUTE', 0),
+                    burst=get_setting('OPENAI_REQUEST_BURST', 20),
+                    max_queue=get_setting('AI_MAX_QUEUE', 64)
+                )
+    return _scheduler
+
+
+def admit(operation, deadline=None):
+    """
+    Wait for admission of one upstream call of `operation`.
+
+    Args:
+        operation (str): What the call is for, e.g. 'chat'; picks the default priority
+        deadline (Deadline, optional): Budget of the request; the call waits no longer than its time left
+
+    Returns:
+        callable: releases the call's slot; call it once the response has been consumed
+
+    Raises:
+        AISchedulerBusy: if the call is not admitted before its priority's queue deadline
+    """
+    scheduler = get_ai_scheduler()
+    if scheduler is None:
+        return lambda: None
+
+    priority = call_priority(operation)
+    timeout = get_setting(QUEUE_TIMEOUT_SETTINGS[priority], 5)
+    scheduler.acquire(priority, deadline.cap(timeout) if deadline else timeout)
+
+    released = threading.Lock()
+
+    def release():
+        if released.acquire(blocking=False):
+            scheduler.release()
+    return release
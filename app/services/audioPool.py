@@ -0,0 +1,179 @@
+import math
+import time
+import atexit
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from flask import current_app
+from app.config import get_setting
+from app.services.metrics import metrics
+
+
+class AudioPoolBusy(Exception):
+    """Raised when the audio pool already holds as many jobs as it is allowed to queue."""
+
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AudioJobTimeout(Exception):
+    """Raised when an audio job does not finish within the pool's timeout."""
+
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AudioPool:
+    def __init__(self, workers=4, max_pending=16, timeout=30.0):
+        """
+        Run audio decoding and encoding (ffmpeg subprocesses behind pydub) on a bounded set of threads.
+
+        A burst of voice requests then starts at most `workers` ffmpeg processes at a time instead
+        of one per request thread, and requests beyond the queue are turned away early.
+
+        Args:
+            workers (int): Number of audio worker threads
+            max_pending (int): Jobs allowed to wait for a free worker before new ones are rejected
+            timeout (float): Seconds a caller waits for a job result
+        """
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+
+        # One slot per running or queued job; released when the worker finishes
+        self._slots = threading.BoundedSemaphore(workers + max_pending)
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        # Moving average of job durations, used for the Retry-After estimate
+        self._average_ms = 0.0
+
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='audioWorker')
+
+    def _update_gauges(self):
+        metrics.set_gauge('audio_pool_queue_depth', self._queued)
+        metrics.set_gauge('audio_pool_running', self._running)
+
+    def _run_job(self, app, submitted, func, args):
+        """Run one job in an app context of its own, keeping the queue gauges and timings up to date."""
+        started = time.perf_counter()
+        with self._lock:
+            self._queued -= 1
+            self._running += 1
+            self._update_gauges()
+        metrics.observe('audio_job_wait_ms', (started - submitted) * 1000)
+
+        try:
+            with app.app_context():
+                return func(*args)
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            metrics.observe('audio_job_ms', elapsed_ms, labels={'job': func.__name__})
+            with self._lock:
+                self._running -= 1
+                self._average_ms = elapsed_ms if not self._average_ms else 0.8 * self._average_ms + 0.2 * elapsed_ms
+                self._update_gauges()
+
+    def retry_after(self):
+        """Seconds until a worker is likely to be free for a new job (at least 1)."""
+        with self._lock:
+            waiting = self._queued + self._running
+            average_ms = self._average_ms or 1000.0
+        return max(1, math.ceil(waiting * average_ms / self.workers / 1000))
+
+    def submit(self, func, *args):
+        """
+        Queue `func(*args)` on the pool; it runs in an app context of the calling app.
+
+        Returns:
+            Future: resolves to the function's result
+
+        Raises:
+            AudioPoolBusy: if all worker and queue slots are taken
+        """
+        if not self._slots.acquire(blocking=False):
+            metrics.inc('audio_pool_rejected')
+            raise AudioPoolBusy(f"Audio pool is full ({self.workers} workers, {self.max_pending} queued)",
+                                retry_after=self.retry_after())
+
+        app = current_app._get_current_object()
+        with self._lock:
+            self._queued += 1
+            self._update_gauges()
+
+        try:
+            future = self._executor.submit(self._run_job, app, time.perf_counter(), func, args)
+        except Exception:
+            with self._lock:
+                self._queued -= 1
+                self._update_gauges()
+            self._slots.release()
+            raise
+
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def run(self, func, *args, timeout=None):
+        """
+        Run `func(*args)` on the pool and wait for its result.
+
+        Raises:
+            AudioPoolBusy: if the pool is full
+            AudioJobTimeout: if the job has not finished within the timeout
+        """
+        future = self.submit(func, *args)
+        try:
+            return future.result(timeout=timeout or self.timeout)
+        except FutureTimeoutError:
+            # A running ffmpeg call cannot be interrupted; it keeps its slot until it finishes
+            if future.cancel():
+                with self._lock:
+                    self._queued -= 1
+                    self._update_gauges()
+            metrics.inc('audio_job_timeouts', labels={'job': func.__name__})
+            raise AudioJobTimeout(f"{func.__name__} did not finish within {timeout or self.timeout} s")
+
+    def shutdown(self):
+        """Stop the workers, dropping queued jobs."""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_audio_pool():
+    """Return the shared audio pool, creating it on first use, or None when the pool is disabled."""
+    global _pool
+
+    workers = get_setting('AUDIO_POOL_WORKERS', 0)
+    if not workers or workers <= 0:
+        return None
+
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = AudioPool(
+                    workers=workers,
+                    max_pending=get_setting('AUDIO_POOL_MAX_PENDING', 16),
+                    timeout=get_setting('AUDIO_JOB_TIMEOUT', 30)
+                )
+                atexit.register(_pool.shutdown)
+                current_app.logger.info(f"Started audio pool with {workers} worker threads")
+    return _pool
+
+
+def run_audio_job(func, *args):
+    """
+    Run an audio decoding or encoding function on the audio pool when it is enabled, otherwise in
+    the calling thread.
+
+    Raises:
+        AudioPoolBusy: if the pool is full
+        AudioJobTimeout: if the job runs past AUDIO_JOB_TIMEOUT
+    """
+    pool = get_audio_pool()
+    if pool is None:
+        return func(*args)
+    return pool.run(func, *args)
@@ -0,0 +1,365 @@
+import io
+import time
+import mimetypes
+import numpy as np
+from flask import current_app
+from pydub import AudioSegment
+from app.config import get_setting
+from app.services.metrics import metrics
+
+# Recordings smaller than this are treated as empty
+MIN_AUDIO_BYTES = 100
+
+# Content types MediaRecorder produces that mimetypes does not know (or maps to rare extensions)
+AUDIO_FORMATS = {
+    'audio/webm': 'webm',
+    'audio/ogg': 'ogg',
+    'audio/wav': 'wav',
+    'audio/x-wav': 'wav',
+    'audio/wave': 'wav',
+    'audio/mpeg': 'mp3',
+    'audio/mp4': 'mp4',
+}
+
+# Containers the transcription API accepts as they are
+WHISPER_FORMATS = {'webm', 'ogg', 'wav', 'mp3', 'mp4', 'm4a', 'flac'}
+
+# Encoding of recordings that have to be converted: speech needs no more than mono 16 kHz
+TRANSCODE_CHANNELS = 1
+TRANSCODE_FRAME_RATE = 16000
+TRANSCODE_BITRATE = '32k'
+
+# Energy-based voice activity detection: frame length, speech kept around the voiced part,
+# voiced time below which a recording counts as silent, and the loudest frame's headroom
+VAD_FRAME_MS = 20
+SPEECH_PADDING_MS = 250
+MIN_SPEECH_MS = 200
+PEAK_RELATIVE_DB = 35
+
+
+class NoSpeechDetected(Exception):
+    """Raised when a recording holds no speech, so it is not sent for transcription."""
+
+
+def audio_format(contentType):
+    """Format (file extension without the dot) of an upload's content type, 'webm' when unknown."""
+    mimeType = (contentType or '').split(';')[0].strip().lower()
+    if mimeType in AUDIO_FORMATS:
+        return AUDIO_FORMATS[mimeType]
+    ext = mimetypes.guess_extension(mimeType) or '.webm'
+    return ext.lstrip('.')
+
+
+def read_audio_upload(audioFile):
+    """
+    Read an uploaded recording into memory.
+
+    Args:
+        audioFile (FileStorage): The uploaded file
+
+    Returns:
+        tuple: (audio_bytes, audio_format, file_info)
+    """
+    audioData = audioFile.read()
+    return audioData, audio_format(audioFile.content_type), {
+        "filename": audioFile.filename,
+        "content_type": audioFile.content_type,
+        "size_bytes": len(audioData)
+    }
+
+
+def detect_audio_format(audioData):
+    """
+    Detect the container of a recording from its first bytes.
+
+    Returns:
+        str: 'webm', 'mkv', 'ogg', 'wav', 'mp3', 'aac', 'mp4', 'm4a' or 'flac', or None if unknown
+    """
+    head = audioData[:64]
+    if head.startswith(b'\x1a\x45\xdf\xa3'):
+        # EBML: the DocType says whether the Matroska file is WebM
+        return 'webm' if b'webm' in head else 'mkv'
+    if head.startswith(b'OggS'):
+        return 'ogg'
+    if head.startswith(b'RIFF') and head[8:12] == b'WAVE':
+        return 'wav'
+    if head.startswith(b'fLaC'):
+        return 'flac'
+    if head[4:8] == b'ftyp':
+        return 'm4a' if head[8:11] == b'M4A' else 'mp4'
+    if head.startswith(b'ID3'):
+        return 'mp3'
+    if len(head) >= 2 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0:
+        # Frame sync: MPEG layers 1-3 are MP3, layer bits 00 are ADTS AAC
+        return 'mp3' if (head[1] >> 1) & 0x03 else 'aac'
+    return None
+
+
+def decode_audio(audioData, audioFormat=None):
+    """
+    Decode a recording to mono 16 kHz in memory.
+
+    WAV is decoded by pydub itself; other formats are piped through ffmpeg, which detects the
+    container from the data. No files are written.
+    """
+    audio = AudioSegment.from_file(io.BytesIO(audioData), format='wav' if audioFormat == 'wav' else None)
+    return audio.set_channels(TRANSCODE_CHANNELS).set_frame_rate(TRANSCODE_FRAME_RATE)
+
+
+def encode_mp3(audio):
+    """Encode decoded audio as compact MP3."""
+    output = io.BytesIO()
+    audio.export(output, format="mp3", bitrate=TRANSCODE_BITRATE)
+    return output.getvalue()
+
+
+def convert_to_mp3(audioData, audioFormat=None):
+    """
+    Convert a recording to compact mono, 16 kHz MP3 in memory.
+
+    Args:
+        audioData (bytes): The recording
+        audioFormat (str, optional): Format of the recording, e.g. 'mkv' or 'wav'
+
+    Returns:
+        bytes: The MP3 data
+    """
+    return encode_mp3(decode_audio(audioData, audioFormat))
+
+
+def _frame_levels(audio):
+    """Level (dBFS) of every VAD_FRAME_MS frame of mono audio."""
+    frame_size = int(audio.frame_rate * VAD_FRAME_MS / 1000)
+    samples = np.array(audio.get_array_of_samples(), dtype=np.float64)
+    frames = len(samples) // frame_size
+    if frames == 0:
+        return np.zeros(0)
+
+    rms = np.sqrt(np.mean(np.square(samples[:frames * frame_size].reshape(frames, frame_size)), axis=1))
+    return 20 * np.log10(np.maximum(rms, 1e-9) / audio.max_possible_amplitude)
+
+
+def _speech_threshold(levels, threshold_dbfs):
+    """Frames above this level are voiced: the absolute threshold, or PEAK_RELATIVE_DB below the peak."""
+    return max(threshold_dbfs, levels.max() - PEAK_RELATIVE_DB)
+
+
+def find_speech(audio, threshold_dbfs=-45.0):
+    """
+    Find the voiced part of a recording with a frame energy detector.
+
+    A frame is voiced when its level is above `threshold_dbfs` and within PEAK_RELATIVE_DB of the
+    loudest frame, so steady background noise in a quiet room does not count as speech.
+
+    Args:
+        audio (AudioSegment): Decoded mono audio
+        threshold_dbfs (float): Absolute level (dBFS) below which frames are silence
+
+    Returns:
+        tuple: (start_ms, end_ms) of the speech including padding, or None if there is none
+    """
+    levels = _frame_levels(audio)
+    if len(levels) == 0:
+        return None
+
+    voiced = np.flatnonzero(levels > _speech_threshold(levels, threshold_dbfs))
+    if len(voiced) * VAD_FRAME_MS < MIN_SPEECH_MS:
+        return None
+
+    start_ms = max(0, int(voiced[0]) * VAD_FRAME_MS - SPEECH_PADDING_MS)
+    end_ms = min(len(audio), (int(voiced[-1]) + 1) * VAD_FRAME_MS + SPEECH_PADDING_MS)
+    return start_ms, end_ms
+
+
+def split_at_silence(audio, chunk_ms, overlap_ms, threshold_dbfs=-45.0):
+    """
+    Split a long recording into chunks of about `chunk_ms`, cutting in pauses.
+
+    Each cut is placed at the quietest frame within a quarter chunk of the target length. When
+    that frame is silence the chunks meet there; when it is not (continuous speech) the next
+    chunk starts `overlap_ms` earlier so no word is lost, and merge_transcripts removes the
+    words both chunks heard.
+
+    Returns:
+        list: (start_ms, end_ms) of the chunks in order
+    """
+    levels = _frame_levels(audio)
+    if chunk_ms <= 0 or len(audio) <= chunk_ms * 1.25 or len(levels) == 0:
+        return [(0, len(audio))]
+
+    threshold = _speech_threshold(levels, threshold_dbfs)
+    window = chunk_ms // 4
+    spans = []
+    start_ms = 0
+
+    while len(audio) - start_ms > chunk_ms * 1.25:
+        first_frame = (start_ms + chunk_ms - window) // VAD_FRAME_MS
+        last_frame = min(len(levels), (start_ms + chunk_ms + window) // VAD_FRAME_MS)
+        cut_frame = first_frame + int(np.argmin(levels[first_frame:last_frame]))
+        cut_ms = cut_frame * VAD_FRAME_MS + VAD_FRAME_MS // 2
+
+        spans.append((start_ms, cut_ms))
+        start_ms = cut_ms if levels[cut_frame] <= threshold else max(start_ms, cut_ms - overlap_ms)
+
+    spans.append((start_ms, len(audio)))
+    return spans
+
+
+def encode_upload(upload):
+    """
+    Bytes of an upload from prepare_whisper_upload.
+
+    Decoded audio (a trimmed recording, or a chunk of a long one, which is left decoded so each
+    chunk is encoded by the thread that sends it) is encoded in the AUDIO_UPLOAD_FORMAT: 'mp3' or
+    uncompressed 'wav'.
+
+    Returns:
+        tuple: (filename, bytes)
+    """
+    filename, payload = upload
+    if isinstance(payload, AudioSegment):
+        if get_setting('AUDIO_UPLOAD_FORMAT', 'mp3') == 'wav':
+            output = io.BytesIO()
+            payload.export(output, format='wav')
+            return 'audio.wav', output.getvalue()
+        return 'audio.mp3', encode_mp3(payload)
+    return filename, payload
+
+
+def _normalize_word(word):
+    return ''.join(char for char in word.lower() if char.isalnum())
+
+
+def merge_transcripts(texts, overlapped=None, max_overlap_words=12):
+    """
+    Join the transcripts of consecutive chunks, dropping words repeated across an overlap.
+
+    The longest run of up to `max_overlap_words` words that ends one transcript and starts the
+    next (compared without case and punctuation) is kept only once.
+
+    Args:
+        texts (list): Transcripts in recording order
+        overlapped (list, optional): Per chunk, whether it starts inside the previous one; chunks
+            that were cut in a pause are joined as they are, so a word said twice is kept
+        max_overlap_words (int): Longest run of repeated words looked for
+    """
+    merged = []
+    for index, text in enumerate(texts):
+        words = text.split()
+        if not words:
+            continue
+        if overlapped is not None and not overlapped[index]:
+            merged.extend(words)
+            continue
+
+        tail = [_normalize_word(word) for word in merged[-max_overlap_words:]]
+        head = [_normalize_word(word) for word in words[:max_overlap_words]]
+        overlap = 0
+        for size in range(min(len(tail), len(head)), 0, -1):
+            if tail[-size:] == head[:size]:
+                overlap = size
+                break
+
+        merged.extend(words[overlap:])
+    return ' '.join(merged)
+
+
+def prepare_whisper_upload(audioData, audioFormat=None):
+    """
+    Build the file arguments of the Whisper requests for an in-memory recording.
+
+    With AUDIO_TRIM_SILENCE the recording is decoded (unless it is in a container the API accepts
+    and smaller than AUDIO_DECODE_MIN_BYTES) and leading and trailing silence is cut;
+    when that saves at least AUDIO_TRIM_MIN_SAVINGS_MS the trimmed audio is sent as compact MP3.
+    Recordings longer than AUDIO_CHUNK_MS are split at pauses into chunks that can be
+    transcribed in parallel. Otherwise recordings in a container the API accepts (WebM/Opus
+    from the browser, among others) are sent unchanged and only other formats are converted.
+
+    Args:
+        audioData (bytes): The recording
+        audioFormat (str, optional): Format from the upload's content type, used when the bytes
+            are not recognised
+
+    Returns:
+        tuple: (uploads, info) - uploads is a list of (filename, payload) in recording order, to
+        be passed through encode_upload; info holds 'format', 'converted', 'conversion_ms',
+        'upload_bytes' (of the single upload, None for chunks), 'chunks', 'overlapped' (see
+        merge_transcripts) when there are several and, when the recording was decoded,
+        'duration_ms' and 'trimmed_ms'
+
+    Raises:
+        NoSpeechDetected: if trimming found no speech in the recording
+    """
+    detected = detect_audio_format(audioData) or audioFormat
+    started = time.perf_counter()
+    info = {'format': detected}
+    chunk_ms = get_setting('AUDIO_CHUNK_MS', 30000)
+    threshold_dbfs = get_setting('AUDIO_SILENCE_THRESHOLD_DBFS', -45.0)
+
+    # A short recording the API accepts has little silence to cut and nothing to split
+    decode = (detected not in WHISPER_FORMATS
+              or len(audioData) >= get_setting('AUDIO_DECODE_MIN_BYTES', 480 * 1024))
+    if not decode:
+        metrics.inc('audio_decode_skipped', labels={'format': detected})
+
+    audio = None
+    if decode and (get_setting('AUDIO_TRIM_SILENCE', True) or chunk_ms > 0):
+        try:
+            audio = decode_audio(audioData, detected)
+        except Exception as e:
+            # Undecodable here does not mean unusable: the API may still accept the original
+            current_app.logger.warning(f"Could not decode audio for trimming and chunking: {str(e)}")
+
+    if audio is not None:
+        info['duration_ms'] = len(audio)
+        info['trimmed_ms'] = 0
+
+    if audio is not None and get_setting('AUDIO_TRIM_SILENCE', True):
+        speech = find_speech(audio, threshold_dbfs)
+
+        if speech is None:
+            metrics.inc('audio_no_speech', labels={'format': detected or 'unknown'})
+            raise NoSpeechDetected(f"No speech in {len(audio)} ms of audio")
+
+        start_ms, end_ms = speech
+        if len(audio) - (end_ms - start_ms) >= get_setting('AUDIO_TRIM_MIN_SAVINGS_MS', 1000):
+            info['trimmed_ms'] = len(audio) - (end_ms - start_ms)
+            audio = audio[start_ms:end_ms]
+
+    spans = split_at_silence(audio, chunk_ms, get_setting('AUDIO_CHUNK_OVERLAP_MS', 1000),
+                             threshold_dbfs) if audio is not None else [None]
+
+    if len(spans) > 1:
+        uploads = [("audio.mp3", audio[start_ms:end_ms]) for start_ms, end_ms in spans]
+        info['overlapped'] = [index > 0 and start_ms < spans[index - 1][1]
+                              for index, (start_ms, _) in enumerate(spans)]
+        converted, uploadBytes = True, None
+    elif detected in WHISPER_FORMATS and not info.get('trimmed_ms'):
+        uploads = [(f"audio.{detected}", audioData)]
+        converted, uploadBytes = False, len(audioData)
+    else:
+        # Reuse the decode of the trimming step when there was one
+        if audio is not None:
+            uploads = [encode_upload(("audio.mp3", audio))]
+        else:
+            uploads = [("audio.mp3", convert_to_mp3(audioData, detected))]
+        converted, uploadBytes = True, len(uploads[0][1])
+
+    info.update({
+        'converted': converted,
+        'conversion_ms': round((time.perf_counter() - started) * 1000, 1),
+        'upload_bytes': uploadBytes,
+        'chunks': len(uploads)
+    })
+
+    labels = {'format': detected or 'unknown', 'converted': converted}
+    metrics.inc('audio_uploads', labels=labels)
+    if uploadBytes is not None:
+        metrics.inc('audio_upload_bytes', uploadBytes, labels=labels)
+    metrics.observe('audio_conversion_ms', info['conversion_ms'], labels=labels)
+    if info.get('trimmed_ms'):
+        metrics.inc('audio_trimmed_ms', info['trimmed_ms'])
+    if len(uploads) > 1:
+        metrics.inc('audio_chunked_recordings')
+
+    return uploads, info
@@ -0,0 +1,69 @@
+import time
+import threading
+from collections import OrderedDict
+from app.services.metrics import metrics
+
+
+class TTLCache:
+    def __init__(self, name, maxsize=256, ttl=3600.0):
+        """
+        Thread-safe in-process LRU cache whose entries expire.
+
+        Args:
+            name (str): Label of the cache's hit/miss/eviction counters
+            maxsize (int): Entries kept; the least recently used one is evicted beyond that
+            ttl (float): Default seconds an entry stays valid
+        """
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # key -> (expires_at, value), least recently used first
+        self._entries = OrderedDict()
+
+    def get(self, key, default=None, count=True):
+        """
+        The cached value, or `default` if the key is missing or expired.
+
+        Args:
+            count (bool): Record the lookup as a hit or miss; False for callers that report their
+                own outcome (e.g. a miss that a similarity match may still turn into a hit)
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= now:
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if count:
+            metrics.inc('cache_hits' if entry is not None else 'cache_misses', labels={'cache': self.name})
+        return default if entry is None else entry[1]
+
+    def set(self, key, value, ttl=None):
+        """Store a value for `ttl` seconds (the cache's default when None)."""
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            evicted = 0
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                evicted += 1
+        if evicted:
+            metrics.inc('cache_evictions', evicted, labels={'cache': self.name})
+
+    def items(self):
+        """(key, value) of the entries that have not expired, most recently used last."""
+        now = time.monotonic()
+        with self._lock:
+            return [(key, value) for key, (expires_at, value) in self._entries.items() if expires_at > now]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
@@ -0,0 +1,172 @@
+import time
+import threading
+from collections import deque
+from app.config import get_setting
+from app.services.metrics import metrics
+
+# Circuit states and their value in the circuit_state gauge
+CLOSED = 'closed'
+HALF_OPEN = 'half_open'
+OPEN = 'open'
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpen(Exception):
+    """Raised instead of making an upstream call while the circuit is open."""
+
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    def __init__(self, name, window=20, min_calls=5, failure_rate=0.5, slow_call=15.0, open_seconds=30.0,
+                 half_open_probes=1):
+        """
+        Stop calling an upstream service that is failing or too slow, and probe it until it recovers.
+
+        The circuit opens when at least `failure_rate` of the last `window` calls failed or took
+        longer than `slow_call` seconds. Calls are then rejected at once for `open_seconds`; after
+        that (half-open) up to `half_open_probes` calls go through at a time, and the circuit closes
+        once that many have succeeded in a row, or opens again on the first failure.
+
+        Args:
+            name (str): Label of the circuit's metrics, e.g. 'openai'
+            window (int): Outcomes of the most recent calls the failure rate is computed over
+            min_calls (int): Calls the window must hold before the circuit can open
+            failure_rate (float): Share of failed or slow calls that opens the circuit
+            slow_call (float): Seconds after which a successful call still counts as a failure
+            open_seconds (float): Seconds calls are rejected before the first probe
+            half_open_probes (int): Successful probes that close the circuit again
+        """
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call = slow_call
+        self.open_seconds = open_seconds
+        self.half_open_probes = max(1, half_open_probes)
+
+        self._lock = threading.Lock()
+        self._outcomes = deque(maxlen=window)
+        self._state = CLOSED
+        self._opened = 0.0
+        self._probes_running = 0
+        self._probes_passed = 0
+        self._set_state(CLOSED)
+
+    def _set_state(self, state):
+        """Switch state (caller holds the lock, except in __init__)."""
+        if state != self._state:
+            metrics.inc('circuit_transitions', labels={'circuit': self.name, 'state': state})
+        self._state = state
+        if state == OPEN:
+            self._opened = time.monotonic()
+        if state != HALF_OPEN:
+            self._probes_running = 0
+            self._probes_passed = 0
+        if state == CLOSED:
+            self._outcomes.clear()
+        metrics.set_gauge('circuit_state', STATE_VALUES[state], labels={'circuit': self.name})
+
+    @property
+    def state(self):
+        """The current state; an open circuit whose wait is over becomes half-open."""
+        with self._lock:
+            if self._state == OPEN and time.monotonic() - self._opened >= self.open_seconds:
+                self._set_state(HALF_OPEN)
+            return self._state
+
+    def allows_calls(self):
+        """True unless the circuit is open (a half-open circuit lets probes through)."""
+        return self.state != OPEN
+
+    def before_call(self):
+        """
+        Ask to make one call.
+
+        Returns:
+            bool: True if the call is a half-open probe; pass it on to record()
+
+        Raises:
+            CircuitOpen: if the circuit is open, or half-open with all probe slots taken
+        """
+        with self._lock:
+            if self._state == OPEN:
+                waited = time.monotonic() - self._opened
+                if waited < self.open_seconds:
+                    metrics.inc('circuit_rejected', labels={'circuit': self.name})
+                    raise CircuitOpen(f"{self.name} circuit is open",
+                                      retry_after=max(1, round(self.open_seconds - waited)))
+                self._set_state(HALF_OPEN)
+
+            if self._state == HALF_OPEN:
+                if self._probes_running >= self.half_open_probes - self._probes_passed:
+                    metrics.inc('circuit_rejected', labels={'circuit': self.name})
+                    raise CircuitOpen(f"{self.name} circuit is half-open, waiting for its probes")
+                self._probes_running += 1
+                return True
+            return False
+
+    def record(self, probe, success=None, elapsed=0.0):
+        """
+        Report the outcome of a call allowed by before_call().
+
+        Args:
+            probe (bool): What before_call() returned
+            success (bool, optional): Whether the upstream served the call; None for a call that
+                says nothing about its health (e.g. a client error or a call that never started)
+            elapsed (float): Seconds the call took
+        """
+        failed = None if success is None else (not success or elapsed >= self.slow_call)
+
+        with self._lock:
+            if probe and self._state == HALF_OPEN:
+                self._probes_running -= 1
+                if failed:
+                    self._set_state(OPEN)
+                elif failed is not None:
+                    self._probes_passed += 1
+                    if self._probes_passed >= self.half_open_probes:
+                        self._set_state(CLOSED)
+                return
+
+            if failed is None or self._state != CLOSED:
+                return
+            self._outcomes.append(failed)
+            rate = sum(self._outcomes) / len(self._outcomes)
+            metrics.set_gauge('circuit_failure_rate', round(rate, 4), labels={'circuit': self.name})
+            if len(self._outcomes) >= self.min_calls and rate >= self.failure_rate:
+                self._set_state(OPEN)
+
+
+_breaker = None
+_breaker_lock = threading.Lock()
+
+
+def get_circuit_breaker():
+    """Return the circuit breaker of OpenAI calls, creating it on first use, or None when it is disabled."""
+    global _breaker
+
+    window = get_setting('CIRCUIT_WINDOW', 0)
+    if not window or window <= 0:
+        return None
+
+    if _breaker is None:
+        with _breaker_lock:
+            if _breaker is None:
+                _breaker = CircuitBreaker(
+                    'openai',
+                    window=window,
+                    min_calls=get_setting('CIRCUIT_MIN_CALLS', 5),
+                    failure_rate=get_setting('CIRCUIT_FAILURE_RATE', 0.5),
+                    slow_call=get_setting('CIRCUIT_SLOW_CALL_SECONDS', 15),
+                    open_seconds=get_setting('CIRCUIT_OPEN_SECONDS', 30),
+                    half_open_probes=get_setting('CIRCUIT_HALF_OPEN_PROBES', 1)
+                )
+    return _breaker
+
+
+def upstream_available():
+    """False while the OpenAI circuit is open, so callers can skip optional calls."""
+    breaker = get_circuit_breaker()
+    return breaker is None or breaker.allows_calls()
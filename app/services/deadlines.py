@@ -0,0 +1,102 @@
+import time
+import threading
+from contextlib import contextmanager
+from flask import current_app
+from app.config import get_setting
+from app.services.metrics import metrics
+
+
+class Deadline:
+    def __init__(self, budget, name='request'):
+        """
+        Latency budget of one request, handed from stage to stage.
+
+        Stages ask how much time is left and adapt (shorter timeouts, skipped optional calls,
+        shorter answers); each stage's share of the budget is recorded for the logs.
+
+        Args:
+            budget (float): Seconds the whole request may take
+            name (str): What the budget is for, used in logs and metric labels
+        """
+        self.budget = budget
+        self.name = name
+        self.started = time.monotonic()
+        self.expires = self.started + budget
+        self._lock = threading.Lock()
+        self._stages = []
+        self._degraded = []
+
+    def remaining(self):
+        """Seconds left, never negative."""
+        return max(0.0, self.expires - time.monotonic())
+
+    def elapsed_ms(self):
+        return round((time.monotonic() - self.started) * 1000, 1)
+
+    def cap(self, timeout):
+        """`timeout` shortened to the time left (at least a tenth of a second, so a call can still fail fast)."""
+        return max(0.1, min(timeout, self.remaining()))
+
+    @contextmanager
+    def stage(self, stage):
+        """Time a stage and log how much of the budget it used and how much is left."""
+        started = time.monotonic()
+        try:
+            yield self
+        finally:
+            elapsed_ms = round((time.monotonic() - started) * 1000, 1)
+            remaining_ms = round(self.remaining() * 1000, 1)
+            with self._lock:
+                self._stages.append((stage, elapsed_ms))
+            metrics.observe('deadline_stage_ms', elapsed_ms, labels={'budget': self.name, 'stage': stage})
+            current_app.logger.info(f"{self.name} budget: {stage} took {elapsed_ms} ms, {remaining_ms} ms left")
+
+    def degrade(self, action, reason=''):
+        """Record that a stage did less than usual to stay within the budget."""
+        with self._lock:
+            self._degraded.append(action)
+        metrics.inc('deadline_degraded', labels={'budget': self.name, 'action': action})
+        current_app.logger.warning(f"{self.name} budget: {action} ({reason}, "
+                                   f"{round(self.remaining() * 1000)} ms left)")
+
+    def summary(self):
+        """
+        Returns:
+            dict: 'budget_ms', 'elapsed_ms', 'remaining_ms', 'stages' (stage -> ms, in order) and
+            'degraded' (actions taken)
+        """
+        with self._lock:
+            stages = {}
+            for stage, elapsed_ms in self._stages:
+                stages[stage] = round(stages.get(stage, 0) + elapsed_ms, 1)
+            degraded = list(self._degraded)
+        return {
+            'budget_ms': round(self.budget * 1000),
+            'elapsed_ms': self.elapsed_ms(),
+            'remaining_ms': round(self.remaining() * 1000, 1),
+            'stages': stages,
+            'degraded': degraded
+        }
+
+
+def voice_deadline():
+    """A Deadline of VOICE_DEADLINE seconds for a voice request starting now, or None when voice requests have no budget."""
+    budget = get_setting('VOICE_DEADLINE', 0)
+    if not budget or budget <= 0:
+        return None
+    return Deadline(budget, 'voice')
+
+
+def out_of_budget(deadline, setting, default):
+    """True if the request has a deadline and less than the `setting` seconds are left of it."""
+    return deadline is not None and deadline.remaining() < get_setting(setting, default)
+
+
+@contextmanager
+def budget_stage(deadline, stage):
+    """deadline.stage(stage), or nothing when the request has no deadline."""
+    if deadline is None:
+        yield None
+    else:
+        with deadline.stage(stage):
+            yield deadline
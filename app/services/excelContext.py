@@ -0,0 +1,263 @@
+import re
+import json
+import datetime
+import numpy as np
+import pandas as pd
+
+try:
+    import orjson
+except ImportError:  # the standard library encoder gives the same JSON, only slower
+    orjson = None
+
+MONTH_NAMES = ['януари', 'февруари', 'март', 'април', 'май', 'юни',
+               'юли', 'август', 'септември', 'октомври', 'ноември', 'декември']
+
+# Characters stripped from model numbers before matching (same set as ProductionPlanningProcessor)
+MODEL_SEPARATORS = re.compile(r'[\s,\-;.:и]')
+
+# Relevance weights of each entity kind
+ENTITY_WEIGHTS = {
+    'model': 8,
+    'client': 4,
+    'type': 2,
+    'month': 1,
+}
+
+# Rows considered per query before packing; keeps serialization cost bounded
+MAX_CANDIDATE_ROWS = 300
+
+_TOKEN_PIECES = re.compile(r'[A-Za-z]+|[\u0400-\u04FF]+|\d+|\s+|[^\w\s]|\w', re.UNICODE)
+
+
+def estimate_tokens(text):
+    """
+    Estimate the number of model tokens in a text without a tokenizer download.
+
+    Latin words count as ~4 characters per token, Cyrillic words as ~3, numbers as groups of
+    3 digits and every punctuation mark as one token. Whitespace merges into the next token.
+    """
+    tokens = 0
+    for piece in _TOKEN_PIECES.findall(text):
+        first = piece[0]
+        if first.isspace():
+            continue
+        if first.isdigit():
+            tokens += (len(piece) + 2) // 3
+        elif first.isascii() and first.isalpha():
+            tokens += (len(piece) + 3) // 4
+        elif '\u0400' <= first <= '\u04ff':
+            tokens += (len(piece) + 2) // 3
+        else:
+            tokens += 1
+    return tokens
+
+
+def dumps_json(obj):
+    """Encode to a compact JSON string, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':'))
+
+
+def _json_key(key):
+    """Column label as a JSON object key (same rules as OpenAIExcelProcessor._json_serializable)."""
+    if isinstance(key, (str, int, float, bool)) or key is None:
+        return key
+    return str(key)
+
+
+def _native_value(value):
+    """Convert one cell of a mixed-type column to a JSON-native value."""
+    if isinstance(value, (pd.Timestamp, datetime.datetime, datetime.date)):
+        return str(value)
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and value != value:
+        return None
+    return value
+
+
+def frame_to_records(df):
+    """
+    Convert a dataframe to a list of JSON-native records in whole-frame steps.
+
+    Gives the same records as OpenAIExcelProcessor._json_serializable(df.to_dict(orient='records')),
+    except that NaT becomes null instead of the string 'NaT'. Timestamps become 'YYYY-MM-DD HH:MM:SS'
+    strings and numpy scalars native numbers.
+    """
+    keys = [_json_key(col) for col in df.columns]
+
+    # One object matrix for the whole frame: numeric blocks come out as native ints/floats/bools
+    values = df.to_numpy(dtype=object)
+    missing = pd.isna(values)
+    values[missing] = None
+
+    for position, dtype in enumerate(df.dtypes):
+        column = values[:, position]
+        if dtype.kind == 'M':
+            # Same text as str(Timestamp)
+            text = df.iloc[:, position].dt.strftime('%Y-%m-%d %H:%M:%S').to_numpy(dtype=object)
+            values[:, position] = np.where(missing[:, position], None, text)
+        elif dtype.kind == 'O' and pd.api.types.infer_dtype(column, skipna=True) not in ('string', 'empty'):
+            # Mixed columns (dates or numpy scalars between strings) are the only per-cell work
+            values[:, position] = [_native_value(value) for value in column]
+
+    return [dict(zip(keys, row)) for row in values.tolist()]
+
+
+def normalize_model(value):
+    """Lower-case a model number and drop separators, e.g. 'PP-CO 035' -> 'ppco035'."""
+    return MODEL_SEPARATORS.sub('', str(value).lower())
+
+
+class SheetIndex:
+    def __init__(self, sheet_name, df):
+        """
+        Lookup tables from entity values to row positions of one sheet.
+
+        Args:
+            sheet_name (str): Name of the sheet
+            df (DataFrame): The sheet's data
+        """
+        self.sheet_name = sheet_name
+        self.row_count = len(df)
+        self.client_col = df.columns[0] if len(df.columns) else None
+        self.model_col = self._find_column(df, ['модел', 'артикул'])
+        self.type_col = self._find_column(df, ['вид'])
+
+        self.clients = self._index_values(df, self.client_col, lambda value: str(value).strip().lower())
+        self.models = self._index_values(df, self.model_col, normalize_model)
+        self.types = self._index_values(df, self.type_col, lambda value: str(value).strip().lower())
+
+        # Month name -> positions of rows with a planned quantity in that month
+        self.months = {}
+        self.month_cols = {}
+        for col in df.columns:
+            col_lower = str(col).lower()
+            for month in MONTH_NAMES:
+                if month in col_lower and month not in self.month_cols:
+                    self.month_cols[month] = col
+                    values = pd.to_numeric(df[col], errors='coerce').fillna(0).to_numpy()
+                    self.months[month] = np.flatnonzero(values > 0)
+
+    @staticmethod
+    def _find_column(df, terms):
+        for col in df.columns:
+            if isinstance(col, str) and any(term in col.lower() for term in terms):
+                return col
+        return None
+
+    @staticmethod
+    def _index_values(df, col, normalize):
+        """Group row positions by the normalized value of a column."""
+        if col is None:
+            return {}
+
+        index = {}
+        for position, value in enumerate(df[col].tolist()):
+            if value is None or (isinstance(value, float) and np.isnan(value)):
+                continue
+            key = normalize(value)
+            if key:
+                index.setdefault(key, []).append(position)
+        return {key: np.array(positions) for key, positions in index.items()}
+
+
+def build_indexes(dataframes):
+    """Build a SheetIndex for every non-empty sheet."""
+    return {sheet_name: SheetIndex(sheet_name, df) for sheet_name, df in dataframes.items() if not df.empty}
+
+
+def extract_entities(query, indexes):
+    """
+    Find the clients, models, product types and months of the indexed data mentioned in a query.
+
+    Returns:
+        dict: entity kind -> sorted list of matched index keys
+    """
+    query_lower = query.lower()
+    words = [word for word in re.split(r'[\s,;]+', query_lower) if word]
+    model_terms = [normalize_model(word) for word in words if any(char.isdigit() for char in word)]
+
+    entities = {'client': set(), 'model': set(), 'type': set(), 'month': set()}
+
+    for month in MONTH_NAMES:
+        if month in query_lower:
+            entities['month'].add(month)
+
+    for index in indexes.values():
+        for client in index.clients:
+            # Whole name in the query, or a query word that starts the name ('lebek' -> 'lebek gmbh')
+            if client in query_lower or any(len(word) >= 4 and client.startswith(word) for word in words):
+                entities['client'].add(client)
+
+        for product_type in index.types:
+            if len(product_type) < 3:
+                continue
+            # Single-word types also match inflected forms ('жилетки' -> 'жилетка')
+            stem = product_type[:-1] if len(product_type) >= 5 and ' ' not in product_type else None
+            if product_type in query_lower or (stem and any(word.startswith(stem) for word in words)):
+                entities['type'].add(product_type)
+
+        for term in model_terms:
+            if len(term) < 3:
+                continue
+            for model in index.models:
+                if term == model or term in model:
+                    entities['model'].add(model)
+
+    return {kind: sorted(values) for kind, values in entities.items()}
+
+
+def rank_rows(index, entities):
+    """
+    Score the rows of one sheet by how many of the query's entities they match.
+
+    Returns:
+        list: (score, position) of matching rows, best first, ties in sheet order
+    """
+    scores = np.zeros(index.row_count, dtype=float)
+
+    for kind, lookup in (('client', index.clients), ('model', index.models), ('type', index.types),
+                         ('month', index.months)):
+        for key in entities.get(kind, []):
+            positions = lookup.get(key)
+            if positions is not None and len(positions):
+                scores[positions] += ENTITY_WEIGHTS[kind]
+
+    # Month-only queries would match most of the sheet; require another entity alongside it
+    if not any(entities.get(kind) for kind in ('client', 'model', 'type')):
+        return []
+
+    matched = np.flatnonzero(scores > ENTITY_WEIGHTS['month'] * len(entities.get('month', [])))
+    order = matched[np.argsort(-scores[matched], kind='stable')][:MAX_CANDIDATE_ROWS]
+    return [(scores[position], int(position)) for position in order]
+
+
+def pack_records(candidates, token_budget, dumps=None):
+    """
+    Pick records in order until the token budget is spent.
+
+    Args:
+        candidates (list): (group_key, record) pairs, best first
+        token_budget (int): Tokens available for the encoded records
+        dumps (callable, optional): JSON encoder for one record
+
+    Returns:
+        tuple: (dict group_key -> list of records, tokens used)
+    """
+    dumps = dumps or dumps_json
+    packed = {}
+    used = 0
+
+    for group_key, record in candidates:
+        # The group key is paid once, every record adds a separator
+        cost = estimate_tokens(dumps(record)) + 1
+        if group_key not in packed:
+            cost += estimate_tokens(dumps_json(group_key)) + 2
+        if used + cost > token_budget:
+            break
+        packed.setdefault(group_key, []).append(record)
+        used += cost
+
+    return packed, used
@@ -1,4 +1,5 @@
 import os
+import threading
 import pandas as pd
 from flask import current_app
 import re
@@ -8,6 +9,15 @@ import calendar
 import numpy as np
 
 
+def dataset_version(file_path):
+    """Identify the current contents of a data file by its modification time and size."""
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+    return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+
 class ProductionPlanningProcessor:
     def __init__(self, file_path=None):
         """Initialize Excel processor with the production planning file."""
@@ -126,8 +136,12 @@ class ProductionPlanningProcessor:
             'тридесет и първи': 31, 'трийсет и първи': 31, 'трийспърви': 31,
         }
 
-        # Cache for loaded data
+        # Cache for loaded data (raw sheets by name, cleaned ones by ('clean', name)); the lock makes
+        # concurrent queries wait for a sheet being loaded instead of reading it again
         self.cached_data = {}
+        self._cache_lock = threading.RLock()
+        # dataset_version of the file the cached sheets were read from
+        self._cached_version = None
 
     def load_workbook(self):
         """Load the Excel workbook with all sheets."""
@@ -140,28 +154,60 @@ class ProductionPlanningProcessor:
             current_app.logger.error(f"Error loading Excel file: {str(e)}")
             raise Exception(f"Грешка при зареждане на файла: {str(e)}")
 
+    def refresh_if_changed(self):
+        """
+        Drop the cached sheets if the file changed since they were read, so the next query reads it again.
+
+        Returns:
+            str: The file's current dataset_version
+        """
+        version = dataset_version(self.file_path)
+        if version != self._cached_version:
+            with self._cache_lock:
+                if version != self._cached_version:
+                    self.cached_data.clear()
+                    self._cached_version = version
+        return version
+
     def get_sheet_data(self, sheet_name):
         """Get data from a specific sheet, with caching."""
-        # Check if data is in cache
-        if sheet_name in self.cached_data:
-            return self.cached_data[sheet_name]
+        # Check if data is in cache (get, not 'in': refresh_if_changed may clear it in between)
+        df = self.cached_data.get(sheet_name)
+        if df is not None:
+            return df
 
-        # Load the data if not cached
-        try:
-            excel_file = self.load_workbook()
+        with self._cache_lock:
+            if sheet_name in self.cached_data:
+                return self.cached_data[sheet_name]
 
-            # Check if this is a MockExcelFile
-            if hasattr(excel_file, 'parse'):
-                df = excel_file.parse(sheet_name)
-            else:
-                df = pd.read_excel(excel_file, sheet_name=sheet_name)
+            # Load the data if not cached
+            try:
+                excel_file = self.load_workbook()
 
-            # Cache the data
-            self.cached_data[sheet_name] = df
+                # Check if this is a MockExcelFile
+                if hasattr(excel_file, 'parse'):
+                    df = excel_file.parse(sheet_name)
+                else:
+                    df = pd.read_excel(excel_file, sheet_name=sheet_name)
+
+                # Cache the data
+                self.cached_data[sheet_name] = df
+                return df
+            except Exception as e:
+                current_app.logger.error(f"Error loading sheet '{sheet_name}': {str(e)}")
+                raise Exception(f"Грешка при зареждане на данните от лист '{sheet_name}': {str(e)}")
+
+    def get_clean_sheet(self, sheet_name):
+        """Get a sheet cleaned by clean_dataframe, cleaning it once; callers must not modify it."""
+        key = ('clean', sheet_name)
+        df = self.cached_data.get(key)
+        if df is not None:
             return df
-        except Exception as e:
-            current_app.logger.error(f"Error loading sheet '{sheet_name}': {str(e)}")
-            raise Exception(f"Грешка при зареждане на данните от лист '{sheet_name}': {str(e)}")
+
+        with self._cache_lock:
+            if key not in self.cached_data:
+                self.cached_data[key] = self.clean_dataframe(self.get_sheet_data(sheet_name))
+            return self.cached_data[key]
 
     def get_all_sheet_names(self):
         """Get all sheet names in the workbook."""
@@ -328,7 +374,7 @@ class ProductionPlanningProcessor:
             # Get data from both main sheets
             # knitting_df = self.clean_dataframe(self.get_sheet_data('pletene'))
             # confection_df = self.clean_dataframe(self.get_sheet_data('confekcia'))
-            clients_df = self.clean_dataframe(self.get_sheet_data('za pletene po fainove'))
+            clients_df = self.get_clean_sheet('za pletene po fainove')
 
             # Get all client names from first column, usually "Фирма" or similar
             # clients_knitting = set()
@@ -387,8 +433,8 @@ class ProductionPlanningProcessor:
         """Get all product types from the Excel file."""
         try:
             # Try to get product type data from both sheets
-            knitting_df = self.clean_dataframe(self.get_sheet_data('pletene'))
-            confection_df = self.clean_dataframe(self.get_sheet_data('confekcia'))
+            knitting_df = self.get_clean_sheet('pletene')
+            confection_df = self.get_clean_sheet('confekcia')
 
             product_types = set()
 
@@ -493,8 +539,8 @@ class ProductionPlanningProcessor:
         """Get a list of all factories/workshops from the Excel file."""
         try:
             # Get data from both main sheets
-            knitting_df = self.clean_dataframe(self.get_sheet_data('pletene'))
-            confection_df = self.clean_dataframe(self.get_sheet_data('confekcia'))
+            knitting_df = self.get_clean_sheet('pletene')
+            confection_df = self.get_clean_sheet('confekcia')
 
             factories = set()
 
@@ -536,9 +582,9 @@ class ProductionPlanningProcessor:
                 }
 
             # Load and clean the data from both sheets
-            knitting_df = self.clean_dataframe(self.get_sheet_data('pletene'))
-            confection_df = self.clean_dataframe(self.get_sheet_data('confekcia'))
-            summary_df = self.clean_dataframe(self.get_sheet_data('za pletene po fainove'))
+            knitting_df = self.get_clean_sheet('pletene')
+            confection_df = self.get_clean_sheet('confekcia')
+            summary_df = self.get_clean_sheet('za pletene po fainove')
 
             # Filter by client name
             client_knitting = knitting_df[
@@ -843,8 +889,8 @@ class ProductionPlanningProcessor:
                 }
 
             # Load and clean the data from both sheets
-            knitting_df = self.clean_dataframe(self.get_sheet_data('pletene'))
-            confection_df = self.clean_dataframe(self.get_sheet_data('confekcia'))
+            knitting_df = self.get_clean_sheet('pletene')
+            confection_df = self.get_clean_sheet('confekcia')
 
             # Find product type column
             knitting_type_col = None
@@ -1063,6 +1109,16 @@ class ProductionPlanningProcessor:
                     message_string += f"{detail_type}: {quantity}; "
                 messages.append(f'\n{message_string}')
 
+        elif results.get('specific_product'):
+            messages.append(f"Информация за модели {', '.join(params.get('specific_products', []))} "
+                            f"за {results['client_name']}:")
+            for product_name in results['specific_product']:
+                message_string = f'- {product_name} - '
+                product_details = results['specific_product'][product_name]
+                for detail_type, quantity in product_details.items():
+                    message_string += f"{detail_type}: {quantity}; "
+                messages.append(f'\n{message_string}')
+
         # elif results['specific_products']!= {}:
         #     messages.append(f"Информация за специфични продукти за {results['client_name']}:")
         #     for product in results['specific_products']:
@@ -1098,10 +1154,13 @@ class ProductionPlanningProcessor:
                     month_total = sum(data.values())
                     if month_total > 0:
                         month_details = []
-                        if 'knitting' in data and data['knitting'] > 0:
-                            month_details.append(f"плетене: {data['knitting']} бр.")
-                        if 'confection' in data and data['confection'] > 0:
-                            month_details.append(f"конфекция: {data['confection']} бр.")
+                        # get_client_info keys the months' figures by 'плетене' / 'конфекция'
+                        knitting = data.get('knitting', data.get('плетене', 0))
+                        confection = data.get('confection', data.get('конфекция', 0))
+                        if knitting > 0:
+                            month_details.append(f"плетене: {knitting} бр.")
+                        if confection > 0:
+                            month_details.append(f"конфекция: {confection} бр.")
 
                         month_info = ", ".join(month_details)
                         messages.append(f"- {month}: {month_info}")
@@ -1263,8 +1322,8 @@ class ProductionPlanningProcessor:
             month_name = next((name for name, num in self.month_mappings.items() if num == month), "unknown")
 
             # Load data from both sheets
-            knitting_df = self.clean_dataframe(self.get_sheet_data('pletene'))
-            confection_df = self.clean_dataframe(self.get_sheet_data('confekcia'))
+            knitting_df = self.get_clean_sheet('pletene')
+            confection_df = self.get_clean_sheet('confekcia')
 
             # Find the month column
             month_col_knitting = None
@@ -1399,6 +1458,29 @@ class ProductionPlanningProcessor:
             # Log the detected intent and parameters
             print(f"Detected intent: {intent_type}, params: {params}")
 
+        except Exception as e:
+            import traceback
+            print(f"Error processing query: {str(e)}")
+            print(traceback.format_exc())
+            return {
+                'success': False,
+                'message': f"Възникна грешка при обработката: {str(e)}"
+            }
+
+        return self.process_intent(intent_type, params)
+
+    def process_intent(self, intent_type, params):
+        """
+        Answer an already resolved intent, e.g. a follow-up question merged with the chat's previous one.
+
+        Args:
+            intent_type (str): One of the intents of detect_query_intent
+            params (dict): Parameters in the format detect_query_intent extracts them
+
+        Returns:
+            dict: The same result format as process_query
+        """
+        try:
             # Process based on intent type
             results = {}
 
@@ -1409,6 +1491,12 @@ class ProductionPlanningProcessor:
                     results = self.get_client_info(client_query,
                                                    params.get('all_products'),
                                                    params.get('specific_products'))
+                    # A month narrows the monthly breakdown down to that month
+                    month = params.get('month')
+                    if month and 1 <= month <= 12 and results.get('monthly_data'):
+                        month_name = list(self.month_mappings.keys())[month - 1]
+                        results['monthly_data'] = {name: data for name, data in results['monthly_data'].items()
+                                                   if name == month_name}
                 else:
                     results = {
                         'client_found': False,
@@ -0,0 +1,113 @@
+import re
+from flask import current_app
+from app.extensions import db
+from app.models.chatState import ChatState
+from app.services.metrics import metrics
+
+# Words an elliptical follow-up starts with ('а за февруари?', 'ами модел 7114?', 'и за март')
+FOLLOW_UP_MARKERS = ('а', 'ами', 'и', 'също', 'пък')
+
+# Longest follow-up in words: without a marker ('февруари?', 'модел 7114 и 7120') and with one
+FOLLOW_UP_MAX_WORDS = 4
+FOLLOW_UP_MAX_MARKED_WORDS = 8
+
+# Parameters a follow-up can change; intents that answer from them
+STATE_PARAMS = ('client', 'all_products', 'specific_products', 'product_type', 'month', 'month_name', 'date',
+                'factory')
+STATE_INTENTS = ('client', 'product', 'planning', 'summary')
+
+# Words after which model numbers follow
+MODEL_PATTERN = re.compile(r'(?:номер|номера|модел|модели|модела|поръчка|поръчки|артикул|артикули)\s+(.+)')
+
+
+def extract_models(message):
+    """Model numbers named in the message ('модел 7114 и 7120' -> ['7114', '7120']), in the processor's format."""
+    match = MODEL_PATTERN.search(message.lower())
+    if not match:
+        return []
+    tokens = re.findall(r'\w[\w.-]*', match.group(1))
+    return [re.sub(r'[-.]', '', token) for token in tokens if any(char.isdigit() for char in token)]
+
+
+def _names_intent(processor, message):
+    """True if the message has an intent keyword, i.e. detect_query_intent did not fall back to its default."""
+    text = message.lower()
+    return any(keyword in text for keywords in processor.bulgarian_keywords.values() for keyword in keywords)
+
+
+def load_chat_state(chatId):
+    """The chat's last planning intent and parameters, as (intent, params), or None."""
+    if not chatId:
+        return None
+    try:
+        state = db.session.get(ChatState, chatId)
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.warning(f"Could not read the state of chat {chatId}: {str(e)}")
+        return None
+    return (state.intent, dict(state.params or {})) if state else None
+
+
+def save_chat_state(chatId, intent, params):
+    """Remember the intent and parameters the processor just answered in the chat."""
+    if not chatId or intent not in STATE_INTENTS:
+        return
+    params = {name: value for name, value in (params or {}).items() if name in STATE_PARAMS}
+    try:
+        db.session.merge(ChatState(chatId=chatId, intent=intent, params=params))
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.warning(f"Could not store the state of chat {chatId}: {str(e)}")
+
+
+def resolve_follow_up(processor, message, state):
+    """
+    Merge an elliptical follow-up with the chat's previous planning question.
+
+    'а за февруари?' after a question about client Lebek asks about Lebek in February; the
+    follow-up names no client, so detect_query_intent alone would miss it. A message is a
+    follow-up when it is short (FOLLOW_UP_MAX_WORDS, or FOLLOW_UP_MAX_MARKED_WORDS when it starts
+    with a FOLLOW_UP_MARKERS word), names no client of its own and changes at least one
+    STATE_PARAMS parameter. Without a marker it must also ask for no intent of its own, or for
+    the previous one: 'Планиране за месец април' after a client question is a new question.
+
+    Args:
+        processor (ProductionPlanningProcessor): Extracts the follow-up's parameters
+        message (str): The user's message
+        state (tuple): (intent, params) from load_chat_state, or None
+
+    Returns:
+        tuple: (intent, params) to answer with process_intent, or None if the message is not a follow-up
+    """
+    if not state:
+        return None
+
+    words = re.findall(r'\w+', message.lower())
+    if not words or len(words) > (FOLLOW_UP_MAX_MARKED_WORDS if words[0] in FOLLOW_UP_MARKERS
+                                  else FOLLOW_UP_MAX_WORDS):
+        return None
+
+    try:
+        detected, params = processor.detect_query_intent(message)
+    except Exception as e:
+        current_app.logger.warning(f"Could not extract the parameters of a follow-up: {str(e)}")
+        return None
+    if params.get('client'):
+        return None
+
+    intent, previous = state
+    if words[0] not in FOLLOW_UP_MARKERS and detected != intent and _names_intent(processor, message):
+        return None
+
+    changes = {name: value for name, value in params.items() if name in STATE_PARAMS}
+    models = extract_models(message)
+    if models:
+        changes['specific_products'] = models
+        changes['all_products'] = False
+    if not changes:
+        return None
+
+    merged = {**previous, **changes}
+    metrics.inc('follow_ups_resolved', labels={'intent': intent})
+    return intent, merged
@@ -0,0 +1,103 @@
+import threading
+import bisect
+
+# Upper bounds (ms) of the latency histogram buckets; larger values land in the overflow bucket
+LATENCY_BUCKETS_MS = (50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+
+class MetricsRegistry:
+    def __init__(self):
+        """In-process counters, gauges and histograms, safe to update from request threads."""
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+
+    @staticmethod
+    def _key(name, labels):
+        """Metric name with its labels, e.g. 'llm_calls{model=gpt-4o-mini,operation=chat}'."""
+        if not labels:
+            return name
+        return name + '{' + ','.join(f"{key}={value}" for key, value in sorted(labels.items())) + '}'
+
+    def inc(self, name, value=1, labels=None):
+        """Add `value` to a counter."""
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name, value, labels=None):
+        """Set a gauge to its current value."""
+        key = self._key(name, labels)
+        with self._lock:
+            self._gauges[key] = value
+
+    def observe(self, name, value, labels=None, buckets=LATENCY_BUCKETS_MS):
+        """Record one observation (e.g. a latency in ms) in a histogram."""
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = {'buckets': buckets, 'counts': [0] * (len(buckets) + 1), 'count': 0, 'sum': 0.0}
+                self._histograms[key] = histogram
+            histogram['counts'][bisect.bisect_left(histogram['buckets'], value)] += 1
+            histogram['count'] += 1
+            histogram['sum'] += value
+
+    def snapshot(self):
+        """
+        Copy the current values.
+
+        Returns:
+            dict: 'counters', 'gauges' and 'histograms' (count, sum, mean and per-bucket counts
+            keyed by upper bound, '+Inf' for the overflow bucket)
+        """
+        with self._lock:
+            histograms = {}
+            for key, histogram in self._histograms.items():
+                bounds = [str(bound) for bound in histogram['buckets']] + ['+Inf']
+                histograms[key] = {
+                    'count': histogram['count'],
+                    'sum': round(histogram['sum'], 3),
+                    'mean': round(histogram['sum'] / histogram['count'], 3) if histogram['count'] else 0.0,
+                    'buckets': dict(zip(bounds, histogram['counts']))
+                }
+            return {
+                'counters': dict(self._counters),
+                'gauges': dict(self._gauges),
+                'histograms': histograms
+            }
+
+
+# Process-wide registry, exposed by the /metrics route
+metrics = MetricsRegistry()
+
+
+def cached_prompt_tokens(usage):
+    """Prompt tokens served from the provider's prefix cache (0 when the response does not report them)."""
+    details = getattr(usage, 'prompt_tokens_details', None)
+    return (getattr(details, 'cached_tokens', None) or 0) if details is not None else 0
+
+
+def record_completion_usage(operation, model, usage):
+    """
+    Count the prompt, cached prompt and completion tokens of a chat completion.
+
+    Args:
+        operation (str): What the call was for, e.g. 'chat' or 'excel_query'
+        model (str): Model name
+        usage: The `usage` object of the response (may be None)
+
+    Returns:
+        int: Cached prompt tokens of this call
+    """
+    labels = {'operation': operation, 'model': model}
+    metrics.inc('llm_calls', labels=labels)
+    if usage is None:
+        return 0
+
+    cached = cached_prompt_tokens(usage)
+    metrics.inc('llm_prompt_tokens', usage.prompt_tokens or 0, labels=labels)
+    metrics.inc('llm_cached_prompt_tokens', cached, labels=labels)
+    metrics.inc('llm_completion_tokens', usage.completion_tokens or 0, labels=labels)
+    return cached
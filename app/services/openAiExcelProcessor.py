@@ -1,18 +1,30 @@
 import os
+import threading
 import pandas as pd
 import numpy as np
 from flask import current_app
 import json
-import openai
 from typing import Dict, List, Any, Union
 import datetime
+from app.config import get_setting
+from app.services.excelServices import dataset_version
+from app.services.excelContext import (build_indexes, extract_entities, rank_rows, pack_records, estimate_tokens,
+                                      frame_to_records, dumps_json)
+from app.services.metrics import record_completion_usage
+from app.services.openaiClient import api_key_configured, create_openai_client, create_chat_completion
+
+# Stable instructions; followed by the sheet summaries they form the cacheable prompt prefix
+SYSTEM_PROMPT = """Ти си експертен асистент за анализ на данни за производство. 
+Твоята задача е да анализираш данни от Excel таблица за планиране на производството 
+и да отговориш на въпроси на български език. Бъди точен, професионален и ясен в отговорите си.
+Включи релевантни числа и статистики от данните, където е възможно."""
 
 
 class OpenAIExcelProcessor:
     def __init__(self, file_path=None, api_key=None):
         """Initialize the Excel processor with OpenAI integration."""
-        # Set the OpenAI API key
-        openai.api_key = api_key or os.environ.get('OPENAI_API_KEY')
+        # A processor with its own API key gets its own client; otherwise the shared one is used
+        self.client = create_openai_client(api_key=api_key) if api_key else None
 
         # Find the Excel file
         if file_path is None:
@@ -37,6 +49,11 @@ class OpenAIExcelProcessor:
 
         # Cache for loaded data
         self.dataframes = {}
+        self.dataset_version = None
+
+        # Sheet summaries and their JSON, built once per dataset version
+        self._static_context = None
+        self._static_context_lock = threading.Lock()
 
         # Load all Excel data on initialization
         self._load_all_data()
@@ -48,6 +65,8 @@ class OpenAIExcelProcessor:
             return
 
         try:
+            version = dataset_version(self.file_path)
+            dataframes = {}
 
             # Define which sheets you want to load
             target_sheets = ['pletene', 'confekcia', 'za pletene po fainove']
@@ -74,16 +93,27 @@ class OpenAIExcelProcessor:
                         df.columns = pd.io.parsers.base_parser.ParserBase({'names': df.columns})._maybe_dedup_names(
                             df.columns)
 
-                    self.dataframes[sheet_name] = df
+                    dataframes[sheet_name] = df
                 else:
                     print(f"Warning: Sheet '{sheet_name}' not found in Excel file")
 
+            # Swap in the new data and drop everything derived from the previous version
+            self.dataframes = dataframes
+            self.dataset_version = version
+            self._static_context = None
+
             print(f"Loaded {len(self.dataframes)} sheets from Excel file")
         except Exception as e:
             print(f"Error loading Excel data: {str(e)}")
             import traceback
             traceback.print_exc()
 
+    def refresh_if_changed(self):
+        """Reload the Excel data if the file changed since it was loaded."""
+        if dataset_version(self.file_path) != self.dataset_version:
+            print(f"Excel file changed, reloading: {self.file_path}")
+            self._load_all_data()
+
     def _clean_dataframe(self, df):
         """Clean the dataframe by removing empty rows, fixing column names, etc."""
         try:
@@ -166,72 +196,119 @@ class OpenAIExcelProcessor:
 
         return summaries
 
-    def _prepare_data_context(self, query):
+    def get_static_context(self):
         """
-        Prepare the relevant data from Excel for the query context.
-        Analyzes the query to determine which sheets/data are relevant.
+        Get the query-independent part of the prompt context for the loaded dataset version.
+
+        Returns:
+            dict: 'version', 'summaries', 'summaries_json' (the summaries encoded once),
+            'system_prompt' (instructions plus summaries: the same bytes for every prompt of
+            this version, so the provider can serve it from its prefix cache),
+            'summaries_tokens' and 'indexes' (SheetIndex per sheet for row retrieval)
         """
-        context_data = {}
-        query_lower = query.lower()
+        static_context = self._static_context
+        if static_context is not None and static_context['version'] == self.dataset_version:
+            return static_context
+
+        with self._static_context_lock:
+            if self._static_context is None or self._static_context['version'] != self.dataset_version:
+                summaries = self._extract_sheet_summaries()
+                summaries_json = dumps_json(summaries)
+                self._static_context = {
+                    'version': self.dataset_version,
+                    'summaries': summaries,
+                    'summaries_json': summaries_json,
+                    'system_prompt': (f"{SYSTEM_PROMPT}\n\nОбобщение на листовете от Excel файла с информация "
+                                      f"за планиране на производството:\n{summaries_json}"),
+                    'summaries_tokens': estimate_tokens(summaries_json),
+                    'indexes': build_indexes(self.dataframes)
+                }
+            return self._static_context
 
-        # Include sheet summaries for overall context
-        context_data["sheet_summaries"] = self._extract_sheet_summaries()
+    def _prepare_data_context(self, query):
+        """
+        Prepare the query-specific data from Excel for the query context.
 
-        # Extract specific data based on the query
-        # If query mentions a client, include client data
-        if any(word in query_lower for word in ['клиент', 'фирма', 'компания']):
+        Rows are ranked by the clients, models, product types and months the query mentions
+        (looked up in the dataset indexes) and the best ones are added until the prompt's token
+        budget is spent. Whole rows are added or left out, so the context is always complete JSON.
+        The sheet summaries are not included; they come from get_static_context().
+        """
+        static_context = self.get_static_context()
+        indexes = static_context['indexes']
+        entities = extract_entities(query, indexes)
+
+        # Rank rows of every sheet and merge them, best first
+        ranked = []
+        for sheet_name, index in indexes.items():
+            ranked.extend((score, sheet_name, position) for score, position in rank_rows(index, entities))
+        ranked.sort(key=lambda item: -item[0])
+
+        # Nothing specific was asked for: fall back to a small sample of every sheet
+        if not ranked:
             for sheet_name, df in self.dataframes.items():
-                if df.empty or len(df.columns) < 1:
-                    continue
+                ranked.extend((0, sheet_name, position) for position in range(min(5, len(df))))
 
-                # Get client column (usually first column)
-                client_col = df.columns[0]
+        # Serialize the selected rows of each sheet in one go
+        positions_by_sheet = {}
+        for _, sheet_name, position in ranked:
+            positions_by_sheet.setdefault(sheet_name, []).append(position)
+        records_by_sheet = {
+            sheet_name: dict(zip(positions, frame_to_records(self.dataframes[sheet_name].iloc[positions])))
+            for sheet_name, positions in positions_by_sheet.items()
+        }
 
-                # Include a sample of client data (only first 10 rows to limit size)
-                client_sample = df.head(10)
-                # Convert to native Python types for JSON serialization
-                context_data[f"client_data_{sheet_name}"] = self._json_serializable(
-                    client_sample.to_dict(orient='records'))
+        candidates = [(f"rows_{sheet_name}", records_by_sheet[sheet_name][position])
+                      for _, sheet_name, position in ranked]
 
-        # If query mentions a specific model or product type
-        if any(word in query_lower for word in ['модел', 'продукт', 'изделие', 'артикул']):
-            for sheet_name, df in self.dataframes.items():
-                # Look for product/model columns
-                for col in df.columns:
-                    if isinstance(col, str) and any(term in str(col).lower() for term in ['модел', 'вид', 'артикул']):
-                        product_sample = df.head(10)
-                        context_data[f"product_data_{sheet_name}"] = self._json_serializable(
-                            product_sample.to_dict(orient='records'))
-                        break
-
-        # If query mentions monthly data or planning
-        if any(word in query_lower for word in ['месец', 'план', 'седмица', 'дата']):
-            # Try to find monthly columns
-            for sheet_name, df in self.dataframes.items():
-                month_cols = []
-                month_names = ['януари', 'февруари', 'март', 'април', 'май', 'юни',
-                               'юли', 'август', 'септември', 'октомври', 'ноември', 'декември']
-
-                for col in df.columns:
-                    if isinstance(col, str) and any(month in str(col).lower() for month in month_names):
-                        month_cols.append(col)
-
-                if month_cols:
-                    # Only select month columns
-                    monthly_sample = df[month_cols].head(10)
-                    context_data[f"monthly_data_{sheet_name}"] = self._json_serializable(
-                        monthly_sample.to_dict(orient='records'))
-
-        # If no specific data was included, add samples from all sheets
-        if len(context_data) <= 1:  # Only has sheet_summaries
-            for sheet_name, df in self.dataframes.items():
-                if not df.empty:
-                    sample_df = df.head(5)  # Just 5 rows to limit size
-                    context_data[f"sample_data_{sheet_name}"] = self._json_serializable(
-                        sample_df.to_dict(orient='records'))
+        token_budget = get_setting('LLM_CONTEXT_TOKEN_BUDGET', 3000) - static_context['summaries_tokens']
+        packed, used_tokens = pack_records(candidates, token_budget)
+        print(f"Context rows: {sum(len(rows) for rows in packed.values())} of {len(candidates)} candidates, "
+              f"~{used_tokens + static_context['summaries_tokens']} tokens")
+
+        context_data = {}
+        matched_entities = {kind: values for kind, values in entities.items() if values}
+        if matched_entities:
+            context_data["matched_entities"] = matched_entities
+        context_data.update(packed)
 
         return context_data
 
+    def build_messages(self, query):
+        """
+        Build the chat messages for a query, stable parts first.
+
+        The system message (instructions and sheet summaries) is identical for every query on
+        the same dataset version; the rows retrieved for the query and the question come last.
+
+        Args:
+            query (str): The user query in Bulgarian
+
+        Returns:
+            list: Messages for the chat completions API
+        """
+        static_context = self.get_static_context()
+
+        # Prepare relevant data context based on the query
+        context_data = self._prepare_data_context(query)
+
+        # Convert context data to a JSON string (safely handled for serialization)
+        try:
+            context_str = dumps_json(context_data)
+        except TypeError as e:
+            print(f"JSON serialization error: {str(e)}")
+            # Fallback to simpler context if JSON serialization fails
+            context_str = json.dumps({"error": "Could not serialize full data context"}, ensure_ascii=False)
+
+        # Prepare the user message with the query-specific data and the question at the end
+        user_message = (f"Данни от Excel файла, свързани с въпроса:\n{context_str}\n\n"
+                        f"Въпрос на потребителя: \"{query}\"")
+
+        return [
+            {"role": "system", "content": static_context['system_prompt']},
+            {"role": "user", "content": user_message}
+        ]
+
     def process_query(self, query):
         """
         Process a Bulgarian language query about production planning data.
@@ -242,54 +319,29 @@ class OpenAIExcelProcessor:
         Returns:
             dict: A dictionary with the response and success status
         """
-        if not openai.api_key:
+        if self.client is None and not api_key_configured():
             return {
                 'success': False,
                 'message': "OpenAI API ключът не е конфигуриран. Моля, проверете настройките."
             }
 
         try:
-            # Prepare relevant data context based on the query
-            context_data = self._prepare_data_context(query)
-
-            # Convert context data to a JSON string (safely handled for serialization)
-            try:
-                context_str = json.dumps(context_data, ensure_ascii=False)
-
-                # Truncate if too large to avoid token limits
-                if len(context_str) > 8000:  # Lower limit to ensure we stay within token constraints
-                    context_str = context_str[:8000] + "... [truncated]"
-            except TypeError as e:
-                print(f"JSON serialization error: {str(e)}")
-                # Fallback to simpler context if JSON serialization fails
-                context_str = json.dumps({"error": "Could not serialize full data context"}, ensure_ascii=False)
-
-            # Prepare the system message
-            system_message = """Ти си експертен асистент за анализ на данни за производство. 
-            Твоята задача е да анализираш данни от Excel таблица за планиране на производството 
-            и да отговориш на въпроси на български език. Бъди точен, професионален и ясен в отговорите си."""
-
-            # Prepare the user message with context and query
-            user_message = f"""Разполагаш със следните данни от Excel файл с информация за планиране на производството:
-
-            {context_str}
-
-            Въпрос на потребителя: "{query}"
-
-            Моля, анализирай данните и отговори на въпроса на български език. Включи релевантни числа и статистики 
-            от данните, където е възможно."""
+            self.refresh_if_changed()
 
             # Generate the response using OpenAI's API
-            response = openai.chat.completions.create(
+            response = create_chat_completion(
+                'excel_query',
+                client=self.client,
                 model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": system_message},
-                    {"role": "user", "content": user_message}
-                ],
+                messages=self.build_messages(query),
                 temperature=0.5,
                 max_tokens=500
             )
 
+            cached_tokens = record_completion_usage('excel_query', "gpt-4o-mini", response.usage)
+            if response.usage:
+                print(f"Prompt tokens: {response.usage.prompt_tokens} ({cached_tokens} cached)")
+
             # Extract the response text
             response_text = response.choices[0].message.content
 
@@ -0,0 +1,238 @@
+import os
+import time
+import random
+import logging
+import threading
+import httpx
+import openai
+from app.config import get_setting
+from app.services.metrics import metrics
+from app.services.aiScheduler import admit
+from app.services.circuitBreaker import get_circuit_breaker
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait for one response, per operation (connecting has its own, shorter limit)
+OPERATION_TIMEOUT_SETTINGS = {
+    'chat': 'OPENAI_CHAT_TIMEOUT',
+    'chat_stream': 'OPENAI_CHAT_TIMEOUT',
+    'chat_tools': 'OPENAI_CHAT_TIMEOUT',
+    'excel_query': 'OPENAI_CHAT_TIMEOUT',
+    'name_conversion': 'OPENAI_NAME_CONVERSION_TIMEOUT',
+    'transcription': 'OPENAI_TRANSCRIPTION_TIMEOUT',
+}
+
+# Backoff between retries: base * 2^attempt seconds with jitter, capped
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 8.0
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def api_key_configured():
+    """True if an OpenAI API key is set in the environment."""
+    return bool(os.environ.get('OPENAI_API_KEY'))
+
+
+def create_openai_client(api_key=None, base_url=None):
+    """
+    Create an OpenAI client with its own keep-alive connection pool.
+
+    The SDK's built-in retries are disabled; call_with_retries applies the retry policy so
+    that every attempt is timed and counted.
+
+    Args:
+        api_key (str, optional): API key, OPENAI_API_KEY by default
+        base_url (str, optional): API base URL, OPENAI_BASE_URL setting by default (e.g. a mock server)
+
+    Returns:
+        openai.OpenAI: The client
+    """
+    api_key = api_key or os.environ.get('OPENAI_API_KEY')
+    if not api_key:
+        raise ValueError("OpenAI API key not found")
+
+    max_connections = get_setting('OPENAI_MAX_CONNECTIONS', 20)
+    http_client = httpx.Client(
+        limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections,
+                            keepalive_expiry=60),
+        timeout=httpx.Timeout(get_setting('OPENAI_CHAT_TIMEOUT', 30),
+                              connect=get_setting('OPENAI_CONNECT_TIMEOUT', 5)),
+    )
+    return openai.OpenAI(
+        api_key=api_key,
+        base_url=base_url or get_setting('OPENAI_BASE_URL') or None,
+        max_retries=0,
+        http_client=http_client,
+    )
+
+
+def get_openai_client():
+    """Get the process-wide OpenAI client, creating it on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = create_openai_client()
+    return _client
+
+
+def _retry_delay(attempt, error):
+    """Seconds to wait before the next attempt; honours a short Retry-After from the server."""
+    delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt) * random.uniform(0.5, 1.0)
+    response = getattr(error, 'response', None)
+    if response is not None:
+        try:
+            retry_after = float(response.headers.get('retry-after', ''))
+            if 0 <= retry_after <= RETRY_MAX_DELAY:
+                delay = retry_after
+        except ValueError:
+            pass
+    return delay
+
+
+def _is_retryable(error):
+    """429s, 5xx responses and failed connections are retried; timeouts and other errors are not."""
+    if isinstance(error, openai.APITimeoutError):
+        return False
+    if isinstance(error, openai.APIConnectionError):
+        return True
+    return isinstance(error, openai.APIStatusError) and (error.status_code == 429 or error.status_code >= 500)
+
+
+def _upstream_health(error, capped):
+    """
+    What a failed call says about the upstream for the circuit breaker: False for timeouts,
+    failed connections, 429s and 5xx responses, None for client errors and for timeouts that
+    a request deadline cut short.
+    """
+    if isinstance(error, openai.APITimeoutError):
+        return None if capped else False
+    return False if _is_retryable(error) else None
+
+
+class _ReleasingStream:
+    def __init__(self, stream, release):
+        """
+        A streamed response that frees its scheduler slot when it ends or is closed.
+
+        Closing it closes the SDK stream (and so the HTTP response), which ends the generation
+        upstream; close() may be called more than once and from another thread than the reader.
+        """
+        self._stream = stream
+        self._iterator = iter(stream)
+        self._release = release
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self._iterator)
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        try:
+            self._stream.close()
+        finally:
+            self._release()
+
+
+def call_with_retries(operation, request, deadline=None, **kwargs):
+    """
+    Call an OpenAI endpoint with the operation's timeout and bounded exponential-backoff retries.
+
+    Every attempt first passes the circuit breaker (see circuitBreaker) and waits for admission
+    by the AI scheduler (see aiScheduler.admit); a streamed response keeps its slot until it has
+    been read. The outcome and latency of each attempt are reported to the breaker.
+
+    Args:
+        operation (str): What the call is for, e.g. 'chat' or 'transcription'; picks the timeout
+        request (callable): SDK method, e.g. client.chat.completions.create
+        deadline (Deadline, optional): Budget of the request the call belongs to; the admission wait
+            and the timeout are cut to the time left and no retry is started that cannot finish in it
+        **kwargs: Arguments of the SDK method; 'model' also labels the latency histogram
+
+    Returns:
+        The SDK response
+
+    Raises:
+        CircuitOpen: if the circuit is open, at once and without a call
+        AISchedulerBusy: if an attempt is not admitted in time
+    """
+    labels = {'operation': operation, 'model': kwargs.get('model')}
+    timeout = get_setting(OPERATION_TIMEOUT_SETTINGS.get(operation, 'OPENAI_CHAT_TIMEOUT'), 30)
+    attempts = get_setting('OPENAI_MAX_RETRIES', 2) + 1
+    upload = kwargs.get('file')
+    breaker = get_circuit_breaker()
+
+    def record(probe, success=None, elapsed=0.0):
+        if breaker is not None:
+            breaker.record(probe, success, elapsed)
+
+    for attempt in range(attempts):
+        # A retried upload has to be read from the start again
+        if attempt and hasattr(upload, 'seek'):
+            upload.seek(0)
+
+        probe = breaker.before_call() if breaker is not None else False
+        try:
+            release = admit(operation, deadline)
+        except BaseException:
+            record(probe)
+            raise
+
+        attempt_timeout = deadline.cap(timeout) if deadline else timeout
+        started = time.perf_counter()
+        try:
+            response = request(timeout=attempt_timeout, **kwargs)
+        except openai.OpenAIError as e:
+            release()
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            record(probe, _upstream_health(e, attempt_timeout < timeout), elapsed_ms / 1000)
+            status = getattr(e, 'status_code', None) or type(e).__name__
+            metrics.inc('openai_errors', labels={**labels, 'status': status})
+            metrics.observe('openai_error_latency_ms', elapsed_ms, labels=labels)
+
+            if not _is_retryable(e) or attempt == attempts - 1:
+                raise
+            delay = _retry_delay(attempt, e)
+            if deadline is not None and delay >= deadline.remaining():
+                raise
+            logger.warning(f"OpenAI {operation} call failed ({status}), retry {attempt + 1} in {delay:.2f}s")
+            metrics.inc('openai_retries', labels=labels)
+            time.sleep(delay)
+            continue
+        except BaseException:
+            release()
+            record(probe)
+            raise
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        record(probe, True, elapsed_ms / 1000)
+        metrics.observe('openai_latency_ms', elapsed_ms, labels=labels)
+        if kwargs.get('stream'):
+            return _ReleasingStream(response, release)
+        release()
+        return response
+
+
+def create_chat_completion(operation, client=None, deadline=None, **kwargs):
+    """Chat completion through the shared client (see call_with_retries)."""
+    client = client or get_openai_client()
+    return call_with_retries(operation, client.chat.completions.create, deadline, **kwargs)
+
+
+def create_transcription(operation='transcription', client=None, deadline=None, **kwargs):
+    """Audio transcription through the shared client (see call_with_retries)."""
+    client = client or get_openai_client()
+    return call_with_retries(operation, client.audio.transcriptions.create, deadline, **kwargs)
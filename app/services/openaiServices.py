@@ -1,17 +1,65 @@
-import os
+import time
 import openai
+from functools import partial
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from flask import current_app
-from pydub import AudioSegment
 from app.models.chat import Chat
 from app.models.message import Message
 from app.extensions import db
-from app.services.excelServices import ProductionPlanningProcessor
-
-openai.api_key = os.environ.get('OPENAI_API_KEY')
+from app.services.excelServices import ProductionPlanningProcessor, dataset_version
+from app.services.planningPool import run_planning_query, run_planning_intent, run_query_plan
+from app.services.followUps import load_chat_state, save_chat_state, resolve_follow_up
+from app.services.queryPlanner import run_compound_query
+from app.services.planningTools import PlanningToolbox, run_tool_conversation
+from app.services.audioServices import prepare_whisper_upload, encode_upload, merge_transcripts, NoSpeechDetected
+from app.services.audioPool import run_audio_job, AudioPoolBusy, AudioJobTimeout
+from app.services.aiScheduler import AISchedulerBusy
+from app.services.circuitBreaker import CircuitOpen, upstream_available
+from app.services.queryRouter import get_query_router, keyword_route, PROCESSOR_APOLOGIES
+from app.services.transcriptionCache import transcription_cache_key, get_cached_transcription, store_transcription
+from app.services.responseCache import CachedQuestion, get_response_cache
+from app.services.singleFlight import SingleFlight, request_key
+from app.services.deadlines import budget_stage, out_of_budget
+from app.services.speculation import (speculation_mode, speculate, record_winner, first_answer, race_first_item,
+                                      BackgroundStream)
+from app.services.metrics import metrics, record_completion_usage
+from app.services.openaiClient import api_key_configured, create_chat_completion, create_transcription
+from app.config import get_setting
 
 # Initialize the Production Planning processor
 production_processor = ProductionPlanningProcessor()
 
+# Planning data tools the LLM can call in tool-calling mode (LLM_TOOLS_ENABLED)
+planning_toolbox = PlanningToolbox(production_processor)
+
+ASSISTANT_SYSTEM_PROMPT = ("You are a helpful knitwear production assistant that responds "
+                           "to voice commands in Bulgarian. You can analyze production planning data "
+                           "related to knitting and confection. When users ask about production, clients, "
+                           "or product data, reference your ability to analyze specific files."
+                           "Always respond in Bulgarian unless explicitly asked to use another language.")
+
+TOOLS_SYSTEM_PROMPT = ("You are a helpful knitwear production assistant that responds "
+                       "to voice commands in Bulgarian. Answer questions about clients, models, monthly plans "
+                       "and factory load by calling the provided planning tools; never guess numbers that a "
+                       "tool can return. Always respond in Bulgarian unless explicitly asked to use another language.")
+
+# Previous messages sent with a fallback LLM request (the newest ones, the current question last)
+CHAT_HISTORY_LIMIT = 10
+
+# Answer length of the LLM fallback; voice requests running out of time get less (see _answer_tokens)
+LLM_MAX_TOKENS = 1000
+
+# Reply to a voice request that ran out of time when the planning processor has no answer either
+OUT_OF_TIME_RESPONSE = "Не успях да отговоря навреме. Моля, задайте въпроса по-конкретно или опитайте отново."
+
+# Reply while OpenAI is unreachable (circuit open) to a message the planning processor could not answer
+UNAVAILABLE_RESPONSE = ("Асистентът временно не е достъпен. Мога да отговарям само на въпроси "
+                        "за производствените данни - моля, опитайте отново след малко.")
+
+# An answer of the planning processor, with the intent and parameters it answered
+PlanningAnswer = namedtuple('PlanningAnswer', ['text', 'intent', 'params'])
+
 # Keywords that trigger production planning analysis (in Bulgarian)
 PRODUCTION_TRIGGER_KEYWORDS = [
     'производство', 'клиент', 'модел', 'файн', 'фирма', 'поръчка', 'изплетено',
@@ -20,75 +68,167 @@ PRODUCTION_TRIGGER_KEYWORDS = [
 ]
 
 
-def transcribeAudioUsingOpenAI(audioFilePath):
+# Identical concurrent transcriptions, name conversions and answers share one upstream call
+transcription_flights = SingleFlight('transcription')
+name_conversion_flights = SingleFlight('name_conversion')
+answer_flights = SingleFlight('answer')
+
+# Whisper request settings (Bulgarian speech); part of the transcription cache key
+TRANSCRIPTION_MODEL = "whisper-1"
+TRANSCRIPTION_LANGUAGE = "bg"
+
+NAME_CONVERSION_MODEL = "gpt-4o-mini"
+NAME_CONVERSION_PROMPT = ("You are a helpful names replacing tool which translates Bulgarian names to English."
+                          "try to replace every CLIENT and MODEL/MODELS names if they exist in the message."
+                          "Watch for triggering keywords for example {клиент, фирма, име, модел, модели, продукт, "
+                          "продукти, ...}.Do not convert the trigger word, just the name."
+                          "Return the converted message.")
+
+
+def _transcribe_upload(upload):
+    """Transcribe one upload from prepare_whisper_upload."""
+    response = create_transcription(
+        model=TRANSCRIPTION_MODEL,
+        file=encode_upload(upload),
+        language=TRANSCRIPTION_LANGUAGE
+    )
+    return response.text
+
+
+def _transcribe_uploads(uploads, overlapped=None):
+    """
+    Transcribe the uploads of a recording, chunks of long recordings in parallel.
+
+    At most AUDIO_CHUNK_PARALLELISM chunks of one recording are in flight; the transcripts are
+    joined in recording order with the words repeated across chunk overlaps removed (see
+    merge_transcripts for `overlapped`).
+    """
+    if len(uploads) == 1:
+        return _transcribe_upload(uploads[0])
+
+    app = current_app._get_current_object()
+
+    def transcribe_chunk(upload):
+        with app.app_context():
+            return _transcribe_upload(run_audio_job(encode_upload, upload))
+
+    started = time.perf_counter()
+    workers = min(len(uploads), get_setting('AUDIO_CHUNK_PARALLELISM', 4))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='transcribeChunk') as executor:
+        texts = list(executor.map(transcribe_chunk, uploads))
+
+    current_app.logger.info(f"Transcribed {len(uploads)} chunks with {workers} workers in "
+                            f"{(time.perf_counter() - started) * 1000:.0f} ms")
+    return merge_transcripts(texts, overlapped)
+
+
+def _transcribe_recording(audioData, audioFormat, cacheKey, deadline=None):
+    """
+    Prepare, transcribe and name-convert a recording that is not cached, then cache its transcript.
+
+    Whisper always runs to completion; the name conversion is optional and is skipped (and the
+    unconverted transcript not cached) when `deadline` leaves no time for it.
+    """
+    # Trim silence and split long recordings; send accepted formats as they are, convert the rest
+    try:
+        with budget_stage(deadline, 'transcode'):
+            uploads, uploadInfo = run_audio_job(prepare_whisper_upload, audioData, audioFormat)
+        current_app.logger.info(f"Whisper upload: {uploadInfo}")
+        if uploadInfo.get('trimmed_ms'):
+            current_app.logger.info(
+                f"Trimmed {uploadInfo['trimmed_ms']} of {uploadInfo['duration_ms']} ms of silence "
+                f"({len(audioData)} bytes uploaded as {uploadInfo['upload_bytes'] or 'chunks'})")
+    except (NoSpeechDetected, AudioPoolBusy, AudioJobTimeout):
+        raise
+    except Exception as e:
+        current_app.logger.error(f"Error converting audio: {str(e)}")
+        raise ValueError(f"Could not convert audio format: {str(e)}")
+
+    with budget_stage(deadline, 'whisper'):
+        text = _transcribe_uploads(uploads, uploadInfo.get('overlapped'))
+    current_app.logger.info(f"Transcription successful: {text[:100]}...")
+
+    if out_of_budget(deadline, 'VOICE_NAME_CONVERSION_MIN_BUDGET', 4):
+        deadline.degrade('skip_name_conversion', 'too little time left after Whisper')
+        return text
+
+    try:
+        with budget_stage(deadline, 'name_conversion'):
+            converted_text = convert_bg_names_to_english(text, deadline)
+    except CircuitOpen as e:
+        current_app.logger.warning(f"Skipping name conversion: {str(e)}")
+        return text
+    except (openai.APITimeoutError, AISchedulerBusy) as e:
+        if deadline is None:
+            raise
+        deadline.degrade('skip_name_conversion', f"name conversion did not finish in time: {str(e)}")
+        return text
+
+    if converted_text:
+        store_transcription(cacheKey, converted_text)
+    return converted_text
+
+
+def transcribeAudioUsingOpenAI(audioData, audioFormat=None, deadline=None):
     """
         Transcribe audio using OpenAI's Whisper API.
 
+        The recording stays in memory: conversion and upload work on buffers, so concurrent
+        requests cannot overwrite each other's audio and nothing is left on disk.
+
         Args:
-            audio_file_path (str): Path to the audio file to transcribe
+            audioData (bytes): The recording
+            audioFormat (str, optional): Format of the recording, e.g. 'webm' or 'wav'
+            deadline (Deadline, optional): Latency budget of the voice request (see deadlines)
 
         Returns:
             str: Transcribed text
+
+        Raises:
+            NoSpeechDetected: if the recording is silent (no API call is made)
+            AudioPoolBusy: if the audio workers are saturated (see audioPool)
+            AudioJobTimeout: if preparing the recording runs past AUDIO_JOB_TIMEOUT
+            AISchedulerBusy: if the Whisper or name-conversion call was not admitted (see aiScheduler)
+            CircuitOpen: if OpenAI is unreachable and Whisper is not called (see circuitBreaker)
     """
 
     try:
-        if not openai.api_key:
+        if not api_key_configured():
             raise ValueError("OpenAI API key not found")
 
-        if not os.path.isfile(audioFilePath):
-            raise FileNotFoundError(f"Audio file not found at {audioFilePath}")
-
-        fileSize = os.path.getsize(audioFilePath)
-        fileExt = os.path.splitext(audioFilePath)[1].lower()
-        current_app.logger.info(f"Original audio file: {audioFilePath}, Size: {fileSize} bytes, Format: {fileExt}")
+        if not audioData:
+            raise ValueError("Audio data is empty")
 
-        # Convert to MP3
-        convertedFilePath = audioFilePath.replace(fileExt, '.mp3')
-        current_app.logger.info(f"Converting audio from {fileExt} to .mp3")
+        current_app.logger.info(f"Original audio: {len(audioData)} bytes, Format: {audioFormat}")
 
-        try:
-            # Load the audio file
-            audio = AudioSegment.from_file(audioFilePath)
-
-            # Export as MP3
-            audio.export(convertedFilePath, format="mp3")
+        # A replayed or retried upload of the same recording costs no API calls
+        cacheKey = transcription_cache_key(audioData, TRANSCRIPTION_MODEL, TRANSCRIPTION_LANGUAGE,
+                                           NAME_CONVERSION_MODEL, NAME_CONVERSION_PROMPT)
+        cached = get_cached_transcription(cacheKey)
+        if cached is not None:
+            current_app.logger.info(f"Transcription served from cache: {cached[:100]}...")
+            return cached
 
-            # Use the converted file path for transcription
-            audioFilePath = convertedFilePath
-            current_app.logger.info(
-                f"Converted audio file: {audioFilePath}, Size: {os.path.getsize(audioFilePath)} bytes")
-        except Exception as e:
-            current_app.logger.error(f"Error converting audio: {str(e)}")
-            raise ValueError(f"Could not convert audio format: {str(e)}")
-
-        with open(audioFilePath, 'rb') as audioFile:
-            # Specify Bulgarian language
-            response = openai.audio.transcriptions.create(
-                model="whisper-1",
-                file=audioFile,
-                language="bg"
-            )
-
-        text = response.text
-        converted_text = convert_bg_names_to_english(text)
-        current_app.logger.info(f"Transcription successful: {text[:100]}...")
-        return converted_text
+        # Uploads of the same recording arriving together (client retries) share one transcription
+        return transcription_flights.run(cacheKey, _transcribe_recording, audioData, audioFormat, cacheKey, deadline)
+    except NoSpeechDetected as e:
+        current_app.logger.info(f"Skipping transcription: {str(e)}")
+        raise
+    except (AudioPoolBusy, AudioJobTimeout, AISchedulerBusy, CircuitOpen) as e:
+        current_app.logger.warning(f"Rejecting recording: {str(e)}")
+        raise
     except Exception as e:
         current_app.logger.error(f"Error transcribing audio: {str(e)}")
-
-        # Clean up the converted file if it was created
-        if 'convertedFilePath' in locals() and convertedFilePath and os.path.exists(convertedFilePath):
-            os.remove(convertedFilePath)
-
         return
 
 
-def convert_bg_names_to_english(message):
+def convert_bg_names_to_english(message, deadline=None):
     """
     Convert Bulgarian names to English using a custom translation service.
 
     Args:
         message (str): The Bulgarian name to translate
+        deadline (Deadline, optional): Latency budget of the request; bounds the call's timeout
 
     Returns:
         str: The English translation of the Bulgarian name
@@ -96,23 +236,16 @@ def convert_bg_names_to_english(message):
     # For demonstration purposes, let's just return the name as it is
 
     # Format messages for OpenAI
-    tool_instructions = {"role": "system",
-                 "content": "You are a helpful names replacing tool which translates Bulgarian names to English."
-                            "try to replace every CLIENT and MODEL/MODELS names if they exist in the message."
-                            "Watch for triggering keywords for example {клиент, фирма, име, модел, модели, продукт, "
-                            "продукти, ...}.Do not convert the trigger word, just the name."
-                            "Return the converted message."}
+    tool_instructions = {"role": "system", "content": NAME_CONVERSION_PROMPT}
 
     user_message = {"role": "user", "content": message}
     formatted_messages = [tool_instructions, user_message]
 
     # Use the GPT-3 model to generate the response
-    response = openai.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=formatted_messages,
-        temperature=0.5,
-        max_tokens=100,
-    )
+    request = dict(model=NAME_CONVERSION_MODEL, messages=formatted_messages, temperature=0.5, max_tokens=100)
+    response = name_conversion_flights.run(request_key(request), create_chat_completion, 'name_conversion',
+                                           deadline=deadline, **request)
+    record_completion_usage('name_conversion', NAME_CONVERSION_MODEL, response.usage)
     converted_text = response.choices[0].message.content
 
     return converted_text
@@ -128,130 +261,426 @@ def should_process_production_planning(user_message):
     Returns:
         bool: True if the message should trigger production planning processing
     """
+    return route_query(user_message) != 'llm'
+
+
+def planning_keyword_count(user_message):
+    """How many production planning trigger keywords the message contains."""
     message_lower = user_message.lower()
+    return sum(1 for keyword in PRODUCTION_TRIGGER_KEYWORDS if keyword.lower() in message_lower)
 
-    # Count how many trigger keywords are in the message
-    keyword_count = sum(1 for keyword in PRODUCTION_TRIGGER_KEYWORDS if keyword.lower() in message_lower)
 
-    # If at least 2 keywords are present, it's likely about production planning
-    return keyword_count >= 1  # Lowered threshold to make detection more sensitive
+def route_query(user_message):
+    """
+    Decide who answers a message: 'planning' (the processor), 'llm' or 'both' (see _speculative).
+
+    The router trained by `manage.py train_router` decides when there is one; without it a message
+    with a trigger keyword goes to the processor and any other to the LLM.
+    """
+    router = get_query_router()
+    if router is None:
+        return keyword_route(planning_keyword_count(user_message))
+    return router.route(user_message)
 
 
-def generateResponse(userMessage, chatId=None):
+def _speculative(userMessage):
     """
-        Generate a response using OpenAI's GPT API and store in chat history.
+    True if the LLM should start next to the planning processor for this message.
+
+    A message the router sends to both is borderline (without a router: a message with a single
+    trigger keyword): the processor often cannot answer it and the LLM would then run after it.
+    SPECULATIVE_MODE 'borderline' overlaps the two for such messages, 'always' for every planning
+    message; the LLM answer not used is still paid for.
+    """
+    mode = speculation_mode()
+    # Nothing to race while OpenAI calls are rejected
+    if mode == 'off' or not upstream_available():
+        return False
+
+    if mode == 'always':
+        return route_query(userMessage) != 'llm'
+    if get_query_router() is None:
+        return planning_keyword_count(userMessage) == 1
+    return route_query(userMessage) == 'both'
+
+
+def _get_or_create_chat(userMessage, chatId=None):
+    """Get an existing chat, or create one titled after the user's message."""
+    chat = None
+    if chatId:
+        chat = Chat.query.get(chatId)
+
+    if not chat:
+        # Create a new chat
+        try:
+            chat = Chat(title=userMessage[:50] + "..." if len(userMessage) > 50 else userMessage)
+            db.session.add(chat)
+            db.session.commit()
+            current_app.logger.info(f"Created new chat with ID {chat.id}")
+        except Exception as e:
+            current_app.logger.error(f"Error creating chat: {str(e)}")
+            db.session.rollback()
+            raise ValueError(f"Could not create chat: {str(e)}")
+
+    return chat
+
+
+def _add_message(chat, role, content):
+    """Add a message to the chat history; assistant messages also update the chat timestamp."""
+    try:
+        db.session.add(Message(chatId=chat.id, role=role, content=content))
+        if role == "assistant":
+            chat.updatedAt = db.func.now()
+        db.session.commit()
+    except Exception as e:
+        current_app.logger.error(f"Error adding {role} message to chat: {str(e)}")
+        db.session.rollback()
+        raise ValueError(f"Could not add {role} message to chat: {str(e)}")
+
+
+def _start_response(userMessage, chatId=None):
+    """Check the API key, get or create the chat and store the user's message in it."""
+    # Check if API key is configured
+    if not api_key_configured():
+        raise ValueError("OpenAI API key not found")
+
+    chat = _get_or_create_chat(userMessage, chatId)
+    _add_message(chat, "user", userMessage)
+    return chat
+
+
+def _planning_response(userMessage, chatId=None):
+    """
+    Answer the message with the production planning processor.
+
+    A follow-up of the chat's previous planning question ('а за февруари?') is merged with it
+    (see resolve_follow_up) and a question listing several clients or months split into
+    sub-queries (see plan_query, run in the planning pool when it is enabled); both are answered
+    without routing. Each answer becomes the chat's state for the next follow-up.
 
     Args:
-        user_message (str): The user's message to respond to
-        chat_id (int, optional): The ID of an existing chat to continue, or None to create a new chat
+        userMessage (str): The user's message
+        chatId (int, optional): The chat the message belongs to
 
     Returns:
-        tuple: (response_text, chat_id) - The generated response and the chat ID
+        PlanningAnswer: The processor's answer, or None if the message is not a planning request or
+        the processor could not answer it (the caller falls back to the LLM). The caller passes the
+        answer it uses to _use_planning_answer, so only an answer the user gets becomes the chat's state
     """
+    # Process the request with production planning processor
+    route = 'unrouted'
+    try:
+        followUp = resolve_follow_up(production_processor, userMessage, load_chat_state(chatId))
+        subQueries = run_query_plan(production_processor, userMessage) if followUp is None else None
+        if followUp is not None:
+            route = 'follow_up'
+            current_app.logger.info(f"Resolved follow-up '{userMessage}' as {followUp[0]}: {followUp[1]}")
+        elif subQueries:
+            route = 'compound'
+            current_app.logger.info(f"Split '{userMessage}' into {len(subQueries)} sub-queries")
+        else:
+            # Check if the user is requesting production planning data analysis
+            route = route_query(userMessage)
+            metrics.inc('query_routes', labels={'route': route,
+                                                'keywords': keyword_route(planning_keyword_count(userMessage))})
+            if route == 'llm':
+                return None
 
+            current_app.logger.info(f"Detected production planning request: {userMessage}")
+
+        # This is the important call to process the query (in the worker pool when enabled)
+        if followUp is not None:
+            production_response = run_planning_intent(production_processor, *followUp)
+        elif subQueries:
+            production_response = run_compound_query(production_processor, subQueries)
+        else:
+            production_response = run_planning_query(production_processor, userMessage)
+
+        # If successful, use the response
+        if production_response and production_response.get('success'):
+            response_text = production_response.get('message', 'Анализът е завършен.')
+            current_app.logger.info(f"Production planning response generated: {response_text[:100]}...")
+            return PlanningAnswer(response_text, production_response.get('intent_type'),
+                                  production_response.get('params'))
+
+        # Log the failure reason
+        failure_reason = production_response.get('message') if production_response else "Unknown error"
+        current_app.logger.warning(f"Production planning processing failed: {failure_reason}")
+    except Exception as e:
+        current_app.logger.error(f"Error processing production planning query: {str(e)}")
+        # Continue with normal response generation if production planning processing fails
+
+    # The LLM answers after the processor: a fallback the router is trained to avoid
+    metrics.inc('planning_fallbacks', labels={'route': route})
+    return None
 
-    try:
-        # Check if API key is configured
-        if not openai.api_key:
-            raise ValueError("OpenAI API key not found")
 
-        # Get or create chat
-        chat = None
-        if chatId:
-            chat = Chat.query.get(chatId)
-
-        if not chat:
-            # Create a new chat
-            try:
-                chat = Chat(title=userMessage[:50] + "..." if len(userMessage) > 50 else userMessage)
-                db.session.add(chat)
-                db.session.commit()
-                current_app.logger.info(f"Created new chat with ID {chat.id}")
-            except Exception as e:
-                current_app.logger.error(f"Error creating chat: {str(e)}")
-                db.session.rollback()
-                raise ValueError(f"Could not create chat: {str(e)}")
-
-        # Add user message to chat history
+def _deterministic_response(userMessage, deadline, reason):
+    """
+    Answer a voice request that has no time left for the LLM with the planning processor.
+
+    The processor answers any message, also one without planning keywords, from the data alone;
+    OUT_OF_TIME_RESPONSE is the reply when it fails.
+    """
+    deadline.degrade('processor_answer', reason)
+    with budget_stage(deadline, 'planning'):
         try:
-            userMsg = Message(chatId=chat.id, role="user", content=userMessage)
-            db.session.add(userMsg)
-            db.session.commit()
+            production_response = run_planning_query(production_processor, userMessage)
+            if production_response and production_response.get('success'):
+                return production_response.get('message', 'Анализът е завършен.')
         except Exception as e:
-            current_app.logger.error(f"Error adding user message to chat: {str(e)}")
-            db.session.rollback()
-            raise ValueError(f"Could not add user message to chat: {str(e)}")
+            current_app.logger.error(f"Error processing production planning query: {str(e)}")
+    return OUT_OF_TIME_RESPONSE
 
-        # Check if the user is requesting production planning data analysis
-        if should_process_production_planning(userMessage):
-            current_app.logger.info(f"Detected production planning request: {userMessage}")
 
-            # Process the request with production planning processor
-            try:
-                # This is the important call to process the query
-                production_response = production_processor.process_query(userMessage)
+def _answer_tokens(deadline):
+    """max_tokens of an LLM answer: LLM_MAX_TOKENS, or what the model can generate in the time left of `deadline`."""
+    if deadline is None:
+        return LLM_MAX_TOKENS
 
-                # If successful, use the response
-                if production_response and production_response.get('success'):
-                    response_text = production_response.get('message', 'Анализът е завършен.')
+    tokens = int(deadline.remaining() * get_setting('VOICE_LLM_TOKENS_PER_SECOND', 60))
+    if tokens >= LLM_MAX_TOKENS:
+        return LLM_MAX_TOKENS
+    deadline.degrade('cap_max_tokens', f"answer capped at {tokens} tokens")
+    return tokens
 
-                    # Add the response to chat history
-                    assistantMsg = Message(chatId=chat.id, role="assistant", content=response_text)
-                    db.session.add(assistantMsg)
-                    chat.updatedAt = db.func.now()
-                    db.session.commit()
 
-                    current_app.logger.info(f"Production planning response generated: {response_text[:100]}...")
+def _planning_answer(userMessage, deadline=None, chatId=None):
+    """_planning_response, timed against the request's budget."""
+    with budget_stage(deadline, 'planning'):
+        return _planning_response(userMessage, chatId)
 
-                    # Return the production planning response
-                    return response_text, chat.id
-                else:
-                    # Log the failure reason
-                    failure_reason = production_response.get('message') if production_response else "Unknown error"
-                    current_app.logger.warning(f"Production planning processing failed: {failure_reason}")
-            except Exception as e:
-                current_app.logger.error(f"Error processing production planning query: {str(e)}")
-                # Continue with normal response generation if production planning processing fails
-
-        # Fall back to OpenAI GPT
-        # Get chat history for context (limited to last 10 messages)
-        chatMessages = Message.query.filter_by(chatId=chat.id).order_by(Message.createdAt.asc()).limit(10).all()
-
-        # Format messages for OpenAI
-        messages = [{"role": "system",
-                     "content": "You are a helpful knitwear production assistant that responds "
-                                "to voice commands in Bulgarian. You can analyze production planning data "
-                                "related to knitting and confection. When users ask about production, clients, "
-                                "or product data, reference your ability to analyze specific files."
-                                "Always respond in Bulgarian unless explicitly asked to use another language."}, ]
-        for msg in chatMessages:
-            messages.append({"role": msg.role, "content": msg.content})
-
-        # Log the conversation context
+
+def _use_planning_answer(chatId, answer):
+    """
+    Take the processor's answer as the reply: it becomes the chat's state for follow-ups.
+
+    Returns:
+        str: The answer's text
+    """
+    if not answer.text.startswith(PROCESSOR_APOLOGIES):
+        save_chat_state(chatId, answer.intent, answer.params)
+    return answer.text
+
+
+def _recent_messages(chatId, limit=CHAT_HISTORY_LIMIT):
+    """The newest messages of a chat, oldest first, as plain role/content dicts."""
+    chatMessages = (Message.query.filter_by(chatId=chatId)
+                    .order_by(Message.createdAt.desc(), Message.id.desc())
+                    .limit(limit).all())
+    return [{"role": msg.role, "content": msg.content} for msg in reversed(chatMessages)]
+
+
+def load_chat_history(chatId):
+    """
+    Look up a chat and the history a new message would be answered with.
+
+    Only plain values are returned, so the lookup can run in another thread than the answer.
+
+    Returns:
+        tuple: (chat_id, history) - (None, None) if there is no such chat
+    """
+    chat = Chat.query.get(chatId) if chatId else None
+    if not chat:
+        return None, None
+
+    # One slot is left for the message that is about to be added
+    return chat.id, _recent_messages(chat.id, CHAT_HISTORY_LIMIT - 1)
+
+
+def _build_chat_messages(chat, toolsEnabled, chatMessages=None):
+    """
+    Format the system prompt and the chat history for OpenAI.
+
+    Args:
+        chat (Chat): The chat being answered
+        toolsEnabled (bool): Whether the tool-calling system prompt is used
+        chatMessages (list, optional): History already loaded (see load_chat_history), ending with the
+            user's question; read from the database when None
+    """
+    # Get chat history for context: the newest messages, oldest first, ending with the user's question
+    if chatMessages is None:
+        chatMessages = _recent_messages(chat.id)
+
+    # The constant system prompt first keeps the prompt prefix cacheable
+    messages = [{"role": "system", "content": TOOLS_SYSTEM_PROMPT if toolsEnabled else ASSISTANT_SYSTEM_PROMPT}]
+    messages.extend(chatMessages[-CHAT_HISTORY_LIMIT:])
+
+    # Log the conversation context
+    current_app.logger.info(
+        f"Generating response for chat {chat.id} with {len(messages) - 1} previous messages")
+    return messages
+
+
+def _tool_response(messages, maxTokens=LLM_MAX_TOKENS, deadline=None):
+    """Answer with the tool-calling loop: the model looks up planning data through local tools."""
+    responseText, usage = run_tool_conversation(
+        messages,
+        planning_toolbox,
+        partial(create_chat_completion, 'chat_tools', deadline=deadline),
+        model="gpt-4o-mini",
+        max_tokens=maxTokens,
+        temperature=0.7,
+    )
+    current_app.logger.info(f"Tool-calling response used {usage}")
+    return responseText
+
+
+def _with_question(history, userMessage):
+    """Prefetched history plus the message being answered, or None if there is no prefetched history."""
+    if history is None:
+        return None
+    return history + [{"role": "user", "content": userMessage}]
+
+
+def _cached_question(userMessage, messages, toolsEnabled):
+    """
+    Response cache address of a question, or None when the cache does not apply.
+
+    Only questions that open a conversation are cached: with earlier messages the answer
+    depends on more than the question itself.
+    """
+    # The system prompt and the question itself
+    if len(messages) != 2 or get_response_cache() is None:
+        return None
+
+    try:
+        _, entities = production_processor.detect_query_intent(userMessage)
+    except Exception as e:
+        current_app.logger.warning(f"Not caching the response, entities not resolved: {str(e)}")
+        return None
+
+    return CachedQuestion(userMessage, dataset_version(production_processor.file_path),
+                          'tools' if toolsEnabled else 'chat', entities)
+
+
+def _cached_response(question):
+    """The cached LLM answer to a question from _cached_question, or None."""
+    if question is None:
+        return None
+    responseText = get_response_cache().get(question)
+    if responseText is not None:
+        current_app.logger.info(f"Response served from cache for '{question.text}'")
+    return responseText
+
+
+def _cache_response(question, responseText):
+    if question is not None:
+        get_response_cache().set(question, responseText)
+
+
+def _answer_key(question, messages, toolsEnabled, maxTokens=LLM_MAX_TOKENS):
+    """
+    Key under which identical concurrent LLM answers are shared: the cache address when there is
+    one; answers shortened for a deadline are only shared with requests getting the same length.
+    """
+    if question is not None and maxTokens == LLM_MAX_TOKENS:
+        return question.key
+    return request_key(messages, toolsEnabled, maxTokens)
+
+
+def _llm_response(messages, toolsEnabled, maxTokens=LLM_MAX_TOKENS, deadline=None):
+    """Answer with the LLM: the tool-calling loop or a single chat completion."""
+    if toolsEnabled:
+        return _tool_response(messages, maxTokens, deadline)
+
+    # Generate a response using OpenAI's GPT API'
+    response = create_chat_completion(
+        'chat',
+        deadline=deadline,
+        model="gpt-4o-mini",
+        messages=messages,
+        max_tokens=maxTokens,
+        temperature=0.7,
+    )
+
+    cachedTokens = record_completion_usage('chat', "gpt-4o-mini", response.usage)
+    if response.usage:
         current_app.logger.info(
-            f"Generating response for chat {chat.id} with {len(messages) - 1} previous messages")
+            f"Prompt tokens: {response.usage.prompt_tokens} ({cachedTokens} cached)")
+    return response.choices[0].message.content
+
+
+def _llm_answer(userMessage, question, messages, toolsEnabled, deadline=None):
+    """
+    Answer with the LLM within the request's budget, caching full-length answers.
+
+    A voice request with too little time left, or whose LLM call is not admitted or does not
+    finish in time, gets the planning processor's answer instead (see _deterministic_response);
+    while the OpenAI circuit is open the answer is UNAVAILABLE_RESPONSE, without waiting.
+    """
+    if out_of_budget(deadline, 'VOICE_LLM_MIN_BUDGET', 1.5):
+        return _deterministic_response(userMessage, deadline, 'no time left for the LLM')
+
+    maxTokens = _answer_tokens(deadline)
+    try:
+        with budget_stage(deadline, 'llm'):
+            # The same question asked by several users at once is answered once
+            responseText = answer_flights.run(_answer_key(question, messages, toolsEnabled, maxTokens),
+                                              _llm_response, messages, toolsEnabled, maxTokens, deadline)
+    except CircuitOpen as e:
+        current_app.logger.warning(f"Not asking the LLM: {str(e)}")
+        return UNAVAILABLE_RESPONSE
+    except (openai.APITimeoutError, AISchedulerBusy) as e:
+        if deadline is None:
+            raise
+        return _deterministic_response(userMessage, deadline, f"LLM did not answer in time: {str(e)}")
+
+    if maxTokens == LLM_MAX_TOKENS:
+        _cache_response(question, responseText)
+    return responseText
+
+
+def _fallback_answer(userMessage, question, messages, toolsEnabled, deadline=None):
+    """The answer when the planning processor has none: the cached LLM answer, else a new one (see _llm_answer)."""
+    responseText = _cached_response(question)
+    if responseText is None:
+        responseText = _llm_answer(userMessage, question, messages, toolsEnabled, deadline)
+    return responseText
+
+
+def generateResponse(userMessage, chatId=None, history=None, deadline=None):
+    """
+        Generate a response using OpenAI's GPT API and store in chat history.
+
+    Args:
+        user_message (str): The user's message to respond to
+        chat_id (int, optional): The ID of an existing chat to continue, or None to create a new chat
+        history (list, optional): The chat's history from load_chat_history, to skip reading it again
+        deadline (Deadline, optional): Latency budget of a voice request; the LLM answer is shortened
+            or replaced by the planning processor's as it runs out (see _llm_answer)
 
-        # Generate a response using OpenAI's GPT API'
-        response = openai.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=messages,
-            max_tokens=1000,
-            temperature=0.7,
-        )
+    Returns:
+        tuple: (response_text, chat_id) - The generated response and the chat ID
+    """
+    try:
+        chat = _start_response(userMessage, chatId)
+        toolsEnabled = get_setting('LLM_TOOLS_ENABLED', False)
+
+        if _speculative(userMessage):
+            # Borderline question: the processor and the LLM work on it at once, the first acceptable
+            # answer is used (see _speculative)
+            messages = _build_chat_messages(chat, toolsEnabled, _with_question(history, userMessage))
+            question = _cached_question(userMessage, messages, toolsEnabled)
+            winner, answer = first_answer(
+                speculate(_planning_answer, userMessage, deadline, chat.id),
+                speculate(_fallback_answer, userMessage, question, messages, toolsEnabled, deadline))
+            responseText = _use_planning_answer(chat.id, answer) if winner == 'processor' else answer
+        else:
+            planned = _planning_answer(userMessage, deadline, chat.id)
+            if planned is not None:
+                responseText = _use_planning_answer(chat.id, planned)
+                _add_message(chat, "assistant", responseText)
+                return responseText, chat.id
+
+            # Fall back to OpenAI GPT
+            messages = _build_chat_messages(chat, toolsEnabled, _with_question(history, userMessage))
+            question = _cached_question(userMessage, messages, toolsEnabled)
+            responseText = _fallback_answer(userMessage, question, messages, toolsEnabled, deadline)
 
-        responseText = response.choices[0].message.content
         current_app.logger.info(f"Generated response: {responseText[:100]}...")
 
-        assistantMsg = Message(chatId=chat.id, role="assistant", content=responseText)
-        try:
-            db.session.add(assistantMsg)
-            # Update chat timestamp
-            chat.updatedAt = db.func.now()
-            db.session.commit()
-        except Exception as e:
-            current_app.logger.error(f"Error adding assistant message to chat: {str(e)}")
-            db.session.rollback()
-            raise ValueError(f"Could not add assistant message to chat: {str(e)}")
+        _add_message(chat, "assistant", responseText)
 
         current_app.logger.info(f"Response generated for chat {chat.id}: {responseText[:100]}...")
         return responseText, chat.id
@@ -260,3 +689,186 @@ def generateResponse(userMessage, chatId=None):
         current_app.logger.error(f"Error generating response: {str(e)}")
         raise
 
+
+def _stream_completion(messages, maxTokens=LLM_MAX_TOKENS, deadline=None, on_open=None):
+    """
+    Yield the text pieces of a streamed chat completion as they arrive.
+
+    on_open, if given, receives the completion stream as soon as it is open, so another thread
+    can close it (see speculation.BackgroundStream).
+    """
+    stream = create_chat_completion(
+        'chat_stream',
+        deadline=deadline,
+        model="gpt-4o-mini",
+        messages=messages,
+        max_tokens=maxTokens,
+        temperature=0.7,
+        stream=True,
+        stream_options={"include_usage": True},
+    )
+
+    if on_open is not None:
+        on_open(stream)
+
+    try:
+        for chunk in stream:
+            # The last chunk carries the usage and no choices
+            if chunk.usage:
+                record_completion_usage('chat_stream', "gpt-4o-mini", chunk.usage)
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    finally:
+        # An abandoned stream closes its HTTP response, which stops the generation upstream
+        stream.close()
+
+
+def _join_answer(flightKey):
+    """
+    Join the streamed LLM answer in flight for `flightKey`, or lead a new one.
+
+    A leader whose planning processor won the race (see race_first_item) finishes the flight
+    with None; its followers then ask again instead of taking an answer meant for another chat.
+
+    Returns:
+        tuple: (future, None) for a leader, which must finish the flight, or (None, answer) for a follower
+    """
+    while True:
+        future, leader = answer_flights.begin(flightKey)
+        if leader:
+            return future, None
+        answer = future.result()
+        if answer is not None:
+            return None, answer
+
+
+def generateResponseStream(userMessage, chatId=None, history=None, deadline=None):
+    """
+    Generate a response like generateResponse, yielding the text as the model produces it.
+
+    Planning processor and tool-calling answers are complete before anything can be sent and
+    arrive as a single piece. The assembled response is stored in the chat history at the end.
+
+    For a borderline question (see _speculative) the processor and the LLM stream start at once;
+    the processor's answer is used if it has one before the first streamed token arrives (and the
+    stream is closed), otherwise the processor's result is discarded.
+
+    Args:
+        userMessage (str): The user's message to respond to
+        chatId (int, optional): The ID of an existing chat to continue, or None to create a new chat
+        history (list, optional): The chat's history from load_chat_history, to skip reading it again
+        deadline (Deadline, optional): Latency budget of a voice request (see generateResponse)
+
+    Yields:
+        tuple: (event, data) - ('chat', {'chatId'}) first, then ('token', {'text'}) pieces and
+        finally ('done', {'response', 'chatId'})
+    """
+    started = time.perf_counter()
+    try:
+        chat = _start_response(userMessage, chatId)
+        yield 'chat', {'chatId': chat.id}
+
+        source = 'planning'
+        toolsEnabled = get_setting('LLM_TOOLS_ENABLED', False)
+        # Tool-calling answers are not streamed, so there is no first token to race against
+        planning = None
+        if not toolsEnabled and _speculative(userMessage):
+            planning = speculate(_planning_answer, userMessage, deadline, chat.id)
+            responseText = None
+        else:
+            planned = _planning_answer(userMessage, deadline, chat.id)
+            responseText = None if planned is None else _use_planning_answer(chat.id, planned)
+
+        if responseText is None:
+            messages = _build_chat_messages(chat, toolsEnabled, _with_question(history, userMessage))
+            question = _cached_question(userMessage, messages, toolsEnabled)
+            responseText = _cached_response(question)
+
+            if responseText is not None:
+                source = 'cache'
+            elif out_of_budget(deadline, 'VOICE_LLM_MIN_BUDGET', 1.5):
+                source = 'processor'
+                responseText = _deterministic_response(userMessage, deadline, 'no time left for the LLM')
+            else:
+                # The same question asked by several users at once is answered once; the others
+                # get the finished answer in one piece
+                maxTokens = _answer_tokens(deadline)
+                flightKey = _answer_key(question, messages, toolsEnabled, maxTokens)
+                future, responseText = _join_answer(flightKey)
+                if future is None:
+                    source = 'coalesced'
+                else:
+                    pieces = []
+                    try:
+                        with budget_stage(deadline, 'llm'):
+                            if toolsEnabled:
+                                source = 'tools'
+                                responseText = _tool_response(messages, maxTokens, deadline)
+                            else:
+                                source = 'llm'
+                                if planning is None:
+                                    stream = _stream_completion(messages, maxTokens, deadline)
+                                else:
+                                    stream = BackgroundStream(_stream_completion, messages, maxTokens, deadline)
+                                    planned = race_first_item(planning, stream)
+                                    planning = None
+                                    if planned is not None:
+                                        source = 'planning'
+                                        responseText = _use_planning_answer(chat.id, planned)
+                                if source == 'llm':
+                                    try:
+                                        for text in stream:
+                                            if not pieces:
+                                                metrics.observe('chat_ttft_ms',
+                                                                (time.perf_counter() - started) * 1000,
+                                                                labels={'source': source})
+                                            pieces.append(text)
+                                            yield 'token', {'text': text}
+                                    finally:
+                                        stream.close()
+                                    responseText = ''.join(pieces)
+                    except CircuitOpen as e:
+                        if pieces:
+                            answer_flights.finish(flightKey, future, error=e)
+                            raise
+                        current_app.logger.warning(f"Not asking the LLM: {str(e)}")
+                        source = 'unavailable'
+                        responseText = UNAVAILABLE_RESPONSE
+                    except (openai.APITimeoutError, AISchedulerBusy) as e:
+                        # Nothing sent yet: a voice request still gets an answer in time
+                        if deadline is None or pieces:
+                            answer_flights.finish(flightKey, future, error=e)
+                            raise
+                        source = 'processor'
+                        responseText = _deterministic_response(userMessage, deadline,
+                                                               f"LLM did not answer in time: {str(e)}")
+                    except BaseException as e:
+                        answer_flights.finish(flightKey, future, error=e)
+                        raise
+                    # Only an LLM answer is shared: the processor's may depend on this chat's state
+                    answer_flights.finish(flightKey, future, result=None if source == 'planning' else responseText)
+                if maxTokens == LLM_MAX_TOKENS and source not in ('processor', 'planning', 'unavailable'):
+                    _cache_response(question, responseText)
+
+        if planning is not None:
+            # The answer came without a stream to race against (cache, shared answer, no time left): the
+            # processor's answer is still preferred
+            planned = planning.result() if planning.exception() is None else None
+            record_winner('processor' if planned is not None else 'llm')
+            if planned is not None:
+                source = 'planning'
+                responseText = _use_planning_answer(chat.id, planned)
+
+        if source != 'llm':
+            metrics.observe('chat_ttft_ms', (time.perf_counter() - started) * 1000, labels={'source': source})
+            yield 'token', {'text': responseText}
+
+        _add_message(chat, "assistant", responseText)
+
+        current_app.logger.info(f"Streamed response for chat {chat.id} in "
+                                f"{(time.perf_counter() - started) * 1000:.0f} ms: {responseText[:100]}...")
+        yield 'done', {'response': responseText, 'chatId': chat.id}
+
+    except Exception as e:
+        current_app.logger.error(f"Error generating response: {str(e)}")
+        raise
@@ -0,0 +1,235 @@
+import os
+import atexit
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from flask import Flask, current_app
+from app.config import get_setting
+from app.services.excelServices import ProductionPlanningProcessor
+
+# Sheets every planning query reads; loaded once when a worker starts
+WARM_SHEETS = ['pletene', 'confekcia', 'za pletene po fainove']
+
+# Processor owned by the current worker process (set by _init_worker)
+_worker_processor = None
+
+
+def _init_worker(file_path):
+    """Create the worker's processor and load the planning sheets into its cache."""
+    global _worker_processor
+
+    # The processor logs through current_app, so the worker needs an app context of its own
+    Flask('planningWorker').app_context().push()
+
+    _worker_processor = ProductionPlanningProcessor(file_path)
+    _worker_processor.refresh_if_changed()
+    for sheet_name in WARM_SHEETS:
+        try:
+            _worker_processor.get_clean_sheet(sheet_name)
+        except Exception as e:
+            print(f"Could not warm sheet '{sheet_name}' in worker {os.getpid()}: {str(e)}")
+
+
+def _run_query(query):
+    """Run a planning query on the worker's processor."""
+    # Every task first drops the sheets of a workbook edited since they were loaded
+    _worker_processor.refresh_if_changed()
+    return _worker_processor.process_query(query)
+
+
+def _run_intent(intent_type, params):
+    """Answer a resolved intent on the worker's processor."""
+    _worker_processor.refresh_if_changed()
+    return _worker_processor.process_intent(intent_type, params)
+
+
+def _run_plan(message, limit):
+    """Split a compound question (queryPlanner.plan_query) with the worker's client list."""
+    # Imported here: queryPlanner answers its sub-queries through this module
+    from app.services.queryPlanner import plan_query
+    _worker_processor.refresh_if_changed()
+    return plan_query(_worker_processor, message, limit)
+
+
+def _ping():
+    """No-op task used to make the executor start its workers."""
+    return os.getpid()
+
+
+class PlanningPoolBusy(Exception):
+    """Raised when the pool already holds as many queries as it is allowed to queue."""
+
+
+class PlanningPool:
+    def __init__(self, file_path=None, workers=2, max_pending=8, timeout=15.0):
+        """
+        Run ProductionPlanningProcessor queries in warm worker processes.
+
+        Args:
+            file_path (str, optional): Excel file the workers load, None for the default lookup
+            workers (int): Number of worker processes
+            max_pending (int): Queries allowed to wait for a free worker before new ones are rejected
+            timeout (float): Seconds a caller waits for a query result
+        """
+        self.file_path = file_path
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+
+        # One slot per running or queued query; released when the worker finishes
+        self._slots = threading.BoundedSemaphore(workers + max_pending)
+
+        # Spawn instead of fork: the web server process is multi-threaded
+        self._executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(file_path,)
+        )
+
+    def warm(self):
+        """Start all workers now instead of on the first queries."""
+        futures = [self._executor.submit(_ping) for _ in range(self.workers)]
+        return sorted({future.result() for future in futures})
+
+    def submit(self, query, task=_run_query):
+        """
+        Queue a query on the pool.
+
+        Args:
+            query: The query, or a tuple of arguments for `task`
+            task (callable): Worker function to run, _run_query by default
+
+        Returns:
+            Future: resolves to the processor's result dictionary
+
+        Raises:
+            PlanningPoolBusy: if all worker and queue slots are taken
+        """
+        if not self._slots.acquire(blocking=False):
+            raise PlanningPoolBusy(f"Planning pool is full ({self.workers} workers, {self.max_pending} queued)")
+
+        try:
+            future = self._executor.submit(task, *(query if isinstance(query, tuple) else (query,)))
+        except Exception:
+            self._slots.release()
+            raise
+
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def process_query(self, query, timeout=None, task=_run_query):
+        """
+        Process a query in a worker, with the same result format as ProductionPlanningProcessor.process_query.
+
+        A busy pool or a query that runs past the timeout gives an unsuccessful result,
+        so callers fall back the same way as for any other processing failure.
+        """
+        try:
+            future = self.submit(query, task)
+        except PlanningPoolBusy as e:
+            return {
+                'success': False,
+                'message': f"Системата е натоварена, опитайте отново след малко. ({str(e)})"
+            }
+
+        try:
+            return future.result(timeout=timeout or self.timeout)
+        except FutureTimeoutError:
+            # A running query cannot be interrupted; it keeps its slot until the worker finishes it
+            future.cancel()
+            return {
+                'success': False,
+                'message': "Заявката отне твърде дълго време и беше прекратена."
+            }
+
+    def shutdown(self):
+        """Stop the workers, dropping queued queries."""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_planning_pool(file_path=None):
+    """Return the shared planning pool, creating it on first use, or None when the pool is disabled."""
+    global _pool
+
+    workers = get_setting('PLANNING_POOL_WORKERS', 0)
+    if not workers or workers <= 0:
+        return None
+
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = PlanningPool(
+                    file_path=file_path,
+                    workers=workers,
+                    max_pending=get_setting('PLANNING_POOL_MAX_PENDING', 8),
+                    timeout=get_setting('PLANNING_QUERY_TIMEOUT', 15)
+                )
+                atexit.register(_pool.shutdown)
+                current_app.logger.info(f"Started planning pool with {workers} worker processes")
+    return _pool
+
+
+def run_planning_query(processor, query):
+    """
+    Process a planning query in the worker pool when it is enabled, otherwise in the calling thread.
+
+    Args:
+        processor (ProductionPlanningProcessor): Processor used for in-thread execution; its file
+            is also the one the pool workers load
+        query (str): The user's query in Bulgarian
+
+    Returns:
+        dict: The processor's result dictionary
+    """
+    pool = get_planning_pool(processor.file_path)
+    if pool is None:
+        processor.refresh_if_changed()
+        return processor.process_query(query)
+    return pool.process_query(query)
+
+
+def run_planning_intent(processor, intent_type, params):
+    """
+    Answer a resolved intent (ProductionPlanningProcessor.process_intent) in the worker pool when it
+    is enabled, otherwise in the calling thread.
+
+    Returns:
+        dict: The processor's result dictionary
+    """
+    pool = get_planning_pool(processor.file_path)
+    if pool is None:
+        processor.refresh_if_changed()
+        return processor.process_intent(intent_type, params)
+    return pool.process_query((intent_type, params), task=_run_intent)
+
+
+def run_query_plan(processor, message):
+    """
+    Split a compound question (queryPlanner.plan_query) in the worker pool when it is enabled,
+    otherwise in the calling thread. The split needs the client list, i.e. the workbook, so with the
+    pool the web process does not load it.
+
+    Returns:
+        list: The sub-queries, or None if the message is not compound or the pool could not split it
+    """
+    from app.services.queryPlanner import plan_query, lists_items
+    if not lists_items(message):
+        return None
+
+    limit = get_setting('QUERY_PLANNER_MAX_SUBQUERIES', 8)
+    pool = get_planning_pool(processor.file_path)
+    if pool is None:
+        processor.refresh_if_changed()
+        return plan_query(processor, message, limit)
+
+    result = pool.process_query((message, limit), task=_run_plan)
+    if isinstance(result, dict):
+        # Busy or timed out: the question is answered as a whole
+        current_app.logger.warning(f"Could not split '{message}' in the planning pool: {result.get('message')}")
+        return None
+    return result
@@ -0,0 +1,350 @@
+import json
+import threading
+import pandas as pd
+from app.services.excelContext import MONTH_NAMES, normalize_model, dumps_json
+from app.services.metrics import record_completion_usage
+
+# Confection sheet columns reported for a model, keyed like ProductionPlanningProcessor.get_client_info
+STATUS_COLUMNS = {
+    'поръчка': 'Поръчка',
+    'изплетено': 'изплетено до момента в бр.',
+    'за плетене': 'остава за плетене в бр',
+    'конфекционирано': 'конфекционирано до момента в бр.',
+    'за конфекциониране': 'остава за конфекция в бр',
+}
+
+# Rows returned by one tool call, to keep tool results (and the next prompt) small
+MAX_TOOL_ROWS = 20
+
+TOOL_DEFINITIONS = [
+    {
+        "type": "function",
+        "function": {
+            "name": "get_client_totals",
+            "description": "Общо поръчани, изплетени и конфекционирани бройки и остатъци за клиент.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "client": {"type": "string", "description": "Име на клиента, напр. Lebek"}
+                },
+                "required": ["client"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "get_model_status",
+            "description": "Състояние на конкретни модели: поръчка, изплетено, за плетене, конфекционирано.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "models": {"type": "array", "items": {"type": "string"}, "description": "Номера на модели"},
+                    "client": {"type": "string", "description": "Име на клиента (по избор)"}
+                },
+                "required": ["models"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "get_monthly_plan",
+            "description": "Планирани бройки за плетене и конфекция за месец, общо и по клиенти.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "month": {"type": "integer", "minimum": 1, "maximum": 12, "description": "Месец (1-12)"},
+                    "client": {"type": "string", "description": "Име на клиента (по избор)"}
+                },
+                "required": ["month"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "get_factory_load",
+            "description": "Натоварване на цеховете: оставащи бройки за плетене и конфекция по цех.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "factory": {"type": "string", "description": "Цех (по избор), напр. 'цех 2'"},
+                    "month": {"type": "integer", "minimum": 1, "maximum": 12, "description": "Месец (по избор)"}
+                }
+            }
+        }
+    },
+]
+
+
+def _numeric(df, columns):
+    """The given columns as numbers, non-numeric cells as 0."""
+    return df[columns].apply(lambda col: pd.to_numeric(col, errors='coerce')).fillna(0)
+
+
+def _to_native(totals):
+    """Series/dict of numpy numbers -> dict of ints."""
+    return {str(key): int(value) for key, value in dict(totals).items()}
+
+
+class PlanningToolbox:
+    def __init__(self, processor):
+        """
+        Planning data tools for LLM function calling, answered from aggregates precomputed
+        once per dataset version.
+
+        Args:
+            processor (ProductionPlanningProcessor): Source of the sheet data
+        """
+        self.processor = processor
+        self._aggregates = None
+        self._lock = threading.Lock()
+
+    def get_aggregates(self):
+        """Get the aggregates for the current dataset version, rebuilding them if the file changed."""
+        # The processor drops its cached sheets itself when the file changed
+        version = self.processor.refresh_if_changed()
+        aggregates = self._aggregates
+        if aggregates is not None and aggregates['version'] == version:
+            return aggregates
+
+        with self._lock:
+            if self._aggregates is None or self._aggregates['version'] != version:
+                self._aggregates = self._build_aggregates(version)
+            return self._aggregates
+
+    def _build_aggregates(self, version):
+        knitting_df = self.processor.get_clean_sheet('pletene')
+        confection_df = self.processor.get_clean_sheet('confekcia')
+
+        client_col = confection_df.columns[0]
+        status_cols = [col for col in STATUS_COLUMNS.values() if col in confection_df.columns]
+        status_names = {col: name for name, col in STATUS_COLUMNS.items()}
+
+        confection = confection_df[confection_df[client_col].apply(lambda value: isinstance(value, str))]
+        status = _numeric(confection, status_cols).rename(columns=status_names)
+        status[client_col] = confection[client_col]
+
+        # Per client: status totals, number of models and product types
+        clients = {}
+        for client, totals in status.groupby(client_col).sum().iterrows():
+            clients[client] = _to_native(totals)
+        for client, count in confection.groupby(client_col).size().items():
+            clients[client]['модели'] = int(count)
+        if 'вид' in confection.columns:
+            for client, types in confection.groupby(client_col)['вид'].unique().items():
+                clients[client]['видове'] = sorted(str(t) for t in types if isinstance(t, str) and t.strip())
+
+        # Per model: one status row per model line of the confection sheet
+        models = {}
+        if 'Модел' in confection.columns:
+            detail_cols = [col for col in ('вид', 'файн') if col in confection.columns]
+            status_records = status[[status_names[col] for col in status_cols]].astype(int).to_dict(orient='records')
+            detail_records = confection[[client_col, 'Модел'] + detail_cols].to_dict(orient='records')
+            for details, totals in zip(detail_records, status_records):
+                entry = {'клиент': details[client_col], 'модел': str(details['Модел'])}
+                entry.update(totals)
+                for col in detail_cols:
+                    if not pd.isna(details[col]):
+                        entry[col] = details[col] if isinstance(details[col], str) else int(details[col])
+                models.setdefault(normalize_model(details['Модел']), []).append(entry)
+
+        # Per month: sheet totals and client totals for knitting and confection
+        months = {}
+        for number, month in enumerate(MONTH_NAMES, 1):
+            month_data = {'месец': month, 'плетене': 0, 'конфекция': 0, 'клиенти': {}}
+            for df, data_type in [(knitting_df, 'плетене'), (confection_df, 'конфекция')]:
+                month_col = next((col for col in df.columns if isinstance(col, str) and month in col.lower()), None)
+                if month_col is None:
+                    continue
+                quantities = pd.to_numeric(df[month_col], errors='coerce').fillna(0)
+                month_data[data_type] = int(quantities.sum())
+                by_client = quantities.groupby(df[df.columns[0]]).sum()
+                for client, quantity in by_client[by_client > 0].items():
+                    month_data['клиенти'].setdefault(str(client), {})[data_type] = int(quantity)
+            months[number] = month_data
+
+        # Per factory: remaining work, in total and per month
+        factories = {}
+        factory_col = next((col for col in confection.columns if isinstance(col, str) and 'цех' in col.lower()), None)
+        if factory_col is not None:
+            remaining = [STATUS_COLUMNS['за плетене'], STATUS_COLUMNS['за конфекциониране']]
+            remaining = [col for col in remaining if col in confection.columns]
+            month_cols = [col for col in confection.columns if isinstance(col, str)
+                          and any(month in col.lower() for month in MONTH_NAMES)]
+            loads = _numeric(confection, remaining + month_cols)
+            loads[factory_col] = confection[factory_col].astype(str)
+            for factory, totals in loads.groupby(factory_col).sum().iterrows():
+                factories[factory] = {
+                    'цех': factory,
+                    'за плетене': int(totals.get(STATUS_COLUMNS['за плетене'], 0)),
+                    'за конфекциониране': int(totals.get(STATUS_COLUMNS['за конфекциониране'], 0)),
+                    'по месеци': {MONTH_NAMES[number - 1]: int(totals[col])
+                                  for number in range(1, 13)
+                                  for col in month_cols if MONTH_NAMES[number - 1] in col.lower()},
+                }
+
+        return {
+            'version': version,
+            'clients': clients,
+            'models': models,
+            'months': months,
+            'factories': factories,
+        }
+
+    @staticmethod
+    def _match_name(query, names):
+        """Best matching name: exact, then containment with the closest length."""
+        if not query:
+            return None
+        query = query.strip().lower()
+        for name in names:
+            if name.lower() == query:
+                return name
+        matches = [name for name in names if query in name.lower() or name.lower() in query]
+        if not matches:
+            return None
+        return min(matches, key=lambda name: abs(len(name) - len(query)))
+
+    def get_client_totals(self, client):
+        aggregates = self.get_aggregates()
+        client_name = self._match_name(client, aggregates['clients'])
+        if not client_name:
+            return {'error': f"Няма клиент '{client}'", 'клиенти': sorted(aggregates['clients'])}
+        return {'клиент': client_name, **aggregates['clients'][client_name]}
+
+    def get_model_status(self, models, client=None):
+        aggregates = self.get_aggregates()
+        client_name = self._match_name(client, aggregates['clients']) if client else None
+
+        found = []
+        for model in models or []:
+            term = normalize_model(model)
+            if not term:
+                continue
+            for key, entries in aggregates['models'].items():
+                if term == key or (len(term) >= 3 and term in key):
+                    found.extend(entry for entry in entries if not client_name or entry['клиент'] == client_name)
+
+        if not found:
+            return {'error': f"Няма намерени модели: {', '.join(models or [])}"}
+        return {'модели': found[:MAX_TOOL_ROWS], 'общо намерени': len(found)}
+
+    def get_monthly_plan(self, month, client=None):
+        aggregates = self.get_aggregates()
+        month_data = aggregates['months'].get(int(month))
+        if month_data is None:
+            return {'error': f"Невалиден месец: {month}"}
+
+        if client:
+            client_name = self._match_name(client, month_data['клиенти']) or self._match_name(
+                client, aggregates['clients'])
+            if not client_name:
+                return {'error': f"Няма клиент '{client}'", 'клиенти': sorted(aggregates['clients'])}
+            return {'месец': month_data['месец'], 'клиент': client_name,
+                    **month_data['клиенти'].get(client_name, {'плетене': 0, 'конфекция': 0})}
+
+        top_clients = sorted(month_data['клиенти'].items(), key=lambda item: -sum(item[1].values()))
+        return {
+            'месец': month_data['месец'],
+            'плетене': month_data['плетене'],
+            'конфекция': month_data['конфекция'],
+            'клиенти': dict(top_clients[:10]),
+            'други клиенти': max(0, len(top_clients) - 10),
+        }
+
+    def get_factory_load(self, factory=None, month=None):
+        if month is not None and not 1 <= int(month) <= 12:
+            return {'error': f"Невалиден месец: {month}"}
+
+        aggregates = self.get_aggregates()
+        factories = aggregates['factories']
+        if factory:
+            factory_name = self._match_name(factory, factories)
+            if not factory_name:
+                return {'error': f"Няма цех '{factory}'", 'цехове': sorted(factories)}
+            factories = {factory_name: factories[factory_name]}
+
+        result = []
+        for data in factories.values():
+            entry = {key: value for key, value in data.items() if key != 'по месеци'}
+            if month is not None:
+                month_name = MONTH_NAMES[int(month) - 1]
+                entry[month_name] = data['по месеци'].get(month_name, 0)
+            result.append(entry)
+        return {'цехове': result}
+
+    def execute(self, name, arguments):
+        """
+        Run a tool call from the model.
+
+        Args:
+            name (str): Tool name from TOOL_DEFINITIONS
+            arguments (str): JSON arguments as sent by the model
+
+        Returns:
+            dict: The tool result, or {'error': ...}
+        """
+        tools = {
+            'get_client_totals': self.get_client_totals,
+            'get_model_status': self.get_model_status,
+            'get_monthly_plan': self.get_monthly_plan,
+            'get_factory_load': self.get_factory_load,
+        }
+        if name not in tools:
+            return {'error': f"Unknown tool: {name}"}
+        try:
+            return tools[name](**json.loads(arguments or '{}'))
+        except Exception as e:
+            return {'error': f"{name} failed: {str(e)}"}
+
+
+def run_tool_conversation(messages, toolbox, create_completion, max_rounds=3, **completion_kwargs):
+    """
+    Let the model call planning tools until it produces an answer.
+
+    Args:
+        messages (list): Chat messages; tool calls and results are appended to a copy of it
+        toolbox (PlanningToolbox): Executes the tool calls locally
+        create_completion (callable): Chat completion function, e.g. partial(create_chat_completion, 'chat_tools')
+        max_rounds (int): Model calls allowed to request tools before an answer is forced
+        **completion_kwargs: model, max_tokens, temperature, ...
+
+    Returns:
+        tuple: (response_text, usage) with summed prompt/cached/completion tokens, rounds and tool calls
+    """
+    usage = {'prompt_tokens': 0, 'cached_tokens': 0, 'completion_tokens': 0, 'rounds': 0, 'tool_calls': 0}
+    messages = list(messages)
+
+    for round_number in range(max_rounds + 1):
+        # Last round: tools stay declared (the history references them) but may not be called
+        tool_choice = 'auto' if round_number < max_rounds else 'none'
+        response = create_completion(messages=messages, tools=TOOL_DEFINITIONS, tool_choice=tool_choice,
+                                     **completion_kwargs)
+        usage['rounds'] += 1
+        usage['cached_tokens'] += record_completion_usage('chat_tools', completion_kwargs.get('model'),
+                                                          response.usage)
+        if response.usage:
+            usage['prompt_tokens'] += response.usage.prompt_tokens
+            usage['completion_tokens'] += response.usage.completion_tokens
+
+        message = response.choices[0].message
+        if not message.tool_calls:
+            return message.content, usage
+
+        messages.append({
+            'role': 'assistant',
+            'content': message.content,
+            'tool_calls': [{
+                'id': call.id,
+                'type': 'function',
+                'function': {'name': call.function.name, 'arguments': call.function.arguments}
+            } for call in message.tool_calls]
+        })
+        for call in message.tool_calls:
+            usage['tool_calls'] += 1
+            result = toolbox.execute(call.function.name, call.function.arguments)
+            messages.append({'role': 'tool', 'tool_call_id': call.id, 'content': dumps_json(result)})
+
+    return message.content or '', usage
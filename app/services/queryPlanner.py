@@ -0,0 +1,137 @@
+import re
+import atexit
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from app.config import get_setting
+from app.services.metrics import metrics
+from app.services.planningPool import run_planning_intent
+from app.services.followUps import extract_models
+
+# Words after which the models of the named clients are listed in full ('моделите за февруари')
+ALL_MODELS_WORDS = ('моделите', 'всички')
+
+# 'и' or a comma: without one nothing is listed
+LIST_PATTERN = re.compile(r'(?<!\w)и(?!\w)|,')
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    """Return the shared sub-query executor, creating it on first use."""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=get_setting('QUERY_PLANNER_WORKERS', 4),
+                                               thread_name_prefix='subquery')
+                atexit.register(_executor.shutdown, wait=False)
+    return _executor
+
+
+def _mentioned(names, message):
+    """The names that occur in the message as whole words, in the order they occur."""
+    found = []
+    for name in names:
+        match = re.search(rf'(?<!\w){re.escape(name.lower())}(?!\w)', message)
+        if match:
+            found.append((match.start(), name))
+    return [name for _, name in sorted(found)]
+
+
+def lists_items(message):
+    """True if the message may list several clients or months, i.e. plan_query has to look at it."""
+    return bool(LIST_PATTERN.search(message.lower()))
+
+
+def plan_query(processor, message, limit=None):
+    """
+    Split a compound question into one sub-query per client and month.
+
+    'покажи ми за lebek и matinique моделите за февруари и март' becomes four client sub-queries
+    (lebek/февруари, lebek/март, matinique/февруари, matinique/март); 'планиране за март и
+    април' two planning ones. Model numbers apply to every client. Questions naming at most one
+    client and one month are not compound: detect_query_intent answers them on its own.
+
+    Args:
+        processor (ProductionPlanningProcessor): Provides the client list and month names
+        message (str): The user's message
+        limit (int, optional): Most sub-queries returned, QUERY_PLANNER_MAX_SUBQUERIES by default
+
+    Returns:
+        list: (label, intent, params) per sub-query, at most `limit`, or None
+    """
+    text = message.lower()
+    if not LIST_PATTERN.search(text):
+        return None
+
+    months = _mentioned(processor.month_mappings, text)
+    clients = _mentioned(processor.get_client_list(), text)
+    if len(clients) < 2 and len(months) < 2:
+        return None
+
+    models = extract_models(message)
+    base = {}
+    if models:
+        base['specific_products'] = models
+    elif not months and any(word in text for word in ALL_MODELS_WORDS):
+        # The full model list has no monthly figures; with months, each answer is the client's month
+        base['all_products'] = True
+
+    subQueries = []
+    for client in clients or [None]:
+        for month in months or [None]:
+            params = dict(base)
+            labels = []
+            if client:
+                params['client'] = client
+                labels.append(client)
+            if month:
+                params['month'] = processor.month_mappings[month]
+                params['month_name'] = month
+                labels.append(month)
+            subQueries.append((', '.join(labels), 'client' if client else 'planning', params))
+
+    limit = limit or get_setting('QUERY_PLANNER_MAX_SUBQUERIES', 8)
+    if len(subQueries) > limit:
+        current_app.logger.info(f"Compound query split into {len(subQueries)} sub-queries, answering the first {limit}")
+    return subQueries[:limit]
+
+
+def run_compound_query(processor, subQueries):
+    """
+    Answer the sub-queries of plan_query concurrently and merge them into one answer.
+
+    Sub-queries run on threads sharing `processor`, whose cleaned sheets are loaded once and then
+    read by all of them (or in the planning pool's warm workers when it is enabled).
+
+    Returns:
+        dict: The process_query result format; success is False when no sub-query was answered
+    """
+    app = current_app._get_current_object()
+
+    def answer(intent, params):
+        with app.app_context():
+            return run_planning_intent(processor, intent, params)
+
+    futures = [_get_executor().submit(answer, intent, params) for _, intent, params in subQueries]
+
+    parts = []
+    answered = 0
+    for (label, _, _), future in zip(subQueries, futures):
+        try:
+            result = future.result()
+        except Exception as e:
+            result = {'success': False, 'message': f"Възникна грешка при обработката: {str(e)}"}
+        answered += bool(result.get('success'))
+        parts.append(f"{label}:\n{result.get('message') or 'Няма данни.'}")
+
+    metrics.inc('compound_queries')
+    metrics.inc('compound_subqueries', len(subQueries))
+    return {
+        'success': answered > 0,
+        'intent_type': 'compound',
+        'params': {'sub_queries': [params for _, _, params in subQueries]},
+        'message': '\n\n'.join(parts)
+    }
@@ -0,0 +1,336 @@
+import os
+import re
+import math
+import time
+import zlib
+import threading
+from collections import Counter
+from functools import lru_cache
+import numpy as np
+from flask import current_app
+from app.config import get_setting
+
+# Where a question is sent: the planning processor, the LLM, or both at once (see speculation)
+ROUTES = ('planning', 'llm', 'both')
+
+# Character n-grams of the lower-cased question, hashed into FEATURE_DIMENSIONS weights
+NGRAM_SIZES = (2, 3, 4)
+FEATURE_DIMENSIONS = 2 ** 14
+
+# Beginnings of processor answers that do not answer the question (the LLM would have done better)
+PROCESSOR_APOLOGIES = ('Не разпознах', 'Не успях', 'Възникна грешка')
+
+# Hand-labelled questions the router is always trained on, next to the replayed chat history
+SEED_QUESTIONS = [
+    ('Покажи информация за клиент Lebek', 'planning'),
+    ('Каква е справката за клиент Matinique?', 'planning'),
+    ('Колко бройки са изплетени за фирма Zerbi?', 'planning'),
+    ('Информация за клиент Робърт Тод за всички модели', 'planning'),
+    ('Колко пуловера има в производство?', 'planning'),
+    ('Покажи информация за продукт жилетка', 'planning'),
+    ('Колко рокли са конфекционирани?', 'planning'),
+    ('Какво е планирано за март?', 'planning'),
+    ('Планиране за месец април', 'planning'),
+    ('Какъв е графикът за май?', 'planning'),
+    ('Прогноза за производството през юни', 'planning'),
+    ('Какви поръчки има клиент Лебек за модел 1234?', 'planning'),
+    ('Колко е изплетено за фирма Матеник този месец?', 'planning'),
+    ('Кои модели на клиент Zerbi са конфекционирани?', 'planning'),
+    ('Покажи поръчките на марка Lebek', 'planning'),
+    ('Информация за клиент Matinique номер 5521 и 5522', 'planning'),
+    ('Справка за клиент Зерби', 'planning'),
+    ('Колко бройки поли има в поръчка?', 'planning'),
+    ('Информация за продукт риза с копчета', 'planning'),
+    ('Какво се произвежда през юли?', 'planning'),
+    ('Здравей, как си?', 'llm'),
+    ('Благодаря!', 'llm'),
+    ('Какво можеш да правиш?', 'llm'),
+    ('Обясни ми какво е гейдж на плетачна машина', 'llm'),
+    ('Какво означава файн 12?', 'llm'),
+    ('Напиши имейл до клиент, че поръчката ще закъснее', 'llm'),
+    ('Преведи на английски: поръчката е готова', 'llm'),
+    ('Как да подобрим производството в цеха?', 'llm'),
+    ('Какви данни имаш?', 'llm'),
+    ('Покажи ми как да използвам асистента', 'llm'),
+    ('Дай ми съвет как да организирам работата на етажа', 'llm'),
+    ('Каква е разликата между плетене и конфекция?', 'llm'),
+    ('Обобщи горния отговор накратко', 'llm'),
+    ('Можеш ли да повториш последното?', 'llm'),
+    ('Кой си ти?', 'llm'),
+    ('Направи таблица от предишния отговор', 'llm'),
+    ('Какво е статистика?', 'llm'),
+    ('Как се пише информация на английски?', 'llm'),
+    ('Защо данните са различни от вчера?', 'llm'),
+    ('Какво е добро време за доставка на плетени изделия?', 'llm'),
+    ('Кои клиенти имат най-много поръчки и защо?', 'both'),
+    ('Сравни производството за март и април', 'both'),
+    ('Кой цех е най-натоварен този месец?', 'both'),
+    ('Покажи данни за производството', 'both'),
+    ('Дай ми обобщение на поръчките', 'both'),
+]
+
+
+def _normalize(text):
+    return ' '.join(re.findall(r'\w+', (text or '').lower()))
+
+
+@lru_cache(maxsize=32768)
+def _ngram_index(ngram):
+    """Feature index of an n-gram; the most frequent ones stay cached."""
+    return zlib.crc32(ngram.encode('utf-8')) % FEATURE_DIMENSIONS
+
+
+def _ngram_counts(text):
+    padded = f" {_normalize(text)} "
+    ngrams = Counter([padded[i:i + size] for size in NGRAM_SIZES for i in range(len(padded) - size + 1)])
+    counts = {}
+    for ngram, count in ngrams.items():
+        index = _ngram_index(ngram)
+        counts[index] = counts.get(index, 0) + count
+    return counts
+
+
+def featurize(text):
+    """
+    Hashed character n-gram features of a question.
+
+    Returns:
+        tuple: (indexes, values) - feature indexes and their L2-normalized counts, as numpy arrays
+    """
+    counts = _ngram_counts(text)
+    indexes = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+    values = np.fromiter(counts.values(), dtype=np.float64, count=len(counts))
+    norm = np.sqrt(values @ values)
+    return indexes, values / norm if norm else values
+
+
+def keyword_route(keywordCount):
+    """The route of the keyword rule, used without a trained router: any trigger keyword - processor, none - LLM."""
+    return 'planning' if keywordCount >= 1 else 'llm'
+
+
+class QueryRouter:
+    def __init__(self, weights, bias=0.0, planning_above=0.65, llm_below=0.35):
+        """
+        Logistic regression over hashed character n-grams estimating whether the planning processor
+        can answer a question.
+
+        Args:
+            weights (ndarray): One weight per feature (FEATURE_DIMENSIONS)
+            bias (float): Intercept
+            planning_above (float): Probability above which the question goes to the processor only
+            llm_below (float): Probability below which it goes to the LLM only; in between, to both
+        """
+        self.weights = weights
+        self.bias = bias
+        # Scoring one question in plain Python is faster than going through numpy
+        self._weights = weights.tolist()
+        self.planning_above = planning_above
+        self.llm_below = llm_below
+
+    def probability(self, text):
+        """Probability that the planning processor answers the question."""
+        counts = _ngram_counts(text)
+        norm = math.sqrt(sum(count * count for count in counts.values())) or 1.0
+        score = self.bias + sum(self._weights[index] * count for index, count in counts.items()) / norm
+        return 1.0 / (1.0 + math.exp(-score))
+
+    def route(self, text):
+        """'planning', 'llm' or 'both' for the question."""
+        probability = self.probability(text)
+        if probability >= self.planning_above:
+            return 'planning'
+        return 'llm' if probability <= self.llm_below else 'both'
+
+    @classmethod
+    def train(cls, texts, labels, epochs=300, learning_rate=0.5, l2=1e-4, **kwargs):
+        """
+        Fit the router with full-batch gradient descent.
+
+        Args:
+            texts (list): Questions
+            labels (list): 'planning', 'llm' or 'both' per question; 'both' counts half for each side
+            epochs (int): Gradient steps
+            learning_rate (float): Step size
+            l2 (float): Weight decay
+
+        Returns:
+            QueryRouter: the trained router
+        """
+        rows, columns, values = [], [], []
+        for row, text in enumerate(texts):
+            indexes, weights = featurize(text)
+            rows.append(np.full(len(indexes), row))
+            columns.append(indexes)
+            values.append(weights)
+        rows, columns, values = np.concatenate(rows), np.concatenate(columns), np.concatenate(values)
+
+        targets = np.array([{'planning': 1.0, 'llm': 0.0}.get(label, 0.5) for label in labels])
+        # Balance the classes, so a history of mostly small talk does not drown the planning questions
+        positives = max(targets.sum(), 1.0)
+        negatives = max(len(targets) - targets.sum(), 1.0)
+        sample_weights = np.where(targets >= 0.5, len(targets) / (2 * positives), len(targets) / (2 * negatives))
+        sample_weights /= sample_weights.sum()
+
+        weights = np.zeros(FEATURE_DIMENSIONS)
+        bias = 0.0
+        for _ in range(epochs):
+            scores = bias + np.bincount(rows, weights=weights[columns] * values, minlength=len(texts))
+            errors = (1.0 / (1.0 + np.exp(-scores)) - targets) * sample_weights
+            weights -= learning_rate * (np.bincount(columns, weights=errors[rows] * values,
+                                                    minlength=FEATURE_DIMENSIONS) + l2 * weights)
+            bias -= learning_rate * errors.sum()
+        return cls(weights, bias, **kwargs)
+
+    def save(self, path):
+        """Store the weights as an .npz file."""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, 'wb') as file:
+            np.savez_compressed(file, weights=self.weights, bias=np.array(self.bias))
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        """Load weights stored by save()."""
+        with np.load(path) as data:
+            return cls(data['weights'], float(data['bias']), **kwargs)
+
+
+def label_by_replay(processor, question):
+    """
+    Label a question by running it through the planning processor.
+
+    Returns:
+        str: 'planning' if the processor answers it, else 'llm' (it fails or only apologises)
+    """
+    try:
+        result = processor.process_query(question)
+    except Exception:
+        return 'llm'
+    result = result or {}
+    message = result.get('message') or ''
+    if not result.get('success') or message.startswith(PROCESSOR_APOLOGIES):
+        return 'llm'
+    return 'planning'
+
+
+def collect_training_data(processor=None, history=True):
+    """
+    The seed questions and, with `history`, the distinct user messages stored in chats labelled
+    by replaying them through `processor` (seed labels win for the same question).
+
+    Returns:
+        tuple: (texts, labels)
+    """
+    labelled = {}
+    if history and processor is not None:
+        from app.models.message import Message
+        for (content,) in Message.query.with_entities(Message.content).filter_by(role='user').distinct():
+            key = _normalize(content)
+            if key and key not in labelled:
+                labelled[key] = (content, label_by_replay(processor, content))
+
+    for question, label in SEED_QUESTIONS:
+        labelled[_normalize(question)] = (question, label)
+
+    texts = [text for text, _ in labelled.values()]
+    labels = [label for _, label in labelled.values()]
+    return texts, labels
+
+
+def _is_holdout(text, holdout):
+    """Stable split: the same question is always on the same side."""
+    return zlib.crc32(_normalize(text).encode('utf-8')) % 1000 < holdout * 1000
+
+
+def evaluate(router, texts, labels, keywordCounts):
+    """
+    Compare the router to the keyword rule on labelled questions.
+
+    A fallback is a question sent to the processor that it cannot answer, so the LLM runs after it
+    (or next to it, for 'both'); the router avoids one when the keyword rule would have sent the
+    question to the processor and the router sends it to the LLM right away.
+
+    Returns:
+        dict: questions, accuracy of both rules (a route is right only if it is the label, so a
+        'both' route is right only for a 'both' question; routes['both'] counts how often the
+        router hedged), fallbacks of both, the avoided fallbacks, planning answers the router
+        loses to the LLM, routes taken and the mean routing time in microseconds
+    """
+    report = {'questions': len(texts), 'router_correct': 0, 'keyword_correct': 0, 'router_fallbacks': 0,
+              'keyword_fallbacks': 0, 'avoided_fallbacks': 0, 'lost_planning_answers': 0,
+              'routes': {route: 0 for route in ROUTES}}
+
+    started = time.perf_counter()
+    routes = [router.route(text) for text in texts]
+    report['route_microseconds'] = round((time.perf_counter() - started) * 1e6 / max(len(texts), 1), 1)
+
+    for route, label, keywordCount in zip(routes, labels, keywordCounts):
+        keywordRoute = keyword_route(keywordCount)
+        report['routes'][route] += 1
+        report['router_correct'] += route == label
+        report['keyword_correct'] += keywordRoute == label
+        if label == 'llm':
+            report['router_fallbacks'] += route != 'llm'
+            report['keyword_fallbacks'] += keywordRoute != 'llm'
+            report['avoided_fallbacks'] += keywordRoute != 'llm' and route == 'llm'
+        elif label == 'planning':
+            report['lost_planning_answers'] += route == 'llm'
+
+    total = max(len(texts), 1)
+    report['router_accuracy'] = round(report.pop('router_correct') / total, 4)
+    report['keyword_accuracy'] = round(report.pop('keyword_correct') / total, 4)
+    return report
+
+
+def train_router(texts, labels, keywordCount, holdout=0.2):
+    """
+    Train a router, report how it does on a holdout share of the questions, then refit it on all of them.
+
+    Args:
+        texts (list): Questions
+        labels (list): Their routes
+        keywordCount (callable): The keyword rule's trigger keyword count of a question
+        holdout (float): Share of questions kept out of training for the report (0 = report on the training set)
+
+    Returns:
+        tuple: (router, report) - the router trained on all questions and the evaluate() report
+    """
+    thresholds = dict(planning_above=get_setting('ROUTER_PLANNING_ABOVE', 0.65),
+                      llm_below=get_setting('ROUTER_LLM_BELOW', 0.35))
+    train = [(text, label) for text, label in zip(texts, labels) if not _is_holdout(text, holdout)]
+    test = [(text, label) for text, label in zip(texts, labels) if _is_holdout(text, holdout)]
+    if not test or not train:
+        train = test = list(zip(texts, labels))
+
+    router = QueryRouter.train([text for text, _ in train], [label for _, label in train], **thresholds)
+    report = evaluate(router, [text for text, _ in test], [label for _, label in test],
+                      [keywordCount(text) for text, _ in test])
+    report['trained_on'] = len(train)
+    return QueryRouter.train(texts, labels, **thresholds), report
+
+
+_router = None
+_router_loaded = False
+_router_lock = threading.Lock()
+
+
+def get_query_router():
+    """Return the router trained by `manage.py train_router`, loading it on first use, or None without one."""
+    global _router, _router_loaded
+
+    if not _router_loaded:
+        with _router_lock:
+            if not _router_loaded:
+                path = get_setting('ROUTER_MODEL_PATH')
+                if path and os.path.exists(path):
+                    try:
+                        _router = QueryRouter.load(path,
+                                                   planning_above=get_setting('ROUTER_PLANNING_ABOVE', 0.65),
+                                                   llm_below=get_setting('ROUTER_LLM_BELOW', 0.35))
+                        current_app.logger.info(f"Loaded query router from {path}")
+                    except Exception as e:
+                        current_app.logger.error(f"Could not load query router from {path}: {str(e)}")
+                _router_loaded = True
+    return _router
@@ -0,0 +1,190 @@
+import re
+import math
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+from app.config import get_setting
+from app.services.caches import TTLCache
+from app.services.metrics import metrics
+
+# Function words that do not change what a question asks for (negations and range prepositions such as
+# 'не', 'от', 'до', 'над' do, so they are kept)
+STOPWORDS = {
+    'а', 'and', 'би', 'бе', 'беше', 'в', 'във', 'да', 'е', 'за', 'и', 'или', 'из', 'има', 'как',
+    'какво', 'каква', 'какви', 'какъв', 'като', 'ли', 'ме', 'ми', 'много', 'мога', 'може', 'моля', 'на',
+    'но', 'о', 'по', 'при', 'с', 'са', 'се', 'си', 'със', 'та', 'те',
+    'ти', 'то', 'този', 'тази', 'това', 'тези', 'че', 'ще', 'я', 'кажи', 'кажете', 'покажи', 'покажете',
+    'дай', 'дайте', 'искам', 'бих', 'желая', 'сега', 'момента', 'моят', 'моята'
+}
+
+# Words that turn a question into its opposite; a negated question is only compared with negated ones
+NEGATIONS = {'не', 'ни', 'нито', 'няма', 'без'}
+
+# Words whose meaning is carried by a resolved entity (see normalize_question)
+RELATIVE_DATE_WORDS = {'днес', 'утре', 'вчера', 'завчера', 'днешния', 'днешна', 'днешното', 'днешните'}
+
+# Character n-gram length of the similarity match
+NGRAM_SIZE = 3
+
+
+def normalize_question(question, entities=None):
+    """
+    Reduce a question to the words that change its answer.
+
+    Case and punctuation are dropped, stopwords and relative date words removed and the entities
+    the planning processor resolved (absolute date, month, client, product type, factory) are
+    appended in a fixed order, so 'Какво е състоянието на поръчките днес?' asked on two days
+    gets two different forms. The numbers in the question (quantities, model numbers) are part of
+    the signature, so 'над 100 броя' is never matched with 'над 1000 броя', and a negated
+    question gets a 'negated' mark, so it is never matched with the affirmative one.
+
+    Args:
+        question (str): The user's question
+        entities (dict, optional): Parameters from ProductionPlanningProcessor.detect_query_intent
+
+    Returns:
+        tuple: (text, entity_signature) - the remaining words and the resolved entities as a string
+    """
+    words = re.findall(r'\w+', (question or '').lower())
+    text = ' '.join(word for word in words if word not in STOPWORDS and word not in RELATIVE_DATE_WORDS)
+
+    entities = entities or {}
+    signature = ';'.join(f"{name}={str(entities[name]).lower()}"
+                         for name in ('date', 'month', 'client', 'product_type', 'factory', 'specific_products')
+                         if entities.get(name) not in (None, '', []))
+    numbers = [word for word in words if any(char.isdigit() for char in word)]
+    if numbers:
+        signature += f";numbers={','.join(numbers)}"
+    if NEGATIONS.intersection(words):
+        signature += ';negated'
+    return text, signature
+
+
+def _ngrams(text):
+    padded = f" {text} "
+    return Counter(padded[i:i + NGRAM_SIZE] for i in range(max(1, len(padded) - NGRAM_SIZE + 1)))
+
+
+def tfidf_similarity(query, candidates):
+    """
+    Cosine similarity of character n-gram TF-IDF vectors of `query` and each candidate.
+
+    The IDF is computed over the query and the candidates, so n-grams every cached question
+    shares (e.g. 'поръчк') weigh less than the ones that tell questions apart.
+
+    Returns:
+        list: one similarity in [0, 1] per candidate
+    """
+    documents = [_ngrams(query)] + [_ngrams(candidate) for candidate in candidates]
+    frequency = Counter(gram for document in documents for gram in document)
+    idf = {gram: math.log((1 + len(documents)) / (1 + count)) + 1 for gram, count in frequency.items()}
+
+    vectors = []
+    for document in documents:
+        vector = {gram: count * idf[gram] for gram, count in document.items()}
+        norm = math.sqrt(sum(value * value for value in vector.values())) or 1.0
+        vectors.append({gram: value / norm for gram, value in vector.items()})
+
+    query_vector = vectors[0]
+    return [sum(weight * vector.get(gram, 0.0) for gram, weight in query_vector.items()) for vector in vectors[1:]]
+
+
+class CachedQuestion:
+    def __init__(self, question, datasetVersion, variant, entities=None):
+        """
+        Cache address of a question: normalized text, resolved entities, dataset version and the
+        answering variant (e.g. with or without planning tools).
+        """
+        self.text, self.entities = normalize_question(question, entities)
+        # Answers about a relative date are only valid until that day is over
+        self.relative_date = bool(entities and entities.get('date'))
+        self.scope = f"{datasetVersion}|{variant}|{self.entities}"
+        self.key = f"{self.scope}|{self.text}"
+
+
+class ResponseCache:
+    def __init__(self, maxsize=256, ttl=600.0, similarity=0.9):
+        """
+        Answers of the LLM fallback, reused for the same (or, above `similarity`, a near-identical)
+        question on the same dataset.
+
+        Args:
+            maxsize (int): Answers kept
+            ttl (float): Seconds an answer is reused; answers about 'today' also expire at midnight
+            similarity (float): Minimum TF-IDF similarity of a near-identical question; 0 for exact
+                matches only. Only questions with the same resolved entities are compared.
+        """
+        self.similarity = similarity
+        self._entries = TTLCache('llm_response', maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self._lookups = 0
+        self._hits = 0
+
+    def _record(self, result):
+        with self._lock:
+            self._lookups += 1
+            self._hits += result != 'miss'
+            metrics.set_gauge('response_cache_hit_rate', round(self._hits / self._lookups, 4))
+        metrics.inc('response_cache', labels={'result': result})
+
+    def get(self, question):
+        """The cached answer to a CachedQuestion, or None."""
+        if not question.text:
+            self._record('miss')
+            return None
+
+        # Not counted by the cache itself: a miss here may still be a similar hit
+        answer = self._entries.get(question.key, count=False)
+        if answer is not None:
+            self._record('hit')
+            return answer
+
+        if self.similarity > 0:
+            candidates = [(text, answer) for (scope, text), answer in
+                          ((key.rsplit('|', 1), answer) for key, answer in self._entries.items())
+                          if scope == question.scope]
+            if candidates:
+                scores = tfidf_similarity(question.text, [text for text, _ in candidates])
+                best = max(range(len(scores)), key=scores.__getitem__)
+                if scores[best] >= self.similarity:
+                    metrics.observe('response_cache_similarity', scores[best], buckets=(0.8, 0.85, 0.9, 0.95, 1.0))
+                    self._record('similar')
+                    return candidates[best][1]
+
+        self._record('miss')
+        return None
+
+    def set(self, question, answer):
+        """Remember the answer to a CachedQuestion."""
+        if not question.text or not answer:
+            return
+
+        ttl = self._entries.ttl
+        if question.relative_date:
+            now = datetime.now()
+            midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+            ttl = min(ttl, (midnight - now).total_seconds())
+        self._entries.set(question.key, answer, ttl=ttl)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """Return the shared response cache, creating it on first use, or None when it is disabled."""
+    global _cache
+
+    size = get_setting('RESPONSE_CACHE_SIZE', 256)
+    if not size or size <= 0:
+        return None
+
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResponseCache(
+                    maxsize=size,
+                    ttl=get_setting('RESPONSE_CACHE_TTL', 600),
+                    similarity=get_setting('RESPONSE_CACHE_SIMILARITY', 0.9)
+                )
+    return _cache
@@ -0,0 +1,75 @@
+import hashlib
+import json
+import threading
+from concurrent.futures import Future
+from app.services.metrics import metrics
+
+
+def request_key(*parts):
+    """Digest of JSON-serializable request parts (e.g. model, messages, parameters)."""
+    return hashlib.sha256(json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+class SingleFlight:
+    def __init__(self, name):
+        """
+        Share one execution of identical concurrent calls.
+
+        The first caller of a key (the leader) does the work; callers arriving with the same key
+        while it runs (followers) wait for its result or exception instead of repeating the call.
+        Nothing is kept after the leader finishes - that is what the caches are for.
+
+        Args:
+            name (str): Label of the coalescing counters, e.g. 'transcription'
+        """
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def begin(self, key):
+        """
+        Join the call in flight for `key`, or start one.
+
+        Returns:
+            tuple: (future, leader) - a leader must call finish() with the outcome; a follower
+            waits on future.result()
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+            metrics.set_gauge('coalesced_in_flight', len(self._calls), labels={'operation': self.name})
+
+        metrics.inc('coalesced_calls', labels={'operation': self.name, 'role': 'leader' if leader else 'follower'})
+        return future, leader
+
+    def finish(self, key, future, result=None, error=None):
+        """Hand the leader's result (or exception) to the followers and close the call."""
+        with self._lock:
+            if self._calls.get(key) is future:
+                del self._calls[key]
+            metrics.set_gauge('coalesced_in_flight', len(self._calls), labels={'operation': self.name})
+
+        if error is not None:
+            # A leader that stopped without failing (e.g. a closed stream) still leaves its followers without a result
+            if not isinstance(error, Exception):
+                error = RuntimeError(f"Shared {self.name} call was abandoned ({type(error).__name__})")
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def run(self, key, func, *args, **kwargs):
+        """Call `func(*args, **kwargs)`, or wait for the identical call already in flight."""
+        future, leader = self.begin(key)
+        if not leader:
+            return future.result()
+
+        try:
+            result = func(*args, **kwargs)
+        except BaseException as e:
+            self.finish(key, future, error=e)
+            raise
+        self.finish(key, future, result=result)
+        return result
@@ -0,0 +1,186 @@
+import queue
+import atexit
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from flask import current_app
+from app.config import get_setting
+from app.services.metrics import metrics
+from app.services.aiScheduler import ai_priority, call_priority
+
+# Which planning questions start the LLM next to the processor (SPECULATIVE_MODE)
+SPECULATIVE_MODES = ('off', 'borderline', 'always')
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    """Return the shared speculation executor, creating it on first use."""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=get_setting('SPECULATIVE_WORKERS', 8),
+                                               thread_name_prefix='speculative')
+                atexit.register(_executor.shutdown, wait=False)
+    return _executor
+
+
+def speculation_mode():
+    """The configured SPECULATIVE_MODE, 'off' for unknown values."""
+    mode = get_setting('SPECULATIVE_MODE', 'off')
+    return mode if mode in SPECULATIVE_MODES else 'off'
+
+
+def speculate(func, *args):
+    """
+    Start func(*args) on the speculation executor, in an app context of its own and with the
+    caller's AI priority class.
+
+    Returns:
+        Future: the speculative result; hand it to discard() if it is not used
+    """
+    app = current_app._get_current_object()
+    priority = call_priority('chat')
+
+    def run():
+        with app.app_context(), ai_priority(priority):
+            return func(*args)
+
+    metrics.inc('speculative_started')
+    return _get_executor().submit(run)
+
+
+def discard(future):
+    """Give up a speculative result: a call that has not started yet is cancelled, a running one is ignored."""
+    cancelled = future.cancel()
+    metrics.inc('speculative_discarded', labels={'state': 'cancelled' if cancelled else 'ignored'})
+
+
+def record_winner(winner):
+    """Count which path answered a speculatively executed question ('processor' or 'llm')."""
+    metrics.inc('speculative_answers', labels={'winner': winner})
+
+
+def first_answer(processor, llm):
+    """
+    Wait for two speculative answers to the same question and take the first acceptable one.
+
+    The processor's answer is acceptable unless it is None (it could not answer), the LLM's
+    unless it raised; when both are ready the processor's wins. The other one is discarded.
+
+    Args:
+        processor (Future): The planning processor's answer
+        llm (Future): The LLM's answer
+
+    Returns:
+        tuple: (winner, answer) - winner is 'processor' or 'llm'
+
+    Raises:
+        Exception: the LLM's error, if the processor could not answer either
+    """
+    pending = {processor, llm}
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        if processor in done and processor.exception() is None and processor.result() is not None:
+            winner, answer = 'processor', processor.result()
+            break
+        if llm in done and llm.exception() is None:
+            winner, answer = 'llm', llm.result()
+            break
+    else:
+        return 'llm', llm.result()
+
+    for future in pending:
+        discard(future)
+    record_winner(winner)
+    return winner, answer
+
+
+class BackgroundStream:
+    def __init__(self, func, *args):
+        """
+        Read the generator func(*args, on_open=...) on the speculation executor.
+
+        The caller can wait for its first item (`first`) together with another speculative result,
+        iterate the items as they arrive, or close() it to abandon the generator. func hands the
+        upstream stream it reads (anything with a thread-safe close()) to on_open, so close() can
+        close it at once instead of when its next item arrives.
+        """
+        # Resolves when the first item is there, or the generator ended without one
+        self.first = Future()
+        self._items = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._upstream = None
+        speculate(self._pump, func, args)
+
+    def _opened(self, upstream):
+        with self._lock:
+            self._upstream = upstream
+            closed = self._closed
+        if closed:
+            upstream.close()
+
+    def _pump(self, func, args):
+        try:
+            stream = func(*args, on_open=self._opened)
+            try:
+                for item in stream:
+                    if self._closed:
+                        return
+                    self._items.put((True, item))
+                    if not self.first.done():
+                        self.first.set_result(True)
+            finally:
+                stream.close()
+        except BaseException as e:
+            self._items.put((False, e))
+        else:
+            self._items.put((False, None))
+        finally:
+            if not self.first.done():
+                self.first.set_result(False)
+
+    def __iter__(self):
+        while True:
+            more, value = self._items.get()
+            if not more:
+                if value is not None:
+                    raise value
+                return
+            yield value
+
+    def close(self):
+        """Stop reading and close the upstream stream now; the generator ends with it."""
+        with self._lock:
+            self._closed = True
+            upstream = self._upstream
+        if upstream is not None:
+            upstream.close()
+
+
+def race_first_item(processor, stream):
+    """
+    Wait for a speculative processor answer or the first item of a BackgroundStream, whichever comes first.
+
+    Returns:
+        str: The processor's answer if it came first (the stream is then closed), else None (the
+        processor's result is discarded and the stream is to be read)
+    """
+    wait([processor, stream.first], return_when=FIRST_COMPLETED)
+    if not processor.done() and not stream.first.result():
+        # The stream ended or failed without an item: the processor's answer is all there is
+        wait([processor])
+
+    # A processor that failed has no answer: the stream is read
+    answer = processor.result() if processor.done() and processor.exception() is None else None
+    if answer is not None:
+        stream.close()
+        record_winner('processor')
+        return answer
+
+    if not processor.done():
+        discard(processor)
+    record_winner('llm')
+    return None
@@ -0,0 +1,87 @@
+import hashlib
+import threading
+from datetime import datetime, timedelta
+from flask import current_app
+from app.extensions import db
+from app.models.transcription import TranscriptionCacheEntry
+from app.config import get_setting
+from app.services.caches import TTLCache
+from app.services.metrics import metrics
+
+_memory_cache = None
+_memory_cache_lock = threading.Lock()
+
+
+def _get_memory_cache():
+    """Return the in-process tier, creating it on first use, or None when it is disabled."""
+    global _memory_cache
+
+    size = get_setting('TRANSCRIPTION_CACHE_SIZE', 256)
+    if not size or size <= 0:
+        return None
+
+    if _memory_cache is None:
+        with _memory_cache_lock:
+            if _memory_cache is None:
+                _memory_cache = TTLCache('transcription', maxsize=size,
+                                         ttl=get_setting('TRANSCRIPTION_CACHE_TTL', 86400))
+    return _memory_cache
+
+
+def transcription_cache_key(audioData, *settings):
+    """
+    Content address of a transcription: the recording's bytes plus everything else that changes
+    the text (model, language, prompts), so a settings change never serves an old transcript.
+    """
+    digest = hashlib.sha256(audioData)
+    for setting in settings:
+        digest.update(b'\x00' + str(setting).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def get_cached_transcription(cacheKey):
+    """
+    The stored transcript of a recording, from memory or (with TRANSCRIPTION_CACHE_PERSISTENT)
+    from the database; None on a miss.
+    """
+    memory = _get_memory_cache()
+    if memory is not None:
+        text = memory.get(cacheKey)
+        if text is not None:
+            metrics.inc('transcription_cache', labels={'tier': 'memory'})
+            return text
+
+    if get_setting('TRANSCRIPTION_CACHE_PERSISTENT', False):
+        try:
+            entry = db.session.get(TranscriptionCacheEntry, cacheKey)
+            if entry is not None and entry.expiresAt > datetime.now():
+                metrics.inc('transcription_cache', labels={'tier': 'db'})
+                if memory is not None:
+                    memory.set(cacheKey, entry.text)
+                return entry.text
+            if entry is not None:
+                db.session.delete(entry)
+                db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.warning(f"Could not read the transcription cache: {str(e)}")
+
+    metrics.inc('transcription_cache', labels={'tier': 'miss'})
+    return None
+
+
+def store_transcription(cacheKey, text):
+    """Remember a recording's transcript in the enabled tiers."""
+    memory = _get_memory_cache()
+    if memory is not None:
+        memory.set(cacheKey, text)
+
+    if get_setting('TRANSCRIPTION_CACHE_PERSISTENT', False):
+        try:
+            ttl = get_setting('TRANSCRIPTION_CACHE_TTL', 86400)
+            db.session.merge(TranscriptionCacheEntry(cacheKey=cacheKey, text=text,
+                                                     expiresAt=datetime.now() + timedelta(seconds=ttl)))
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.warning(f"Could not store the transcription in the cache: {str(e)}")
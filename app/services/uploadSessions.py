@@ -0,0 +1,162 @@
+import time
+import uuid
+import threading
+from app.config import get_setting
+from app.services.metrics import metrics
+
+
+class UploadSessionNotFound(Exception):
+    """Raised for an unknown, finished or expired upload session."""
+
+
+class UploadSessionLimit(Exception):
+    """Raised when a session would grow past the upload size limit or too many sessions are open."""
+
+
+class UploadSession:
+    def __init__(self, audioFormat=None, chatId=None, contentType=None):
+        """
+        A recording uploaded in pieces while the user is still speaking.
+
+        Args:
+            audioFormat (str, optional): Format of the recording, e.g. 'webm'
+            chatId (int, optional): The chat the recording continues
+            contentType (str, optional): Content type the browser reported for the recording
+        """
+        self.id = uuid.uuid4().hex
+        self.audioFormat = audioFormat
+        self.chatId = chatId
+        self.contentType = contentType
+        self.created = time.monotonic()
+        self.updated = self.created
+        # Chunk index -> bytes; MediaRecorder pieces only form a valid file when joined in order
+        self.chunks = {}
+        self.size = 0
+
+    def audio_data(self):
+        """
+        The recording so far, its chunks joined in index order.
+
+        Raises:
+            ValueError: if a chunk before the last one received is missing
+        """
+        count = max(self.chunks) + 1 if self.chunks else 0
+        missing = [index for index in range(count) if index not in self.chunks]
+        if missing:
+            raise ValueError(f"Upload session {self.id} is missing chunks {missing}")
+        return b''.join(self.chunks[index] for index in range(count))
+
+
+class UploadSessionStore:
+    def __init__(self):
+        """
+        In-memory upload sessions of this process; idle sessions expire after UPLOAD_SESSION_TTL seconds
+        and all of them together hold at most UPLOAD_SESSION_MAX_BYTES.
+        """
+        self._lock = threading.Lock()
+        self._sessions = {}
+        # Bytes held by all open sessions
+        self._size = 0
+
+    def _drop(self, sessionId):
+        """Remove a session and release its bytes (caller holds the lock)."""
+        session = self._sessions.pop(sessionId, None)
+        if session is not None:
+            self._size -= session.size
+        metrics.set_gauge('upload_session_bytes', self._size)
+        return session
+
+    def _expire(self):
+        """Drop sessions nobody has touched within the TTL (caller holds the lock)."""
+        cutoff = time.monotonic() - get_setting('UPLOAD_SESSION_TTL', 120)
+        expired = [sessionId for sessionId, session in self._sessions.items() if session.updated < cutoff]
+        for sessionId in expired:
+            self._drop(sessionId)
+        if expired:
+            metrics.inc('upload_sessions_expired', len(expired))
+        metrics.set_gauge('upload_sessions_open', len(self._sessions))
+
+    def create(self, audioFormat=None, chatId=None, contentType=None):
+        """
+        Open a session for a recording that is starting.
+
+        Returns:
+            UploadSession: the new session
+
+        Raises:
+            UploadSessionLimit: if UPLOAD_SESSION_MAX sessions are already open
+        """
+        with self._lock:
+            self._expire()
+            if len(self._sessions) >= get_setting('UPLOAD_SESSION_MAX', 16):
+                raise UploadSessionLimit(f"Too many open upload sessions ({len(self._sessions)})")
+
+            session = UploadSession(audioFormat, chatId, contentType)
+            self._sessions[session.id] = session
+            metrics.inc('upload_sessions_created')
+            metrics.set_gauge('upload_sessions_open', len(self._sessions))
+            return session
+
+    def append(self, sessionId, index, data):
+        """
+        Store one chunk of a session's recording.
+
+        Args:
+            sessionId (str): The session
+            index (int): Position of the chunk in the recording, starting at 0; a repeated index
+                replaces the earlier chunk, so a client may safely retry a failed upload
+            data (bytes): The chunk
+
+        Returns:
+            int: bytes received so far
+
+        Raises:
+            UploadSessionNotFound: if the session does not exist (any more)
+            UploadSessionLimit: if the recording would exceed MAX_CONTENT_LENGTH, or the open sessions
+                UPLOAD_SESSION_MAX_BYTES; the session is closed
+        """
+        with self._lock:
+            self._expire()
+            session = self._sessions.get(sessionId)
+            if session is None:
+                raise UploadSessionNotFound(f"Unknown upload session {sessionId}")
+
+            size = session.size - len(session.chunks.get(index, b'')) + len(data)
+            if size > get_setting('MAX_CONTENT_LENGTH', 16 * 1024 * 1024):
+                self._drop(sessionId)
+                raise UploadSessionLimit(f"Upload session {sessionId} exceeds the upload size limit")
+            if self._size + size - session.size > get_setting('UPLOAD_SESSION_MAX_BYTES', 64 * 1024 * 1024):
+                self._drop(sessionId)
+                raise UploadSessionLimit("Upload sessions hold too much audio, send the recording when it ends")
+
+            session.chunks[index] = data
+            self._size += size - session.size
+            session.size = size
+            metrics.set_gauge('upload_session_bytes', self._size)
+            session.updated = time.monotonic()
+            metrics.inc('upload_session_chunk_bytes', len(data))
+            return session.size
+
+    def finish(self, sessionId):
+        """
+        Close a session and hand over its recording.
+
+        Returns:
+            UploadSession: the closed session (see UploadSession.audio_data)
+
+        Raises:
+            UploadSessionNotFound: if the session does not exist (any more)
+        """
+        with self._lock:
+            session = self._drop(sessionId)
+            metrics.set_gauge('upload_sessions_open', len(self._sessions))
+        if session is None:
+            raise UploadSessionNotFound(f"Unknown upload session {sessionId}")
+
+        metrics.inc('upload_sessions_finished')
+        return session
+
+
+# Sessions live in the memory of the process that created them; with several server processes
+# the chunks of one recording must be routed to the same process
+upload_sessions = UploadSessionStore()
@@ -0,0 +1,130 @@
+import time
+import atexit
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from app.config import get_setting
+from app.services.metrics import metrics
+from app.services.aiScheduler import ai_priority
+from app.services.planningPool import WARM_SHEETS, get_planning_pool
+from app.services.openaiServices import (transcribeAudioUsingOpenAI, generateResponse, load_chat_history,
+                                         production_processor, planning_toolbox)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    """Return the shared stage executor, creating it on first use."""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=get_setting('VOICE_PIPELINE_WORKERS', 12),
+                                               thread_name_prefix='voiceStage')
+                atexit.register(_executor.shutdown, wait=False)
+    return _executor
+
+
+def _timed_stage(app, func, *args):
+    """Run one stage in an app context of its own; returns (result, elapsed ms)."""
+    started = time.perf_counter()
+    with app.app_context():
+        result = func(*args)
+    return result, round((time.perf_counter() - started) * 1000, 1)
+
+
+def warm_planning_data():
+    """Make sure the data the answer will need is loaded, so answering does not wait on file reads."""
+    # Pool workers load their sheets when they start
+    if get_planning_pool(production_processor.file_path) is not None:
+        return
+
+    for sheet_name in WARM_SHEETS:
+        try:
+            production_processor.get_sheet_data(sheet_name)
+        except Exception as e:
+            current_app.logger.warning(f"Could not warm sheet '{sheet_name}': {str(e)}")
+
+    if get_setting('LLM_TOOLS_ENABLED', False):
+        planning_toolbox.get_aggregates()
+
+
+def prepare_voice_request(audioData, audioFormat=None, chatId=None, deadline=None):
+    """
+    Transcribe a recording while the chat history is loaded and the planning data is warmed.
+
+    The chat lookup and the warm-up do not depend on the transcript, so they run next to Whisper
+    and only the transcription is on the critical path.
+
+    Args:
+        audioData (bytes): The uploaded recording
+        audioFormat (str, optional): Format of the recording, e.g. 'webm'
+        chatId (int, optional): The chat the recording continues
+        deadline (Deadline, optional): Latency budget of the request (see deadlines.voice_deadline)
+
+    Returns:
+        dict: 'transcription', 'chatId' and 'history' (see load_chat_history; None for a new chat)
+        and 'timings' (ms per stage)
+    """
+    app = current_app._get_current_object()
+    executor = _get_executor()
+    started = time.perf_counter()
+
+    transcription_future = executor.submit(_timed_stage, app, transcribeAudioUsingOpenAI, audioData,
+                                           audioFormat, deadline)
+    chat_future = executor.submit(_timed_stage, app, load_chat_history, chatId)
+    warm_future = executor.submit(_timed_stage, app, warm_planning_data)
+
+    timings = {}
+    transcription, timings['transcription_ms'] = transcription_future.result()
+    (knownChatId, history), timings['chat_lookup_ms'] = chat_future.result()
+    _, timings['warm_ms'] = warm_future.result()
+    timings['prepare_ms'] = round((time.perf_counter() - started) * 1000, 1)
+
+    return {
+        'transcription': transcription,
+        'chatId': knownChatId,
+        'history': history,
+        'timings': timings
+    }
+
+
+def run_voice_pipeline(audioData, audioFormat=None, chatId=None, deadline=None):
+    """
+    Transcribe a recording and answer it (see prepare_voice_request), within `deadline` when given.
+
+    Returns:
+        dict: 'transcription', 'response', 'chatId' and 'timings' (ms per stage and 'total_ms')
+    """
+    started = time.perf_counter()
+    prepared = prepare_voice_request(audioData, audioFormat, chatId, deadline)
+    timings = prepared['timings']
+    transcription = prepared['transcription']
+
+    # Only generate a response if there's text to respond to
+    responseText = ""
+    newChatId = None
+    if transcription and transcription.strip():
+        answer_started = time.perf_counter()
+        # Answers to voice commands go ahead of typed chat
+        with ai_priority('voice'):
+            responseText, newChatId = generateResponse(transcription, prepared['chatId'], history=prepared['history'],
+                                                       deadline=deadline)
+        timings['answer_ms'] = round((time.perf_counter() - answer_started) * 1000, 1)
+    else:
+        responseText = "Не разбирам това което казваш. Моля повтори съобщението."
+
+    timings['total_ms'] = round((time.perf_counter() - started) * 1000, 1)
+    for stage, elapsed_ms in timings.items():
+        metrics.observe('voice_stage_ms', elapsed_ms, labels={'stage': stage})
+    current_app.logger.info(f"Voice pipeline timings: {timings}")
+    if deadline is not None:
+        current_app.logger.info(f"Voice pipeline budget: {deadline.summary()}")
+
+    return {
+        'transcription': transcription,
+        'response': responseText,
+        'chatId': newChatId,
+        'timings': timings
+    }
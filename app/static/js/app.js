@@ -13,6 +13,7 @@ $(document).ready(function () {
 
     // Initialize variables
     let recorder = null;
+    let streamingUpload = null;  // Upload of the recording in progress
     let recordingTimeout = null;
     const maxRecordingTime = 60000; // 60 seconds
 
@@ -41,12 +42,21 @@ $(document).ready(function () {
             $recordButton.addClass('recording');
             $recordingStatus.text('Записване... (говорете сега)');
 
+            // Upload the recording while the user is speaking
+            streamingUpload = new StreamingUpload(recorder.mediaRecorder.mimeType, currentChatId);
+
             // Set timeout to automatically stop recording after maxRecordingTime
             recordingTimeout = setTimeout(() => {
                 stopRecording();
             }, maxRecordingTime);
         };
 
+        recorder.onDataAvailable = (chunk) => {
+            if (streamingUpload) {
+                streamingUpload.send(chunk);
+            }
+        };
+
         recorder.onStop = async (audioBlob) => {
             $recordButton.removeClass('recording');
             $recordingStatus.text('Обработка на аудио...');
@@ -58,7 +68,9 @@ $(document).ready(function () {
             }
 
             // Send the audio for transcription
-            await sendAudioForTranscription(audioBlob);
+            const upload = streamingUpload;
+            streamingUpload = null;
+            await sendAudioForTranscription(audioBlob, upload);
         };
 
         recorder.onError = (error) => {
@@ -220,54 +232,71 @@ $(document).ready(function () {
         return { $messageContainer, $messageContent };
     }
 
-    // Update message content with typewriter effect - simplified version
-    function typewriterEffect($messageContent, text) {
-        const typingSpeed = 35; // ms per character
-
-        // Clear the element initially
-        $messageContent.empty();
-
-        let formattedText = text;
-        let index = 0;
-        let htmlBuffer = '';
-        let inTag = false;
-        let tagBuffer = '';
-
-        // Set placeholder text while typing
-        $messageContent.html('<span class="typing-cursor">|</span>');
-
-        function processNextChunk() {
-            // Process 3 characters at a time for better performance
-            for (let i = 0; i < 3; i++) {
-                if (index >= formattedText.length) {
-                    // Render the final result with proper markdown
-                    $messageContent.html(renderMarkdown(text));
+    // Read a Server-Sent Events response from fetch and call onEvent(event, data) for each event
+    async function readEventStream(response, onEvent) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+
+            buffer += decoder.decode(value, { stream: true });
+
+            // Events are separated by a blank line
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const rawEvent = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+
+                let event = 'message';
+                let data = '';
+                rawEvent.split('\n').forEach(line => {
+                    if (line.startsWith('event: ')) {
+                        event = line.slice(7);
+                    } else if (line.startsWith('data: ')) {
+                        data += line.slice(6);
+                    }
+                });
 
-                    // Scroll to the bottom
-                    $chatMessagesContainer.scrollTop($chatMessagesContainer[0].scrollHeight);
-                    return;
+                if (data) {
+                    onEvent(event, JSON.parse(data));
                 }
-
-                const char = formattedText[index];
-
-                htmlBuffer += char;
-                index++;
             }
+        }
+    }
 
-            // Update content with what we have so far - simple incremental approach
-            $messageContent.text(htmlBuffer);
-            $messageContent.append('<span class="typing-cursor">|</span>');
+    // Render assistant tokens as they arrive; returns the handler for the response events
+    function streamIntoMessage(assistantMessage) {
+        let text = '';
 
-            // Process the next chunk
-            setTimeout(processNextChunk, typingSpeed);
-        }
+        return function (event, data) {
+            if (event === 'token') {
+                if (!text) {
+                    assistantMessage.$messageContainer.removeClass('loading');
+                }
+                text += data.text;
+                assistantMessage.$messageContent.html(renderMarkdown(text) + '<span class="typing-cursor">|</span>');
+                $chatMessagesContainer.scrollTop($chatMessagesContainer[0].scrollHeight);
+            } else if (event === 'done') {
+                assistantMessage.$messageContainer.removeClass('loading');
+                assistantMessage.$messageContent.html(renderMarkdown(data.response || text || 'Няма наличен отговор'));
+            } else if (event === 'error') {
+                assistantMessage.$messageContainer.removeClass('loading');
+                assistantMessage.$messageContent.text('Възникна грешка. Моля, опитайте отново.');
+            }
 
-        // Start processing
-        processNextChunk();
+            // Update chat ID
+            if ((event === 'chat' || event === 'done') && data.chatId && data.chatId !== currentChatId) {
+                currentChatId = data.chatId;
+                $currentChatInfo.text(`Разговор #${currentChatId}`);
+            }
+        };
     }
 
     // Send audio for transcription
-    async function sendAudioForTranscription(audioBlob) {
+    async function sendAudioForTranscription(audioBlob, upload = null) {
         // Create form data with the audio blob
         const formData = new FormData();
 
@@ -300,49 +329,51 @@ $(document).ready(function () {
             // Add assistant message with loading state
             const assistantMessage = addLoadingMessage('assistant');
 
-            // Send the request
-            const response = await $.ajax({
-                url: '/transcribe',
-                type: 'POST',
-                data: formData,
-                processData: false,
-                contentType: false,
-                timeout: 30000  // 30 seconds
-            });
+            // Send the request; the response is streamed back as it is generated
+            const controller = new AbortController();
+            const timeoutId = setTimeout(() => controller.abort(), 30000);  // 30 seconds until the first byte
+            // Most of the recording is already on the server when it was uploaded while recording
+            let response = upload ? await upload.finish(controller.signal) : null;
+            if (!response) {
+                response = await fetch('/transcribe/stream', {
+                    method: 'POST',
+                    body: formData,
+                    signal: controller.signal
+                });
+            }
+            clearTimeout(timeoutId);
 
-            // Check for errors
-            if (response.error) {
-                $recordingStatus.text(`Грешка: ${response.error}`);
+            // Errors before streaming started (and silent recordings) come back as JSON
+            if (!response.ok || !(response.headers.get('Content-Type') || '').includes('text/event-stream')) {
+                const result = await response.json();
+                $recordingStatus.text(`Грешка: ${result.error}`);
                 userMessage.$messageContainer.remove();
-                assistantMessage.$messageContent.text(response.response || 'Възникна грешка. Моля, опитайте отново.');
+                assistantMessage.$messageContent.text(result.response || 'Възникна грешка. Моля, опитайте отново.');
                 assistantMessage.$messageContainer.removeClass('loading');
                 return;
             }
 
-            // Update the user message with transcription
-            if (response.transcription) {
-                userMessage.$messageContent.html(renderMarkdown(response.transcription));
-                userMessage.$messageContainer.removeClass('loading');
-                $recordingStatus.text('Транскрипцията е завършена');
-            } else {
-                userMessage.$messageContainer.remove();
-                $recordingStatus.text('Не можах да транскрибирам аудиото');
-            }
-
-            // Update the assistant message with response
-            if (response.response) {
-                assistantMessage.$messageContainer.removeClass('loading');
-                typewriterEffect(assistantMessage.$messageContent, response.response);
-            } else {
-                assistantMessage.$messageContent.text('Няма наличен отговор');
-                assistantMessage.$messageContainer.removeClass('loading');
-            }
+            const onResponseEvent = streamIntoMessage(assistantMessage);
+
+            await readEventStream(response, (event, data) => {
+                if (event === 'transcription') {
+                    // Update the user message with transcription
+                    if (data.transcription) {
+                        userMessage.$messageContent.html(renderMarkdown(data.transcription));
+                        userMessage.$messageContainer.removeClass('loading');
+                        $recordingStatus.text('Транскрипцията е завършена');
+                    } else {
+                        userMessage.$messageContainer.remove();
+                        $recordingStatus.text('Не можах да транскрибирам аудиото');
+                    }
+                    return;
+                }
 
-            // Update chat ID
-            if (response.chatId) {
-                currentChatId = response.chatId;
-                $currentChatInfo.text(`Разговор #${currentChatId}`);
-            }
+                if (event === 'error') {
+                    $recordingStatus.text(`Грешка: ${data.error}`);
+                }
+                onResponseEvent(event, data);
+            });
         } catch (error) {
             console.error('Error transcribing audio:', error);
             $recordingStatus.text(`Грешка: ${error.statusText || error.message || 'Неуспешна транскрипция на аудио'}`);
@@ -434,42 +465,33 @@ $(document).ready(function () {
     }
 
     // Add a function to send text messages directly
-    function sendTextMessage(message) {
-        try {
-            // Add user message with content
-            addMessageToDisplay('user', message);
+    async function sendTextMessage(message) {
+        // Add user message with content
+        addMessageToDisplay('user', message);
 
-            // Add assistant message with loading state
-            const assistantMessage = addLoadingMessage('assistant');
+        // Add assistant message with loading state
+        const assistantMessage = addLoadingMessage('assistant');
 
-            // Send the request
-            $.ajax({
-                url: '/chat',
-                type: 'POST',
-                data: JSON.stringify({
+        try {
+            // Send the request and render the response as it is streamed back
+            const response = await fetch('/chat/stream', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({
                     message: message,
                     chatId: currentChatId
-                }),
-                contentType: 'application/json',
-                success: function (response) {
-                    // Update assistant response with typewriter effect
-                    assistantMessage.$messageContainer.removeClass('loading');
-                    typewriterEffect(assistantMessage.$messageContent, response.response);
-
-                    // Update chat ID if provided
-                    if (response.chatId && !currentChatId) {
-                        currentChatId = response.chatId;
-                        $currentChatInfo.text(`Разговор #${currentChatId}`);
-                    }
-                },
-                error: function (xhr, status, error) {
-                    console.error('Error sending text message:', error);
-                    assistantMessage.$messageContent.text('Възникна грешка. Моля, опитайте отново.');
-                    assistantMessage.$messageContainer.removeClass('loading');
-                }
+                })
             });
+
+            if (!response.ok) {
+                throw new Error(`HTTP ${response.status}`);
+            }
+
+            await readEventStream(response, streamIntoMessage(assistantMessage));
         } catch (error) {
             console.error('Error sending text message:', error);
+            assistantMessage.$messageContent.text('Възникна грешка. Моля, опитайте отново.');
+            assistantMessage.$messageContainer.removeClass('loading');
         }
     }
 
@@ -271,4 +271,101 @@ class AudioRecorder {
             return false;
         }
     }
-}
\ No newline at end of file
+}
+
+/**
+ * Upload a recording to the server while it is being made.
+ *
+ * Chunks from the recorder's dataavailable events are posted to an upload session in order;
+ * the newest chunk is held back and sent with the finish request, so after the user stops
+ * only one request carrying about one second of audio is left on the critical path.
+ */
+class StreamingUpload {
+    constructor(contentType, chatId = null) {
+        this.contentType = contentType;
+        this.chatId = chatId;
+        this.sessionId = null;
+        this.nextIndex = 0;
+        this.heldChunk = null;
+        this.failed = false;
+        // Requests run one after another so chunks arrive in order
+        this.pending = this.start();
+    }
+
+    /**
+     * Open the upload session
+     */
+    async start() {
+        try {
+            const response = await fetch('/transcribe/session', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ contentType: this.contentType, chatId: this.chatId })
+            });
+            if (!response.ok) {
+                throw new Error(`Session not created (${response.status})`);
+            }
+            this.sessionId = (await response.json()).sessionId;
+        } catch (error) {
+            console.warn('Streaming upload unavailable, the recording will be sent when it ends:', error);
+            this.failed = true;
+        }
+    }
+
+    /**
+     * Queue a chunk of the recording; the previous held chunk is uploaded now
+     */
+    send(chunk) {
+        if (!chunk || chunk.size === 0 || this.failed) {
+            return;
+        }
+
+        const previous = this.heldChunk;
+        this.heldChunk = { index: this.nextIndex++, data: chunk };
+        if (previous) {
+            this.pending = this.pending.then(() => this.postChunk(previous));
+        }
+    }
+
+    async postChunk(chunk) {
+        if (this.failed) {
+            return;
+        }
+        try {
+            const response = await fetch(`/transcribe/session/${this.sessionId}/chunk?index=${chunk.index}`, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/octet-stream' },
+                body: chunk.data
+            });
+            if (!response.ok) {
+                throw new Error(`Chunk ${chunk.index} rejected (${response.status})`);
+            }
+        } catch (error) {
+            console.warn('Streaming upload failed, the recording will be sent when it ends:', error);
+            this.failed = true;
+        }
+    }
+
+    /**
+     * Send the last chunk and close the session; resolves to the server's response
+     * (Server-Sent Events, like /transcribe/stream), or null if the upload failed.
+     * Any 4xx (expired session, missing chunks, too large) means the session cannot be
+     * used, so the caller sends the whole recording instead
+     */
+    async finish(signal) {
+        await this.pending;
+        if (this.failed || !this.sessionId) {
+            return null;
+        }
+
+        const last = this.heldChunk;
+        const query = last ? `?index=${last.index}` : '';
+        const response = await fetch(`/transcribe/session/${this.sessionId}/finish${query}`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/octet-stream' },
+            body: last ? last.data : null,
+            signal: signal
+        });
+        return response.status >= 400 && response.status < 500 ? null : response;
+    }
+}
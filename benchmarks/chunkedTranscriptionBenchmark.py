@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Long-recording transcription latency: one Whisper request vs. parallel chunks split at pauses.
+
+Synthetic recordings are phrases of tone 'words' (see mockOpenAIServer.tone_transcript) with
+short gaps between words and longer pauses between phrases. The mock transcription server
+takes a fixed delay plus a delay per second of audio, like the real API. The script reports
+latency of both modes and checks that the stitched chunk transcripts match the single-request
+transcript word for word.
+
+Usage:
+    python benchmarks/chunkedTranscriptionBenchmark.py [--minutes 1 3 5] [--parallelism 4]
+"""
+
+import os
+import sys
+import io
+import time
+import random
+import difflib
+import argparse
+import logging
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+
+logger = logging.getLogger(__name__)
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from flask import Flask
+from pydub import AudioSegment
+from pydub.generators import Sine
+from benchmarks.mockOpenAIServer import MockOpenAIServer, TONE_BASE_HZ, TONE_STEP_HZ, tone_word
+from app.config import Config
+
+
+def build_recording(seconds, seed=0, continuous=False):
+    """
+    Synthetic dictation and the words it contains.
+
+    Args:
+        seconds (float): Approximate length
+        seed (int): Random seed
+        continuous (bool): No phrase pauses (forces cuts inside speech, i.e. overlapping chunks)
+    """
+    rng = random.Random(seed)
+    audio = AudioSegment.silent(duration=300, frame_rate=16000)
+    words = []
+    while len(audio) < seconds * 1000:
+        for _ in range(rng.randint(5, 12)):
+            k = rng.randint(0, 39)
+            words.append(tone_word(k))
+            tone = Sine(TONE_BASE_HZ + TONE_STEP_HZ * k, sample_rate=16000)
+            audio += tone.to_audio_segment(duration=rng.randint(250, 450), volume=-12)
+            audio += AudioSegment.silent(duration=rng.randint(80, 150), frame_rate=16000)
+        if not continuous:
+            audio += AudioSegment.silent(duration=rng.randint(600, 1200), frame_rate=16000)
+
+    output = io.BytesIO()
+    audio.set_channels(1).export(output, format='wav')
+    return output.getvalue(), words
+
+
+def transcribe(app, recording, chunk_ms, parallelism):
+    from app.services.audioServices import prepare_whisper_upload
+    from app.services.openaiServices import _transcribe_uploads
+
+    app.config.update(AUDIO_CHUNK_MS=chunk_ms, AUDIO_CHUNK_PARALLELISM=parallelism)
+    with app.app_context():
+        started = time.perf_counter()
+        uploads, info = prepare_whisper_upload(recording, 'wav')
+        text = _transcribe_uploads(uploads, info.get('overlapped'))
+        return text, info['chunks'], (time.perf_counter() - started) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--minutes', type=float, nargs='+', default=[1, 3, 5])
+    parser.add_argument('--chunk-ms', type=int, default=30000)
+    parser.add_argument('--parallelism', type=int, default=4)
+    parser.add_argument('--base-ms', type=float, default=400.0, help='mock delay per request')
+    parser.add_argument('--ms-per-second', type=float, default=120.0, help='mock delay per second of audio')
+    args = parser.parse_args()
+
+    mock = MockOpenAIServer(transcription_ms=args.base_ms, transcription_ms_per_second=args.ms_per_second,
+                            tone_words=True)
+    os.environ.setdefault('OPENAI_API_KEY', 'mock')
+
+    app = Flask('chunkBenchmark')
+    app.config.from_object(Config)
+    # Decoded audio goes out as WAV so the mock can hear the words; AUDIO_UPLOAD_FORMAT=mp3 is the default
+    app.config.update(OPENAI_BASE_URL=mock.start(), AUDIO_UPLOAD_FORMAT='wav', AUDIO_TRIM_SILENCE=True)
+
+    for minutes in args.minutes:
+        for continuous in (False, True):
+            recording, words = build_recording(minutes * 60, seed=int(minutes * 10), continuous=continuous)
+            single, _, single_ms = transcribe(app, recording, 0, 1)
+            chunked, chunks, chunked_ms = transcribe(app, recording, args.chunk_ms, args.parallelism)
+
+            single_words, chunked_words = single.split(), chunked.split()
+            accuracy = difflib.SequenceMatcher(a=single_words, b=chunked_words, autojunk=False).ratio()
+            logger.info(f"{minutes:4.1f} min {'continuous' if continuous else 'phrases   '} | "
+                        f"single: {single_ms:7.0f} ms ({len(single_words)}/{len(words)} words) | "
+                        f"{chunks:2d} chunks: {chunked_ms:7.0f} ms ({len(chunked_words)} words) | "
+                        f"speed-up x{single_ms / chunked_ms:4.1f}, word match {accuracy:.3f}")
+
+    mock.stop()
+
+
+if __name__ == "__main__":
+    main()
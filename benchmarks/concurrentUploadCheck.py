@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Concurrency check: simultaneous /transcribe uploads must each get their own transcript.
+
+Starts the mock OpenAI server and the app (SQLite database in a temp dir) on local ports, posts
+N different recordings at the same moment and compares every transcript with the one the mock
+produces for that recording's own upload. Also checks that no audio files are left in UPLOAD_FOLDER.
+Exits with status 1 on any mismatch.
+
+Usage:
+    python benchmarks/concurrentUploadCheck.py [--uploads 8] [--transcription-ms 500]
+"""
+
+import os
+import sys
+import io
+import time
+import argparse
+import logging
+import tempfile
+import threading
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+
+logger = logging.getLogger(__name__)
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import httpx
+from pydub.generators import Sine
+from werkzeug.serving import make_server
+from benchmarks.mockOpenAIServer import MockOpenAIServer, transcript_for
+
+
+def build_recordings(count, seconds=1.5):
+    """WAV recordings that differ in pitch, so every upload has different bytes."""
+    recordings = []
+    for i in range(count):
+        output = io.BytesIO()
+        Sine(220 + 40 * i).to_audio_segment(duration=int(seconds * 1000)).export(output, format='wav')
+        recordings.append(output.getvalue())
+    return recordings
+
+
+def start_app(mock_url, workdir):
+    os.environ.setdefault('OPENAI_API_KEY', 'mock')
+
+    from app import createApp
+    from app.config import Config
+
+    class CheckConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{os.path.join(workdir, 'check.db')}"
+        SQLALCHEMY_ENGINE_OPTIONS = {}
+        OPENAI_BASE_URL = mock_url
+
+    app = createApp(CheckConfig)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return app, server, f"http://127.0.0.1:{server.server_port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--uploads', type=int, default=8)
+    parser.add_argument('--transcription-ms', type=float, default=500.0)
+    args = parser.parse_args()
+
+    mock = MockOpenAIServer(transcription_ms=args.transcription_ms, chat_ms=50)
+    mock_url = mock.start()
+    app, server, app_url = start_app(mock_url, tempfile.mkdtemp(prefix='upload-check-'))
+
+    from app.services.audioServices import prepare_whisper_upload, encode_upload
+
+    recordings = build_recordings(args.uploads)
+    with app.app_context():
+        expected = [transcript_for(encode_upload(prepare_whisper_upload(recording, 'wav')[0][0])[1])
+                    for recording in recordings]
+    uploads_before = set(os.listdir(app.config['UPLOAD_FOLDER']))
+
+    results = [None] * args.uploads
+    barrier = threading.Barrier(args.uploads)
+
+    def upload(i):
+        with httpx.Client(timeout=60) as client:
+            barrier.wait()
+            started = time.perf_counter()
+            response = client.post(f"{app_url}/transcribe",
+                                   files={'audio': (f'recording{i}.wav', recordings[i], 'audio/wav')})
+            results[i] = (response.json(), (time.perf_counter() - started) * 1000)
+
+    threads = [threading.Thread(target=upload, args=(i,)) for i in range(args.uploads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    failures = 0
+    for i, (result, latency_ms) in enumerate(results):
+        transcript = result.get('transcription')
+        ok = transcript == expected[i]
+        failures += not ok
+        logger.info(f"upload {i}: {'ok      ' if ok else 'MISMATCH'} {transcript!r} (expected {expected[i]!r}), "
+                    f"{latency_ms:6.0f} ms, timings {result.get('timings')}")
+
+    leftovers = set(os.listdir(app.config['UPLOAD_FOLDER'])) - uploads_before
+    if leftovers:
+        failures += 1
+        logger.error(f"Files left in {app.config['UPLOAD_FOLDER']}: {sorted(leftovers)}")
+
+    logger.info(f"{args.uploads - failures} of {args.uploads} uploads got their own transcript; "
+                f"mock saw up to {mock.max_in_flight} requests in flight")
+
+    server.shutdown()
+    mock.stop()
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Local stand-in for the OpenAI endpoints the app calls, for load and concurrency checks.
+
+    POST /v1/audio/transcriptions  -> {"text": transcript_for(<uploaded file bytes>)}, or with
+                                      --tone-words the words of a synthetic WAV (see tone_transcript)
+    POST /v1/chat/completions      -> echoes the last user message (streamed when "stream": true)
+
+Point the app at it with OPENAI_BASE_URL=http://127.0.0.1:<port>/v1 and any OPENAI_API_KEY.
+
+Usage:
+    python benchmarks/mockOpenAIServer.py [--port 8089] [--transcription-ms 800] [--chat-ms 300]
+"""
+
+import io
+import json
+import time
+import wave
+import hashlib
+import argparse
+import logging
+import threading
+from email import policy
+from email.parser import BytesParser
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import numpy as np
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+
+logger = logging.getLogger(__name__)
+
+
+def transcript_for(audio_bytes):
+    """The text the mock 'hears' in an upload: a digest of its bytes, so every recording gets its own."""
+    return f"запис {hashlib.sha256(audio_bytes).hexdigest()[:12]}"
+
+
+# Synthetic speech: word k is a tone of TONE_BASE_HZ + k * TONE_STEP_HZ
+TONE_BASE_HZ = 200
+TONE_STEP_HZ = 20
+TONE_FRAME_MS = 20
+MIN_TONE_MS = 60
+
+# Assumed bitrate of non-WAV uploads when estimating their duration
+COMPRESSED_BYTES_PER_SECOND = 32000 / 8
+
+
+def tone_word(k):
+    return f"дума{k}"
+
+
+def tone_transcript(wav_bytes):
+    """
+    'Recognise' a synthetic recording: every tone burst becomes the word of its pitch.
+
+    Bursts are runs of frames louder than -35 dBFS; bursts shorter than MIN_TONE_MS (the clipped
+    end of a word at a chunk edge) are not heard, like a real model skipping a cut-off syllable.
+    """
+    with wave.open(io.BytesIO(wav_bytes)) as reader:
+        rate = reader.getframerate()
+        samples = np.frombuffer(reader.readframes(reader.getnframes()), dtype=np.int16).astype(np.float64)
+
+    frame = int(rate * TONE_FRAME_MS / 1000)
+    frames = len(samples) // frame
+    if frames == 0:
+        return ''
+    rms = np.sqrt(np.mean(np.square(samples[:frames * frame].reshape(frames, frame)), axis=1))
+    loud = 20 * np.log10(np.maximum(rms, 1e-9) / 32768) > -35
+
+    words = []
+    position = 0
+    while position < frames:
+        if not loud[position]:
+            position += 1
+            continue
+        end = position
+        while end < frames and loud[end]:
+            end += 1
+        if (end - position) * TONE_FRAME_MS >= MIN_TONE_MS:
+            burst = samples[position * frame:end * frame]
+            spectrum = np.abs(np.fft.rfft(burst))
+            frequency = np.argmax(spectrum) * rate / len(burst)
+            words.append(tone_word(int(round((frequency - TONE_BASE_HZ) / TONE_STEP_HZ))))
+        position = end
+    return ' '.join(words)
+
+
+def audio_seconds(audio_bytes):
+    """Duration of an upload: exact for WAV, estimated from the size for compressed audio."""
+    if audio_bytes[:4] == b'RIFF':
+        with wave.open(io.BytesIO(audio_bytes)) as reader:
+            return reader.getnframes() / reader.getframerate()
+    return len(audio_bytes) / COMPRESSED_BYTES_PER_SECOND
+
+
+def _multipart_fields(content_type, body):
+    """Form fields of a multipart/form-data body: name -> bytes."""
+    message = BytesParser(policy=policy.default).parsebytes(
+        b'Content-Type: ' + content_type.encode('latin-1') + b'\r\n\r\n' + body)
+    return {part.get_param('name', header='content-disposition'): part.get_payload(decode=True)
+            for part in message.iter_parts()}
+
+
+class MockOpenAIServer:
+    def __init__(self, host='127.0.0.1', port=0, transcription_ms=0.0, chat_ms=0.0,
+                 transcription_ms_per_second=0.0, tone_words=False):
+        """
+        Threaded HTTP server answering like the OpenAI API after fixed delays.
+
+        Args:
+            host (str): Interface to listen on
+            port (int): Port, 0 for a free one
+            transcription_ms (float): Delay of every transcription response
+            chat_ms (float): Delay of every chat completion (spread over the chunks when streaming)
+            transcription_ms_per_second (float): Extra transcription delay per second of audio
+            tone_words (bool): Transcribe WAV uploads with tone_transcript instead of a digest
+        """
+        self.transcription_ms = transcription_ms
+        self.chat_ms = chat_ms
+        self.transcription_ms_per_second = transcription_ms_per_second
+        self.tone_words = tone_words
+        self.requests = {}
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                server._enter(self.path)
+                try:
+                    if self.path.endswith('/audio/transcriptions'):
+                        server._transcription(self, body)
+                    elif self.path.endswith('/chat/completions'):
+                        server._chat(self, json.loads(body))
+                    else:
+                        self._send_json(404, {'error': {'message': f'Unknown path {self.path}'}})
+                finally:
+                    server._leave()
+
+            def _send_json(self, status, payload):
+                data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        """Serve in a background thread; returns the base URL."""
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self.base_url
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _enter(self, path):
+        with self._lock:
+            self.requests[path] = self.requests.get(path, 0) + 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def _leave(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def _transcription(self, handler, body):
+        audio_bytes = _multipart_fields(handler.headers['Content-Type'], body).get('file') or b''
+        delay_ms = self.transcription_ms
+        if self.transcription_ms_per_second:
+            delay_ms += self.transcription_ms_per_second * audio_seconds(audio_bytes)
+        time.sleep(delay_ms / 1000)
+
+        if self.tone_words and audio_bytes[:4] == b'RIFF':
+            text = tone_transcript(audio_bytes)
+        else:
+            text = transcript_for(audio_bytes)
+        handler._send_json(200, {'text': text})
+
+    def _chat(self, handler, request):
+        user_messages = [message for message in request.get('messages', []) if message.get('role') == 'user']
+        text = str(user_messages[-1]['content']) if user_messages else ''
+        usage = {'prompt_tokens': len(json.dumps(request.get('messages', []))) // 4,
+                 'completion_tokens': max(1, len(text) // 4),
+                 'prompt_tokens_details': {'cached_tokens': 0}}
+        usage['total_tokens'] = usage['prompt_tokens'] + usage['completion_tokens']
+        base = {'id': 'chatcmpl-mock', 'created': int(time.time()), 'model': request.get('model', 'mock')}
+
+        if not request.get('stream'):
+            time.sleep(self.chat_ms / 1000)
+            handler._send_json(200, {**base, 'object': 'chat.completion', 'usage': usage, 'choices': [
+                {'index': 0, 'finish_reason': 'stop', 'message': {'role': 'assistant', 'content': text}}]})
+            return
+
+        handler.send_response(200)
+        handler.send_header('Content-Type', 'text/event-stream')
+        handler.send_header('Transfer-Encoding', 'chunked')
+        handler.end_headers()
+
+        def send_event(payload):
+            data = f"data: {payload}\n\n".encode('utf-8')
+            handler.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+            handler.wfile.flush()
+
+        pieces = [text[i:i + 8] for i in range(0, len(text), 8)] or ['']
+        for piece in pieces:
+            time.sleep(self.chat_ms / 1000 / len(pieces))
+            send_event(json.dumps({**base, 'object': 'chat.completion.chunk', 'choices': [
+                {'index': 0, 'finish_reason': None, 'delta': {'content': piece}}]}, ensure_ascii=False))
+        send_event(json.dumps({**base, 'object': 'chat.completion.chunk', 'choices': [], 'usage': usage}))
+        send_event('[DONE]')
+        handler.wfile.write(b"0\r\n\r\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--transcription-ms', type=float, default=800.0)
+    parser.add_argument('--chat-ms', type=float, default=300.0)
+    parser.add_argument('--transcription-ms-per-second', type=float, default=0.0)
+    parser.add_argument('--tone-words', action='store_true')
+    args = parser.parse_args()
+
+    server = MockOpenAIServer(args.host, args.port, args.transcription_ms, args.chat_ms,
+                              args.transcription_ms_per_second, args.tone_words)
+    logger.info(f"Mock OpenAI API on {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
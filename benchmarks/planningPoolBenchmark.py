@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Mixed-load latency benchmark: planning queries in the request thread vs. in the PlanningPool.
+
+Heavy threads loop on 'all products' listings while light threads simulate I/O-bound
+requests (a network wait followed by response parsing, like an OpenAI call). With in-thread
+execution the pandas work holds the GIL and the light requests queue behind it.
+
+Usage:
+    python benchmarks/planningPoolBenchmark.py [--rows 3000] [--seconds 10] [--workers 2] > /dev/null
+
+The report is logged to stderr; stdout only carries the processor's debug prints.
+"""
+
+import os
+import sys
+import io
+import json
+import time
+import argparse
+import logging
+import tempfile
+import threading
+import contextlib
+import statistics
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+
+logger = logging.getLogger(__name__)
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from flask import Flask
+from benchmarks.syntheticData import write_workbook
+from app.services.excelServices import ProductionPlanningProcessor
+from app.services.planningPool import PlanningPool
+
+HEAVY_QUERY = "Покажи ми всички модели за клиент lebek"
+
+# Roughly the size of a chat completion response body
+LIGHT_PAYLOAD = json.dumps({'choices': [{'message': {'content': 'отговор ' * 400}}] * 20})
+
+
+def light_request():
+    """Simulated OpenAI call: wait on the network, then parse the response."""
+    time.sleep(0.05)
+    json.loads(LIGHT_PAYLOAD)
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run_mixed_load(run_heavy, seconds, heavy_threads, light_threads):
+    """Run heavy and light threads together for `seconds` and collect latencies in ms."""
+    stop = threading.Event()
+    heavy_latencies = []
+    light_latencies = []
+    lock = threading.Lock()
+    app = Flask('planningBenchmark')
+
+    def heavy_loop():
+        with app.app_context():
+            while not stop.is_set():
+                started = time.perf_counter()
+                run_heavy(HEAVY_QUERY)
+                with lock:
+                    heavy_latencies.append((time.perf_counter() - started) * 1000)
+
+    def light_loop():
+        while not stop.is_set():
+            started = time.perf_counter()
+            light_request()
+            with lock:
+                light_latencies.append((time.perf_counter() - started) * 1000)
+
+    threads = [threading.Thread(target=heavy_loop) for _ in range(heavy_threads)]
+    threads += [threading.Thread(target=light_loop) for _ in range(light_threads)]
+
+    # The processor prints whole result dictionaries; keep them out of the report
+    with contextlib.redirect_stdout(io.StringIO()):
+        for thread in threads:
+            thread.start()
+        time.sleep(seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+    return heavy_latencies, light_latencies
+
+
+def report(label, heavy, light, seconds):
+    logger.info(
+        f"{label:10s} heavy: {len(heavy) / seconds:6.2f} q/s, p50 {percentile(heavy, 50):7.1f} ms | "
+        f"light: p50 {percentile(light, 50):7.1f} ms, p95 {percentile(light, 95):7.1f} ms, "
+        f"p99 {percentile(light, 99):7.1f} ms, mean {statistics.fmean(light) if light else 0:7.1f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=3000, help='rows per synthetic sheet')
+    parser.add_argument('--seconds', type=float, default=10.0, help='duration of each run')
+    parser.add_argument('--workers', type=int, default=2, help='planning pool worker processes')
+    parser.add_argument('--heavy-threads', type=int, default=2)
+    parser.add_argument('--light-threads', type=int, default=8)
+    args = parser.parse_args()
+
+    workbook = os.path.join(tempfile.mkdtemp(prefix='planning-bench-'), 'Production planning 2025.xlsx')
+    logger.info(f"Writing synthetic workbook with {args.rows} rows per sheet to {workbook}")
+    write_workbook(workbook, rows=args.rows)
+
+    # Baseline: light requests alone
+    _, idle = run_mixed_load(lambda query: None, args.seconds / 2, 0, args.light_threads)
+    report('idle', [], idle, args.seconds / 2)
+
+    # In-thread execution, the way generateResponse runs it today
+    with Flask('planningBenchmark').app_context(), contextlib.redirect_stdout(io.StringIO()):
+        processor = ProductionPlanningProcessor(workbook)
+        processor.process_query(HEAVY_QUERY)  # load the sheets before measuring
+    heavy, light = run_mixed_load(processor.process_query, args.seconds, args.heavy_threads, args.light_threads)
+    report('in-thread', heavy, light, args.seconds)
+
+    # Worker pool execution
+    pool = PlanningPool(workbook, workers=args.workers, max_pending=args.heavy_threads * 2, timeout=60)
+    try:
+        logger.info(f"Warmed planning workers: {pool.warm()}")
+        heavy, light = run_mixed_load(pool.process_query, args.seconds, args.heavy_threads, args.light_threads)
+        report('pool', heavy, light, args.seconds)
+    finally:
+        pool.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Microbenchmark: recursive OpenAIExcelProcessor._json_serializable vs. vectorized frame_to_records.
+
+Both paths encode the same dataframe slices to JSON; the script checks that they decode to
+the same records before timing them.
+
+Usage:
+    python benchmarks/serializationBenchmark.py [--rows 10 100 1000] [--repeat 20]
+"""
+
+import os
+import sys
+import io
+import json
+import timeit
+import argparse
+import logging
+import contextlib
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+
+logger = logging.getLogger(__name__)
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+import pandas as pd
+from benchmarks.syntheticData import build_sheets
+from app.services.openAiExcelProcessor import OpenAIExcelProcessor
+from app.services.excelContext import frame_to_records, dumps_json, orjson
+
+
+def sample_frame(rows):
+    """Confection sheet with the messy cells real workbooks have: gaps, dates, NaT, numpy scalars."""
+    df = build_sheets(rows)['confekcia'].copy()
+    df['срок'] = pd.date_range('2025-01-06', periods=rows, freq='D')
+    df.loc[df.index[::7], 'срок'] = pd.NaT
+    df.loc[df.index[::5], 'Поръчка'] = np.nan
+    df['бележка'] = [None if i % 3 else f'бележка {i}' for i in range(rows)]
+    df['смесено'] = [pd.Timestamp('2025-03-01') if i % 4 == 0 else np.int64(i) if i % 4 == 1 else
+                     np.nan if i % 4 == 2 else 'текст' for i in range(rows)]
+    return df
+
+
+def recursive_path(processor, df):
+    return json.dumps(processor._json_serializable(df.to_dict(orient='records')), ensure_ascii=False)
+
+
+def vectorized_path(df):
+    return dumps_json(frame_to_records(df))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, nargs='+', default=[10, 100, 1000, 5000])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        processor = OpenAIExcelProcessor(file_path=os.path.join(os.path.dirname(__file__), 'missing.xlsx'))
+
+    logger.info(f"JSON encoder: {'orjson ' + orjson.__version__ if orjson else 'json (orjson not installed)'}")
+
+    for rows in args.rows:
+        df = sample_frame(rows)
+
+        # The recursive path writes NaT as the string 'NaT'; the vectorized one as null
+        expected = [{key: (None if value == 'NaT' else value) for key, value in record.items()}
+                    for record in json.loads(recursive_path(processor, df))]
+        if json.loads(vectorized_path(df)) != expected:
+            raise SystemExit(f"Output mismatch at {rows} rows")
+
+        recursive = min(timeit.repeat(lambda: recursive_path(processor, df), number=1, repeat=args.repeat))
+        vectorized = min(timeit.repeat(lambda: vectorized_path(df), number=1, repeat=args.repeat))
+        logger.info(f"{rows:6d} rows: recursive {recursive * 1000:8.2f} ms, vectorized {vectorized * 1000:8.2f} ms, "
+                    f"speed-up x{recursive / vectorized:5.1f}")
+
+
+if __name__ == "__main__":
+    main()
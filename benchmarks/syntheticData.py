@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Synthetic production planning data for the benchmark scripts.
+
+The sheets mirror the columns the processors read from 'Production planning 2025.xlsx',
+so the benchmarks can run without the real workbook.
+"""
+
+import os
+import random
+import pandas as pd
+
+CLIENTS = ['Lebek', 'Matinique', 'Robert Todd', 'Zerbi', 'Hugo', 'Marc O Polo', 'Tom Tailor', 'Esprit']
+PRODUCT_TYPES = ['пуловер', 'жилетка', 'жил с коп', 'жил с цип', 'риза', 'троер', 'елек', 'рокля']
+FACTORIES = ['цех 1', 'цех 2', 'цех 3', 'етаж 2']
+GAUGES = [3, 5, 7, 12, 14]
+MONTHS = ['януари', 'февруари', 'март', 'април', 'май', 'юни',
+          'юли', 'август', 'септември', 'октомври', 'ноември', 'декември']
+
+
+def build_sheets(rows=2000, seed=42):
+    """Build the three planning sheets as dataframes with `rows` product rows each."""
+    rnd = random.Random(seed)
+    records = []
+    for i in range(rows):
+        ordered = rnd.randint(50, 2000)
+        knitted = rnd.randint(0, ordered)
+        confectioned = rnd.randint(0, knitted)
+        record = {
+            'Фирма': CLIENTS[i % len(CLIENTS)],
+            'No': i + 1,
+            'Модел': f'{rnd.choice(["pp-co", "mt", "rt", "zb"])}-{rnd.randint(1000, 9999)}',
+            'файн': rnd.choice(GAUGES),
+            'цех': rnd.choice(FACTORIES),
+            'вид': rnd.choice(PRODUCT_TYPES),
+            'Поръчка': ordered,
+            'изплетено до момента в бр.': knitted,
+            'остава за плетене в бр': ordered - knitted,
+            'конфекционирано до момента в бр.': confectioned,
+            'остава за конфекция в бр': ordered - confectioned,
+        }
+        for month in MONTHS:
+            record[month] = rnd.choice([0, 0, rnd.randint(10, 300)])
+        records.append(record)
+
+    confection = pd.DataFrame(records)
+    knitting = confection.drop(columns=['конфекционирано до момента в бр.', 'остава за конфекция в бр'])
+    summary = (confection.groupby('Фирма', as_index=False)['Поръчка'].sum()
+               .rename(columns={'Поръчка': 'поръчки в бр.'}))
+
+    return {
+        'pletene': knitting,
+        'confekcia': confection,
+        'za pletene po fainove': summary,
+    }
+
+
+def write_workbook(path, rows=2000, seed=42):
+    """Write the synthetic sheets to an .xlsx file and return its path."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with pd.ExcelWriter(path) as writer:
+        for sheet_name, df in build_sheets(rows, seed).items():
+            df.to_excel(writer, sheet_name=sheet_name, index=False)
+    return path
@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Token usage and latency: context stuffing (OpenAIExcelProcessor) vs. tool calling (PlanningToolbox).
+
+Runs a fixed query set over synthetic planning data. By default the model is simulated: prompt
+tokens are estimated locally, the simulated model calls the expected tools, and model latency is
+derived from token counts (--base-ms, --prefill-ms, --decode-ms). Local work (context building,
+tool execution) is measured. With --live the real API is used and usage/latency are measured.
+
+Usage:
+    python benchmarks/toolCallingBenchmark.py [--rows 2000] [--live] > /dev/null
+"""
+
+import os
+import sys
+import io
+import json
+import time
+import argparse
+import logging
+import contextlib
+from types import SimpleNamespace
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+
+logger = logging.getLogger(__name__)
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from flask import Flask
+from benchmarks.syntheticData import build_sheets
+from app.services.excelServices import ProductionPlanningProcessor
+from app.services.openAiExcelProcessor import OpenAIExcelProcessor
+from app.services.planningTools import PlanningToolbox, run_tool_conversation, TOOL_DEFINITIONS
+from app.services.excelContext import estimate_tokens, dumps_json
+
+# Typical answer lengths of the simulated model, in tokens
+ANSWER_TOKENS = 150
+TOOL_CALL_TOKENS = 25
+
+
+def build_query_set(sheets):
+    """Queries with the tool calls a model is expected to make for them."""
+    model = str(sheets['confekcia'].loc[7, 'Модел'])
+    return [
+        ("Колко е поръчано и изплетено за клиент Lebek?", [('get_client_totals', {'client': 'Lebek'})]),
+        (f"Какво е състоянието на модел {model}?", [('get_model_status', {'models': [model]})]),
+        ("Какъв е планът за производство за февруари?", [('get_monthly_plan', {'month': 2})]),
+        ("Колко има за плетене за Matinique през март?", [('get_monthly_plan', {'month': 3, 'client': 'Matinique'})]),
+        ("Кой цех е най-натоварен?", [('get_factory_load', {})]),
+        ("Какво е натоварването на цех 2 за април?", [('get_factory_load', {'factory': 'цех 2', 'month': 4})]),
+        ("Сравни клиент Zerbi и Hugo по изплетени бройки",
+         [('get_client_totals', {'client': 'Zerbi'}), ('get_client_totals', {'client': 'Hugo'})]),
+        ("Колко жилетки има за фирма Esprit?", [('get_client_totals', {'client': 'Esprit'})]),
+    ]
+
+
+class SimulatedModel:
+    def __init__(self, base_ms, prefill_ms, decode_ms):
+        """Chat completion stand-in that charges latency by token counts instead of sleeping."""
+        self.base_ms = base_ms
+        self.prefill_ms = prefill_ms
+        self.decode_ms = decode_ms
+        self.expected_calls = []
+        self.elapsed_ms = 0.0
+
+    def create(self, messages, tools=None, tool_choice=None, **kwargs):
+        prompt_tokens = estimate_tokens(dumps_json(messages))
+        if tools:
+            prompt_tokens += estimate_tokens(dumps_json(tools))
+
+        wants_tools = tools and tool_choice != 'none' and messages[-1]['role'] == 'user'
+        if wants_tools:
+            tool_calls = [SimpleNamespace(id=f'call_{i}', type='function',
+                                          function=SimpleNamespace(name=name, arguments=json.dumps(args)))
+                          for i, (name, args) in enumerate(self.expected_calls)]
+            message = SimpleNamespace(content=None, tool_calls=tool_calls)
+            completion_tokens = TOOL_CALL_TOKENS * len(tool_calls)
+        else:
+            message = SimpleNamespace(content='Отговор.', tool_calls=None)
+            completion_tokens = ANSWER_TOKENS
+
+        self.elapsed_ms += self.base_ms + prompt_tokens * self.prefill_ms + completion_tokens * self.decode_ms
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)],
+                               usage=SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens))
+
+
+def run_context_stuffing(excel_processor, query, create_completion):
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        messages = excel_processor.build_messages(query)
+    local_ms = (time.perf_counter() - started) * 1000
+
+    response = create_completion(model='gpt-4o-mini', messages=messages, temperature=0.5, max_tokens=500)
+    return response.usage.prompt_tokens, response.usage.completion_tokens, 1, local_ms
+
+
+def run_tool_calling(toolbox, query, create_completion):
+    messages = [{'role': 'system', 'content': 'Use the planning tools to answer in Bulgarian.'},
+                {'role': 'user', 'content': query}]
+
+    started = time.perf_counter()
+    _, usage = run_tool_conversation(messages, toolbox, create_completion, model='gpt-4o-mini', max_tokens=500)
+    total_ms = (time.perf_counter() - started) * 1000
+    return usage['prompt_tokens'], usage['completion_tokens'], usage['rounds'], total_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=2000)
+    parser.add_argument('--live', action='store_true', help='call the OpenAI API instead of the simulated model')
+    parser.add_argument('--base-ms', type=float, default=300.0, help='simulated per-call overhead')
+    parser.add_argument('--prefill-ms', type=float, default=0.05, help='simulated ms per prompt token')
+    parser.add_argument('--decode-ms', type=float, default=12.0, help='simulated ms per completion token')
+    args = parser.parse_args()
+
+    sheets = build_sheets(args.rows)
+    Flask('toolBenchmark').app_context().push()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        missing = os.path.join(os.path.dirname(__file__), 'missing.xlsx')
+        excel_processor = OpenAIExcelProcessor(file_path=missing)
+        planning_processor = ProductionPlanningProcessor(missing)
+    excel_processor.dataframes = {name: df.copy() for name, df in sheets.items()}
+    excel_processor.dataset_version = 'synthetic'
+    planning_processor.cached_data.update({name: df.copy() for name, df in sheets.items()})
+    toolbox = PlanningToolbox(planning_processor)
+    toolbox.get_aggregates()
+
+    simulated = SimulatedModel(args.base_ms, args.prefill_ms, args.decode_ms)
+    if args.live:
+        from functools import partial
+        from app.services.openaiClient import create_chat_completion
+        create_completion = partial(create_chat_completion, 'chat_tools')
+    else:
+        create_completion = simulated.create
+
+    logger.info(f"Tool definitions: ~{estimate_tokens(dumps_json(TOOL_DEFINITIONS))} tokens per call")
+
+    totals = {'context': [0, 0, 0.0], 'tools': [0, 0, 0.0]}
+    for query, expected_calls in build_query_set(sheets):
+        simulated.expected_calls = expected_calls
+        results = {}
+        for mode, run in (('context', lambda: run_context_stuffing(excel_processor, query, create_completion)),
+                          ('tools', lambda: run_tool_calling(toolbox, query, create_completion))):
+            simulated.elapsed_ms = 0.0
+            started = time.perf_counter()
+            prompt_tokens, completion_tokens, rounds, _ = run()
+            latency_ms = (time.perf_counter() - started) * 1000 + simulated.elapsed_ms
+            results[mode] = (prompt_tokens, completion_tokens, rounds, latency_ms)
+            totals[mode][0] += prompt_tokens
+            totals[mode][1] += completion_tokens
+            totals[mode][2] += latency_ms
+
+        logger.info(f"{query[:45]:45s} | context: {results['context'][0]:5d} in / {results['context'][1]:4d} out, "
+                    f"{results['context'][3]:7.0f} ms | tools: {results['tools'][0]:5d} in / "
+                    f"{results['tools'][1]:4d} out, {results['tools'][2]} rounds, {results['tools'][3]:7.0f} ms")
+
+    count = len(build_query_set(sheets))
+    for mode, (prompt_tokens, completion_tokens, latency_ms) in totals.items():
+        logger.info(f"{mode:8s} mean: {prompt_tokens / count:7.0f} prompt tokens, "
+                    f"{completion_tokens / count:5.0f} completion tokens, {latency_ms / count:7.0f} ms end-to-end")
+
+
+if __name__ == "__main__":
+    main()
@@ -24,6 +24,42 @@ def drop_db():
         click.echo("Database tables dropped!")
 
 
+@cli.command("train_router")
+@click.option("--holdout", default=0.2, show_default=True, help="Share of questions kept out of training for the report.")
+@click.option("--history/--no-history", default=True, show_default=True,
+              help="Also train on the stored user messages, labelled by replaying them through the planning processor.")
+@click.option("--output", default=None, help="Where to store the router (default: ROUTER_MODEL_PATH).")
+def train_router(holdout, history, output):
+    """Train the query router that sends questions to the planning processor, the LLM or both."""
+    from app.config import get_setting
+    from app.services.queryRouter import collect_training_data, train_router as train
+    from app.services.openaiServices import production_processor, planning_keyword_count
+
+    processor = None
+    if history:
+        if os.path.exists(production_processor.file_path):
+            processor = production_processor
+        else:
+            click.echo(f"Planning workbook {production_processor.file_path} not found, training on the seed questions only")
+
+    texts, labels = collect_training_data(processor, history=processor is not None)
+    click.echo(f"Training on {len(texts)} questions: " +
+               ", ".join(f"{label} {labels.count(label)}" for label in sorted(set(labels))))
+
+    router, report = train(texts, labels, planning_keyword_count, holdout=holdout)
+    click.echo(f"Evaluated on {report['questions']} questions (trained on {report['trained_on']}):")
+    click.echo(f"  routing accuracy: router {report['router_accuracy']:.1%}, keywords {report['keyword_accuracy']:.1%}")
+    click.echo(f"  fallbacks to the LLM: router {report['router_fallbacks']}, keywords {report['keyword_fallbacks']}")
+    click.echo(f"  avoided fallbacks: {report['avoided_fallbacks']}, "
+               f"processor answers lost to the LLM: {report['lost_planning_answers']}")
+    click.echo(f"  routes: " + ", ".join(f"{route} {count}" for route, count in report['routes'].items()))
+    click.echo(f"  routing time: {report['route_microseconds']} us per question")
+
+    path = output or get_setting('ROUTER_MODEL_PATH')
+    router.save(path)
+    click.echo(f"Router saved to {path}; restart the app to use it")
+
+
 # @cli.command("seed_db")
 # def seed_db():
 #     """Seed the database with initial data."""
@@ -0,0 +1,8 @@
+import pytest
+from app.services.excelServices import ProductionPlanningProcessor
+
+
+@pytest.fixture(scope='session')
+def processor(tmp_path_factory):
+    """A processor without a workbook: intent detection and parameter extraction only."""
+    return ProductionPlanningProcessor(file_path=str(tmp_path_factory.mktemp('data') / 'missing.xlsx'))
@@ -0,0 +1,56 @@
+import threading
+import time
+import pytest
+from app.services.aiScheduler import AIScheduler, AISchedulerBusy, ai_priority, call_priority
+
+
+def test_call_priority_follows_the_enclosing_block():
+    assert call_priority('transcription') == 'voice'
+    assert call_priority('chat') == 'chat'
+    with ai_priority('background'):
+        assert call_priority('transcription') == 'background'
+
+
+def test_rejects_a_call_not_admitted_before_its_deadline():
+    scheduler = AIScheduler(max_concurrent=1)
+    scheduler.acquire('chat', timeout=1)
+    with pytest.raises(AISchedulerBusy):
+        scheduler.acquire('chat', timeout=0.01)
+    scheduler.release()
+    scheduler.acquire('chat', timeout=0.01)
+
+
+def test_rejects_at_once_when_the_queue_is_full():
+    scheduler = AIScheduler(max_concurrent=1, max_queue=1)
+    scheduler.acquire('voice', timeout=1)
+    waiting = threading.Thread(target=lambda: pytest.raises(AISchedulerBusy, scheduler.acquire, 'voice', 0.5))
+    waiting.start()
+    time.sleep(0.05)
+
+    started = time.monotonic()
+    with pytest.raises(AISchedulerBusy):
+        scheduler.acquire('voice', timeout=5)
+    assert time.monotonic() - started < 1
+    waiting.join(5)
+
+
+def test_admits_waiting_calls_by_priority():
+    scheduler = AIScheduler(max_concurrent=1)
+    scheduler.acquire('chat', timeout=1)
+    admitted = []
+
+    def call(priority):
+        scheduler.acquire(priority, timeout=5)
+        admitted.append(priority)
+        scheduler.release()
+
+    threads = []
+    for priority in ('background', 'chat', 'voice'):
+        threads.append(threading.Thread(target=call, args=(priority,)))
+        threads[-1].start()
+        time.sleep(0.05)
+
+    scheduler.release()
+    for thread in threads:
+        thread.join(5)
+    assert admitted == ['voice', 'chat', 'background']
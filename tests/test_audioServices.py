@@ -0,0 +1,55 @@
+import io
+import pytest
+from flask import Flask
+from pydub import AudioSegment
+from pydub.generators import Sine
+from app.services.audioServices import merge_transcripts, split_at_silence, prepare_whisper_upload, NoSpeechDetected
+
+
+def test_merge_drops_the_words_an_overlap_repeats():
+    texts = ['поръчка за клиент Lebek', 'клиент lebek, модел 7114']
+    assert merge_transcripts(texts) == 'поръчка за клиент Lebek модел 7114'
+
+
+def test_merge_keeps_repeated_words_of_chunks_cut_in_a_pause():
+    texts = ['да да', 'да не', '']
+    assert merge_transcripts(texts, overlapped=[False, False, False]) == 'да да да не'
+
+
+def test_split_cuts_in_the_pause():
+    tone = Sine(440).to_audio_segment(duration=900, volume=-10)
+    audio = tone + AudioSegment.silent(duration=200) + tone + tone
+    spans = split_at_silence(audio, chunk_ms=1000, overlap_ms=300)
+
+    assert spans[0][0] == 0 and spans[-1][1] == len(audio)
+    assert 900 <= spans[0][1] <= 1100
+    # Cut in silence: the chunks meet instead of overlapping
+    assert spans[1][0] == spans[0][1]
+
+
+def test_split_leaves_a_short_recording_whole():
+    audio = AudioSegment.silent(duration=1000)
+    assert split_at_silence(audio, chunk_ms=1000, overlap_ms=300) == [(0, 1000)]
+
+
+def _silent_wav():
+    output = io.BytesIO()
+    AudioSegment.silent(duration=1000, frame_rate=16000).export(output, format='wav')
+    return output.getvalue()
+
+
+def test_short_accepted_uploads_skip_the_decode():
+    audioData = _silent_wav()
+    app = Flask(__name__)
+
+    app.config['AUDIO_DECODE_MIN_BYTES'] = 0
+    with app.app_context(), pytest.raises(NoSpeechDetected):
+        prepare_whisper_upload(audioData, 'wav')
+
+    # By default a recording this short is sent as it is
+    del app.config['AUDIO_DECODE_MIN_BYTES']
+    with app.app_context():
+        uploads, info = prepare_whisper_upload(audioData, 'wav')
+    assert uploads == [('audio.wav', audioData)]
+    assert not info['converted']
+    assert 'duration_ms' not in info
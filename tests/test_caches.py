@@ -0,0 +1,22 @@
+import time
+from app.services.caches import TTLCache
+
+
+def test_evicts_the_least_recently_used_entry():
+    cache = TTLCache('test', maxsize=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1 and cache.get('c') == 3
+    assert len(cache) == 2
+
+
+def test_entries_expire():
+    cache = TTLCache('test', ttl=60)
+    cache.set('short', 1, ttl=0.01)
+    cache.set('long', 2)
+    time.sleep(0.02)
+    assert cache.get('short', 'missing') == 'missing'
+    assert cache.items() == [('long', 2)]
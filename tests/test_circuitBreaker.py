@@ -0,0 +1,57 @@
+import pytest
+from app.services.circuitBreaker import CircuitBreaker, CircuitOpen, CLOSED, HALF_OPEN, OPEN
+
+
+def _fail(breaker, times=1):
+    for _ in range(times):
+        breaker.record(breaker.before_call(), success=False)
+
+
+def test_opens_at_the_failure_rate_once_the_window_holds_min_calls():
+    breaker = CircuitBreaker('test', window=4, min_calls=4, failure_rate=0.5, open_seconds=60)
+    breaker.record(breaker.before_call(), success=True)
+    breaker.record(breaker.before_call(), success=True)
+    _fail(breaker)
+    assert breaker.state == CLOSED
+
+    _fail(breaker)
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpen):
+        breaker.before_call()
+
+
+def test_slow_calls_count_as_failures_and_unknown_outcomes_are_ignored():
+    breaker = CircuitBreaker('test', window=2, min_calls=2, failure_rate=1.0, slow_call=1.0, open_seconds=60)
+    breaker.record(breaker.before_call(), success=None)
+    breaker.record(breaker.before_call(), success=True, elapsed=2.0)
+    assert breaker.state == CLOSED
+    breaker.record(breaker.before_call(), success=True, elapsed=5.0)
+    assert breaker.state == OPEN
+
+
+def test_half_open_probes_close_the_circuit():
+    breaker = CircuitBreaker('test', window=2, min_calls=2, open_seconds=0, half_open_probes=2)
+    _fail(breaker, 2)
+    assert breaker.state == HALF_OPEN
+
+    first = breaker.before_call()
+    second = breaker.before_call()
+    assert first and second
+    with pytest.raises(CircuitOpen):
+        breaker.before_call()
+
+    breaker.record(first, success=True)
+    assert breaker.state == HALF_OPEN
+    breaker.record(second, success=True)
+    assert breaker.state == CLOSED
+    assert breaker.before_call() is False
+
+
+def test_a_failed_probe_opens_the_circuit_again():
+    breaker = CircuitBreaker('test', window=2, min_calls=2, open_seconds=0)
+    _fail(breaker, 2)
+    probe = breaker.before_call()
+    breaker.open_seconds = 60
+    breaker.record(probe, success=False)
+    assert breaker.state == OPEN
+    assert not breaker.allows_calls()
@@ -0,0 +1,19 @@
+import numpy as np
+import pandas as pd
+from app.services.excelContext import frame_to_records
+from app.services.openAiExcelProcessor import OpenAIExcelProcessor
+
+
+def test_frame_to_records_matches_the_per_cell_conversion():
+    df = pd.DataFrame({
+        'Фирма': ['Lebek', None, 'Matinique'],
+        'Поръчка': [100, 200, 300],
+        'Остатък': [1.5, np.nan, 3.0],
+        'Дата': pd.to_datetime(['2025-02-01', '2025-03-01', '2025-04-01']),
+        'Смесена': ['7114', pd.Timestamp('2025-01-01'), np.int64(5)],
+        pd.Timestamp('2025-05-01'): [1, 2, 3],
+    })
+    processor = object.__new__(OpenAIExcelProcessor)
+    expected = processor._json_serializable(df.to_dict(orient='records'))
+
+    assert frame_to_records(df) == expected
@@ -0,0 +1,18 @@
+import os
+from app.services.excelServices import ProductionPlanningProcessor
+
+
+def test_refresh_if_changed_drops_the_sheets_of_an_edited_file(tmp_path):
+    path = tmp_path / 'plan.xlsx'
+    path.write_bytes(b'first')
+    processor = ProductionPlanningProcessor(file_path=str(path))
+
+    version = processor.refresh_if_changed()
+    processor.cached_data['pletene'] = 'sheet'
+    assert processor.refresh_if_changed() == version
+    assert 'pletene' in processor.cached_data
+
+    path.write_bytes(b'second version')
+    os.utime(path, ns=(0, 0))
+    assert processor.refresh_if_changed() != version
+    assert processor.cached_data == {}
@@ -0,0 +1,40 @@
+from app.services.followUps import extract_models, resolve_follow_up
+
+CLIENT_STATE = ('client', {'client': 'lebek'})
+
+
+def test_marked_month_follow_up_keeps_client(processor):
+    intent, params = resolve_follow_up(processor, 'а за февруари?', CLIENT_STATE)
+    assert intent == 'client'
+    assert params['client'] == 'lebek'
+    assert params['month'] == 2
+
+
+def test_model_follow_up(processor):
+    intent, params = resolve_follow_up(processor, 'а модел 7114?', CLIENT_STATE)
+    assert (intent, params['client'], params['specific_products']) == ('client', 'lebek', ['7114'])
+
+
+def test_unmarked_bare_month_is_a_follow_up(processor):
+    assert resolve_follow_up(processor, 'февруари?', CLIENT_STATE)[1]['month'] == 2
+
+
+def test_question_with_another_intent_is_not_a_follow_up(processor):
+    assert resolve_follow_up(processor, 'Планиране за месец април', CLIENT_STATE) is None
+
+
+def test_summary_question_is_not_pinned_to_the_client(processor):
+    assert resolve_follow_up(processor, 'Справка за днес', CLIENT_STATE) is None
+
+
+def test_question_naming_a_client_is_not_a_follow_up(processor):
+    assert resolve_follow_up(processor, 'а клиент zerbi?', CLIENT_STATE) is None
+
+
+def test_no_state_no_follow_up(processor):
+    assert resolve_follow_up(processor, 'а за февруари?', None) is None
+
+
+def test_extract_models():
+    assert extract_models('а модели 7114, 71-20 и 7130.') == ['7114', '7120', '7130']
+    assert extract_models('модел abc') == []
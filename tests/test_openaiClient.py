@@ -0,0 +1,35 @@
+import httpx
+import openai
+from app.services.openaiClient import call_with_retries
+
+CHUNK = ('data: {"id": "1", "object": "chat.completion.chunk", "created": 0, "model": "gpt-4o-mini", '
+         '"choices": [{"index": 0, "delta": {"content": "Здравей"}, "finish_reason": null}]}\n\n')
+
+
+class _Body(httpx.SyncByteStream):
+    def __init__(self):
+        self.closed = False
+
+    def __iter__(self):
+        # Never ends on its own, like a long generation
+        while True:
+            yield CHUNK.encode('utf-8')
+
+    def close(self):
+        self.closed = True
+
+
+def test_closing_a_streamed_completion_closes_the_response():
+    body = _Body()
+    transport = httpx.MockTransport(lambda request: httpx.Response(
+        200, headers={'content-type': 'text/event-stream'}, stream=body))
+    client = openai.OpenAI(api_key='test', max_retries=0, http_client=httpx.Client(transport=transport))
+
+    stream = call_with_retries('chat_stream', client.chat.completions.create, model='gpt-4o-mini',
+                               messages=[{'role': 'user', 'content': 'Здравей'}], stream=True)
+    assert next(stream).choices[0].delta.content == 'Здравей'
+    assert not body.closed
+
+    stream.close()
+    assert body.closed
+    stream.close()
@@ -0,0 +1,42 @@
+import threading
+from app.services.openaiServices import answer_flights, _join_answer
+
+
+def _race(monkeypatch, key, leaderResult):
+    """Lead a flight for `key`, let a follower join it, then finish it with `leaderResult`."""
+    joined = threading.Event()
+    begin = answer_flights.begin
+
+    def tracked_begin(flightKey):
+        future, leader = begin(flightKey)
+        if not leader:
+            joined.set()
+        return future, leader
+
+    future, answer = _join_answer(key)
+    assert answer is None
+    monkeypatch.setattr(answer_flights, 'begin', tracked_begin)
+
+    results = []
+
+    def follow():
+        followerFuture, shared = _join_answer(key)
+        if followerFuture is not None:
+            # The follower asked again and leads the next flight
+            answer_flights.finish(key, followerFuture, result='нов LLM отговор')
+        results.append((followerFuture is not None, shared))
+
+    follower = threading.Thread(target=follow)
+    follower.start()
+    assert joined.wait(5)
+    answer_flights.finish(key, future, result=leaderResult)
+    follower.join(5)
+    return results[0]
+
+
+def test_followers_do_not_take_a_processor_answer(monkeypatch):
+    assert _race(monkeypatch, 'въпрос', None) == (True, None)
+
+
+def test_followers_share_an_llm_answer(monkeypatch):
+    assert _race(monkeypatch, 'друг въпрос', 'LLM отговор') == (False, 'LLM отговор')
@@ -0,0 +1,46 @@
+from types import SimpleNamespace
+from app.services.planningTools import PlanningToolbox, run_tool_conversation
+
+
+class _Toolbox(PlanningToolbox):
+    def __init__(self):
+        super().__init__(processor=None)
+        self._aggregates = {
+            'factories': {'Цех 1': {'цех': 'Цех 1', 'по месеци': {'декември': 5}}},
+            'clients': {'Lebek': {}, 'Zerbi': {}},
+            'months': {3: {'месец': 'март', 'плетене': 7, 'конфекция': 0, 'клиенти': {'Lebek': {'плетене': 7}}}},
+        }
+
+    def get_aggregates(self):
+        return self._aggregates
+
+
+def test_factory_load_rejects_a_month_outside_the_year():
+    toolbox = _Toolbox()
+    assert 'error' in toolbox.get_factory_load(month=0)
+    assert 'error' in toolbox.get_factory_load(month=13)
+    assert toolbox.get_factory_load(month=12)['цехове'][0]['декември'] == 5
+
+
+def test_monthly_plan_reports_an_unknown_client():
+    toolbox = _Toolbox()
+    assert toolbox.get_monthly_plan(3, 'Lebek')['плетене'] == 7
+    assert toolbox.get_monthly_plan(3, 'Zerbi') == {'месец': 'март', 'клиент': 'Zerbi', 'плетене': 0, 'конфекция': 0}
+    assert toolbox.get_monthly_plan(3, 'Olymp')['error'] == "Няма клиент 'Olymp'"
+
+
+def _completion(tool_calls, content=None):
+    message = SimpleNamespace(content=content, tool_calls=tool_calls)
+    return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+
+def test_tool_conversation_leaves_the_callers_messages_alone():
+    call = SimpleNamespace(id='1', function=SimpleNamespace(name='get_factory_load', arguments='{"month": 12}'))
+    responses = iter([_completion([call]), _completion(None, 'Отговор')])
+    messages = [{'role': 'user', 'content': 'Натоварване през декември?'}]
+
+    text, usage = run_tool_conversation(messages, _Toolbox(), lambda **kwargs: next(responses))
+
+    assert text == 'Отговор'
+    assert usage['tool_calls'] == 1
+    assert len(messages) == 1
@@ -0,0 +1,40 @@
+from flask import Flask
+from app.services.queryPlanner import plan_query, lists_items
+
+
+class _Processor:
+    def __init__(self, processor):
+        self.month_mappings = processor.month_mappings
+
+    def get_client_list(self):
+        return ['Lebek', 'Matinique', 'Olymp']
+
+
+def test_splits_per_client_and_month(processor):
+    subQueries = plan_query(_Processor(processor), 'покажи ми за lebek и matinique моделите за февруари и март')
+    assert [label for label, _, _ in subQueries] == ['Lebek, февруари', 'Lebek, март',
+                                                      'Matinique, февруари', 'Matinique, март']
+    assert all(intent == 'client' for _, intent, _ in subQueries)
+    assert subQueries[1][2]['month'] == 3
+
+
+def test_months_alone_become_planning_queries(processor):
+    subQueries = plan_query(_Processor(processor), 'планиране за март и април')
+    assert [(intent, params['month']) for _, intent, params in subQueries] == [('planning', 3), ('planning', 4)]
+
+
+def test_model_numbers_apply_to_every_client(processor):
+    subQueries = plan_query(_Processor(processor), 'Lebek, Olymp модел 7114')
+    assert [params['specific_products'] for _, _, params in subQueries] == [['7114'], ['7114']]
+
+
+def test_single_questions_are_not_split(processor):
+    assert not lists_items('Справка за Lebek за март')
+    assert plan_query(_Processor(processor), 'Справка за Lebek за март') is None
+    assert plan_query(_Processor(processor), 'Lebek и модел 7114') is None
+
+
+def test_limit(processor):
+    with Flask(__name__).app_context():
+        subQueries = plan_query(_Processor(processor), 'lebek, matinique и olymp за март', limit=2)
+    assert len(subQueries) == 2
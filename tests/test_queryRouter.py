@@ -0,0 +1,41 @@
+import numpy as np
+from app.services.queryRouter import FEATURE_DIMENSIONS, QueryRouter, evaluate, keyword_route
+
+
+class _Always(QueryRouter):
+    def __init__(self, route):
+        super().__init__(np.zeros(FEATURE_DIMENSIONS))
+        self._route = route
+
+    def route(self, text):
+        return self._route
+
+
+def test_always_both_router_is_not_always_right():
+    texts = ['a', 'b', 'c']
+    report = evaluate(_Always('both'), texts, ['planning', 'llm', 'both'], [2, 0, 1])
+    assert report['router_accuracy'] == round(1 / 3, 4)
+    assert report['routes']['both'] == 3
+
+
+def test_avoided_fallbacks():
+    report = evaluate(_Always('llm'), ['a', 'b'], ['llm', 'planning'], [1, 2])
+    assert report['avoided_fallbacks'] == 1
+    assert report['lost_planning_answers'] == 1
+    assert report['keyword_fallbacks'] == 1
+    assert report['router_fallbacks'] == 0
+
+
+def test_trained_router_separates_the_seed_classes():
+    texts = ['информация за клиент lebek', 'справка за клиент zerbi', 'колко е изплетено за клиент matinique',
+             'здравей как си', 'благодаря много', 'кой си ти']
+    labels = ['planning'] * 3 + ['llm'] * 3
+    router = QueryRouter.train(texts, labels, epochs=500, learning_rate=5.0)
+    assert router.route('покажи клиент robert') == 'planning'
+    assert router.route('здравей') == 'llm'
+
+
+def test_keyword_rule_sends_any_keyword_to_the_processor():
+    assert keyword_route(0) == 'llm'
+    assert keyword_route(1) == 'planning'
+    assert keyword_route(3) == 'planning'
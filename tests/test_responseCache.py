@@ -0,0 +1,54 @@
+from app.services.responseCache import CachedQuestion, ResponseCache, normalize_question
+
+
+def _question(text, entities=None):
+    return CachedQuestion(text, 'v1', 'plain', entities)
+
+
+def test_wording_and_punctuation_do_not_change_the_key():
+    assert _question('Кои поръчки са готови?').key == _question('кои поръчки са готови').key
+
+
+def test_negated_question_does_not_hit_the_affirmative_answer():
+    cache = ResponseCache(maxsize=8, ttl=60, similarity=0.9)
+    cache.set(_question('Кои поръчки са готови?'), 'готови')
+    assert cache.get(_question('Кои поръчки не са готови?')) is None
+    assert cache.get(_question('Кои поръчки са готови')) == 'готови'
+
+
+def test_negated_question_exact_key_differs():
+    assert _question('Кои поръчки не са готови?').key != _question('Кои поръчки са готови?').key
+
+
+def test_range_prepositions_are_kept():
+    text, _ = normalize_question('Колко е изплетено от март до май?')
+    assert text.split()[-4:] == ['от', 'март', 'до', 'май']
+
+
+def test_entities_are_part_of_the_key():
+    lebek = _question('Колко е изплетено?', {'client': 'Lebek'})
+    zerbi = _question('Колко е изплетено?', {'client': 'Zerbi'})
+    assert lebek.key != zerbi.key
+
+
+def test_similar_question_hits():
+    cache = ResponseCache(maxsize=8, ttl=60, similarity=0.8)
+    cache.set(_question('Покажи всички поръчки за плетене'), 'отговор')
+    assert cache.get(_question('Покажете всички поръчки за плетене')) == 'отговор'
+
+
+def test_questions_with_other_numbers_do_not_hit():
+    cache = ResponseCache(maxsize=8, ttl=60, similarity=0.9)
+    cache.set(_question('Колко поръчки са над 100 броя?'), 'над 100')
+    assert cache.get(_question('Колко поръчки са над 1000 броя?')) is None
+    assert cache.get(_question('Колко поръчки са над 100 броя')) == 'над 100'
+
+
+def test_a_similar_hit_is_not_also_counted_as_a_miss(monkeypatch):
+    counted = []
+    monkeypatch.setattr('app.services.caches.metrics.inc',
+                        lambda name, value=1, labels=None: counted.append((name, labels)))
+    cache = ResponseCache(maxsize=8, ttl=60, similarity=0.8)
+    cache.set(_question('Покажи всички поръчки за плетене'), 'отговор')
+    assert cache.get(_question('Покажете всички поръчки за плетене')) == 'отговор'
+    assert ('cache_misses', {'cache': 'llm_response'}) not in counted
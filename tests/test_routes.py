@@ -0,0 +1,45 @@
+import io
+import pytest
+from app import createApp
+from app.config import TestingConfig
+from app.blueprints.routes import NO_SPEECH_RESPONSE
+from app.services.audioPool import AudioJobTimeout
+from app.services.openaiServices import _transcribe_recording
+
+
+class _Config(TestingConfig):
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    SQLALCHEMY_ENGINE_OPTIONS = {}
+
+
+@pytest.fixture(scope='module')
+def client():
+    return createApp(_Config).test_client()
+
+
+@pytest.mark.parametrize('path', ['/transcribe/stream', '/transcribe'])
+def test_too_small_recordings_get_the_no_speech_answer(client, path):
+    response = client.post(path, data={'audio': (io.BytesIO(b'\x1a\x45'), 'audio.webm', 'audio/webm')})
+    assert response.status_code == 200
+    assert response.get_json()['response'] == NO_SPEECH_RESPONSE['response']
+
+
+@pytest.mark.parametrize('path, stage', [('/transcribe', 'run_voice_pipeline'),
+                                         ('/transcribe/stream', 'prepare_voice_request')])
+def test_audio_job_timeouts_ask_the_client_to_retry(client, monkeypatch, path, stage):
+    def timeout(*args, **kwargs):
+        raise AudioJobTimeout('prepare_whisper_upload did not finish within 30 s')
+
+    monkeypatch.setattr(f'app.blueprints.routes.{stage}', timeout)
+    response = client.post(path, data={'audio': (io.BytesIO(b'\x1a\x45' * 100), 'audio.webm', 'audio/webm')})
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+
+
+def test_transcription_passes_audio_job_timeouts_on(monkeypatch):
+    def timeout(*args):
+        raise AudioJobTimeout('prepare_whisper_upload did not finish within 30 s')
+
+    monkeypatch.setattr('app.services.openaiServices.run_audio_job', timeout)
+    with createApp(_Config).app_context(), pytest.raises(AudioJobTimeout):
+        _transcribe_recording(b'\x1a\x45' * 100, 'webm', 'key')
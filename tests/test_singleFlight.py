@@ -0,0 +1,52 @@
+import threading
+import pytest
+from app.services.singleFlight import SingleFlight, request_key
+
+
+def test_request_key_ignores_dict_order():
+    assert request_key('whisper-1', {'a': 1, 'b': 2}) == request_key('whisper-1', {'b': 2, 'a': 1})
+    assert request_key('whisper-1', {'a': 1}) != request_key('whisper-1', {'a': 2})
+
+
+def test_concurrent_identical_calls_run_once():
+    flight = SingleFlight('test')
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def work():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return 'result'
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.run('key', work)))
+    leader.start()
+    started.wait(5)
+
+    # The leader is running: the next callers join its call
+    future, is_leader = flight.begin('key')
+    assert not is_leader
+    followers = [threading.Thread(target=lambda: results.append(flight.run('key', work))) for _ in range(3)]
+    for thread in followers:
+        thread.start()
+
+    release.set()
+    for thread in [leader] + followers:
+        thread.join(5)
+    assert future.result(5) == 'result'
+    assert results == ['result'] * 4
+    assert calls == [1]
+
+
+def test_followers_get_the_leaders_exception_and_the_next_call_runs_again():
+    flight = SingleFlight('test')
+    future, leader = flight.begin('key')
+    follower, is_leader = flight.begin('key')
+    assert leader and not is_leader
+
+    flight.finish('key', future, error=ValueError('boom'))
+    with pytest.raises(ValueError):
+        follower.result()
+    assert flight.run('key', lambda: 'again') == 'again'
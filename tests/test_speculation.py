@@ -0,0 +1,79 @@
+import threading
+from concurrent.futures import Future
+from flask import Flask
+from app.services.speculation import first_answer, race_first_item, BackgroundStream
+
+
+def _done(result=None, error=None):
+    future = Future()
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+    return future
+
+
+class _Stream:
+    def __init__(self, has_item):
+        self.first = _done(has_item)
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def test_first_answer_prefers_the_processor():
+    assert first_answer(_done('processor'), _done('llm')) == ('processor', 'processor')
+
+
+def test_first_answer_takes_the_llm_when_the_processor_cannot_answer():
+    assert first_answer(_done(None), _done('llm')) == ('llm', 'llm')
+    assert first_answer(_done(error=ValueError('boom')), _done('llm')) == ('llm', 'llm')
+
+
+def test_race_returns_the_processor_answer_and_closes_the_stream():
+    stream = _Stream(has_item=True)
+    assert race_first_item(_done('processor'), stream) == 'processor'
+    assert stream.closed
+
+
+def test_race_reads_the_stream_when_the_processor_failed():
+    stream = _Stream(has_item=True)
+    assert race_first_item(_done(error=ValueError('boom')), stream) is None
+    assert not stream.closed
+
+
+def test_race_waits_for_the_processor_when_the_stream_is_empty():
+    stream = _Stream(has_item=False)
+    processor = Future()
+    processor.set_running_or_notify_cancel()
+    processor.set_result('processor')
+    assert race_first_item(processor, stream) == 'processor'
+
+
+class _Upstream:
+    def __init__(self):
+        self.closed = threading.Event()
+
+    def __iter__(self):
+        yield 'първо'
+        # Blocks like a socket read until the stream is closed
+        self.closed.wait(5)
+
+    def close(self):
+        self.closed.set()
+
+
+def test_closing_a_background_stream_closes_its_upstream_at_once():
+    upstream = _Upstream()
+
+    def pieces(on_open):
+        on_open(upstream)
+        yield from upstream
+
+    with Flask(__name__).app_context():
+        stream = BackgroundStream(pieces)
+    assert stream.first.result(5)
+
+    stream.close()
+    assert upstream.closed.is_set()
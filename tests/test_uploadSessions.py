@@ -0,0 +1,36 @@
+import pytest
+from flask import Flask
+from app.services.uploadSessions import UploadSessionStore, UploadSessionLimit
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.config.update(MAX_CONTENT_LENGTH=10, UPLOAD_SESSION_MAX_BYTES=16)
+    with app.app_context():
+        yield app
+
+
+def test_sessions_share_a_byte_budget(app):
+    store = UploadSessionStore()
+    first = store.create('webm')
+    second = store.create('webm')
+    store.append(first.id, 0, b'x' * 10)
+    store.append(second.id, 0, b'x' * 6)
+
+    with pytest.raises(UploadSessionLimit):
+        store.append(second.id, 1, b'x')
+
+    # The rejected session is closed and its bytes released
+    third = store.create('webm')
+    assert store.append(third.id, 0, b'x' * 6) == 6
+    assert store.finish(first.id).audio_data() == b'x' * 10
+
+
+def test_a_retried_chunk_replaces_the_earlier_one(app):
+    store = UploadSessionStore()
+    session = store.create('webm')
+    store.append(session.id, 0, b'x' * 8)
+    assert store.append(session.id, 0, b'y' * 8) == 8
+    with pytest.raises(UploadSessionLimit):
+        store.append(session.id, 1, b'z' * 3)